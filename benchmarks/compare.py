@@ -0,0 +1,75 @@
+"""Compare two benchmark result files written by run.py
+
+    python benchmarks/compare.py baseline.json candidate.json [--threshold 10]
+
+Prints every timing present in both files, library by library, with the
+relative change; changes beyond the threshold (in percent) are marked.
+Latencies and seconds are better when lower, throughputs when higher.
+"""
+import argparse
+import json
+
+# Keys of the leaves worth comparing and whether a larger value is better
+METRICS = {
+    'p50_ms': False,
+    'p95_ms': False,
+    'mean_ms': False,
+    'seconds': False,
+    'per_second': True,
+    'files_per_second': True,
+    'database_bytes': False
+}
+
+def flatten(value, prefix=''):
+    """Yield (path, key, number) for every compared leaf of a results tree"""
+    if isinstance(value, dict):
+        for key, child in value.items():
+            path = f'{prefix}.{key}' if prefix else key
+            if key in METRICS and isinstance(child, (int, float)):
+                yield path, key, child
+            else:
+                yield from flatten(child, path)
+
+def compare(baseline, candidate, threshold):
+    lines = []
+    candidate_libraries = {library['images']: library for library in candidate['libraries']}
+    for old_library in baseline['libraries']:
+        new_library = candidate_libraries.get(old_library['images'])
+        if new_library is None:
+            continue
+        new_values = {path: number for path, key, number in flatten(new_library)}
+        lines.append(f"\n{old_library['images']} images")
+        for path, key, old in flatten(old_library):
+            new = new_values.get(path)
+            if new is None:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            better = change > 0 if METRICS[key] else change < 0
+            marker = ''
+            if abs(change) >= threshold:
+                marker = '  better' if better else '  WORSE'
+            lines.append(f'  {path:<60} {old:>12g} {new:>12g} {change:>+8.1f}%{marker}')
+    return lines
+
+def describe(results):
+    git = results.get('git') or {}
+    commit = (git.get('commit') or 'unknown')[:12]
+    return f"{commit}{' (dirty)' if git.get('dirty') else ''} at {results.get('started_at')}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0, help='percent change to mark (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as fp:
+        baseline = json.load(fp)
+    with open(args.candidate) as fp:
+        candidate = json.load(fp)
+    print(f'baseline:  {describe(baseline)}')
+    print(f'candidate: {describe(candidate)}')
+    print('\n'.join(compare(baseline, candidate, args.threshold)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+"""Benchmarks for the portfolio API, file serving and import paths
+
+    python benchmarks/run.py --sizes 1000 10000 100000 --output results.json
+    python benchmarks/compare.py baseline.json results.json
+
+For every size a synthetic library of generated JPEGs with camera EXIF
+(see synthetic_library.py) is written under a work directory, then a fresh
+interpreter points DATA_DIR, DATABASE_PATH and the caches into that
+directory, imports the app and measures:
+
+- import_images_from_data() into an empty database (cold), again with
+  nothing changed (warm) and as a full rescan
+- /api/portfolio at several page depths, with page numbers and with
+  keyset cursors, with the API response cache off and warm
+- /api/categories with the response cache off and warm
+- derivative rendering through /img/<width>/<path>, first request and
+  cached, and original files through /data/<path>
+
+Requests go through Flask's test client, so the numbers cover the app and
+not a network or WSGI server. Libraries are kept in --work-dir when one is
+given and reused by later runs; the database and derivative cache are
+always rebuilt. "Cold" imports start from an empty database, but the files
+themselves are usually still in the OS page cache.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+
+from synthetic_library import build_library, library_bytes
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, 'src')
+
+DEFAULT_SIZES = (1000, 10000)
+DEFAULT_DEPTHS = (1, 10, 100, 1000)
+DERIVATIVE_WIDTHS = (320, 1024)
+ACCEPT_HEADERS = {'jpeg': 'image/jpeg', 'webp': 'image/webp,image/*'}
+
+def summarize(samples):
+    """Latency statistics in milliseconds of a list of durations in seconds"""
+    ordered = sorted(samples)
+
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    total = sum(ordered)
+    return {
+        'runs': len(ordered),
+        'mean_ms': round(total / len(ordered) * 1000, 3),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'p50_ms': round(percentile(0.50), 3),
+        'p95_ms': round(percentile(0.95), 3),
+        'p99_ms': round(percentile(0.99), 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'per_second': round(len(ordered) / total, 1) if total else None
+    }
+
+def measure(call, repeat, warmup=1):
+    for _ in range(warmup):
+        call()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+def fetch(client, url, headers=None):
+    response = client.get(url, headers=headers)
+    try:
+        if response.status_code != 200:
+            raise RuntimeError(f'GET {url} returned {response.status_code}')
+        return response.get_json() if response.is_json else None
+    finally:
+        response.close()
+
+def benchmark_import(app, count):
+    from admin_tools import import_images_from_data
+
+    results = {}
+    for name, full in (('cold', False), ('warm', False), ('full_rescan', True)):
+        with app.app_context():
+            started = time.perf_counter()
+            result = import_images_from_data(full=full)
+            elapsed = time.perf_counter() - started
+        if not result['success']:
+            raise RuntimeError(f"{name} import failed: {result['error']}")
+        results[name] = {
+            'seconds': round(elapsed, 3),
+            'files_per_second': round(count / elapsed, 1),
+            'imported': result['imported'],
+            'failed': result['failed']
+        }
+    return results
+
+def spread_categories(app):
+    """Spread the imported images over the active categories, like a curated library"""
+    from api_cache import invalidate_api_cache
+    from models.portfolio import db, Category, PortfolioImage
+
+    with app.app_context():
+        category_ids = [category.id for category in Category.query.filter_by(is_active=True).order_by(Category.id)]
+        for offset, category_id in enumerate(category_ids):
+            PortfolioImage.query.filter(PortfolioImage.id % len(category_ids) == offset).update(
+                {'category_id': category_id}, synchronize_session=False
+            )
+        db.session.commit()
+        invalidate_api_cache()
+        return category_ids
+
+def benchmark_portfolio(app, client, depths, per_page, repeat):
+    """Latency of /api/portfolio pages at each depth, by page number and by cursor"""
+    first_page = fetch(client, f'/api/portfolio?per_page={per_page}')
+    total, pages = first_page['total'], first_page['pages']
+    depths = [depth for depth in depths if depth <= pages]
+
+    # Walk the cursor chain once to find the cursor that starts each measured page
+    cursors = {}
+    cursor, page = '', 1
+    while page <= max(depths):
+        if page in depths:
+            cursors[page] = cursor
+        cursor = fetch(client, f'/api/portfolio?per_page={per_page}&cursor={cursor}')['next_cursor']
+        page += 1
+
+    results = {'images': total, 'per_page': per_page, 'pages': {}}
+    for depth in depths:
+        urls = {
+            'page_number': f'/api/portfolio?per_page={per_page}&page={depth}',
+            'cursor': f'/api/portfolio?per_page={per_page}&cursor={cursors[depth]}'
+        }
+        results['pages'][str(depth)] = {
+            f'{mode}_{cache}': measure_cached(app, client, url, repeat, cache == 'cached')
+            for mode, url in urls.items()
+            for cache in ('uncached', 'cached')
+        }
+    return results
+
+def measure_cached(app, client, url, repeat, cached):
+    app.config['API_CACHE_ENABLED'] = cached
+    try:
+        return measure(lambda: fetch(client, url), repeat)
+    finally:
+        app.config['API_CACHE_ENABLED'] = True
+
+def benchmark_derivatives(app, client, samples):
+    """First (rendering) and repeated requests for resized copies of sample files"""
+    from models.portfolio import PortfolioImage
+
+    with app.app_context():
+        filenames = [image.filename for image in PortfolioImage.query.order_by(PortfolioImage.id)]
+    step = max(1, len(filenames) // samples)
+    filenames = filenames[::step][:samples]
+
+    results = {'files': len(filenames)}
+    for width in DERIVATIVE_WIDTHS:
+        for format_name, accept in ACCEPT_HEADERS.items():
+            headers = {'Accept': accept}
+            render, cached = [], []
+            for filename in filenames:
+                url = f'/img/{width}/{filename}'
+                for durations in (render, cached):
+                    started = time.perf_counter()
+                    fetch(client, url, headers)
+                    durations.append(time.perf_counter() - started)
+            results[f'{width}_{format_name}'] = {'render': summarize(render), 'cached': summarize(cached)}
+
+    originals = []
+    for filename in filenames:
+        started = time.perf_counter()
+        fetch(client, f'/data/{filename}')
+        originals.append(time.perf_counter() - started)
+    results['original'] = summarize(originals)
+    return results
+
+def benchmark_library(count, data_dir, work_dir, options):
+    """Run every benchmark against one library; runs in its own interpreter"""
+    os.environ.update({
+        'DATA_DIR': data_dir,
+        'DATABASE_PATH': os.path.join(work_dir, 'app.db'),
+        'CACHE_BACKEND_URL': 'memory://',
+        'DERIVATIVE_CACHE_DIR': os.path.join(work_dir, 'derivatives'),
+        'PREGENERATE_DERIVATIVES': '0',
+        'WATCH_DATA_DIR': '0',
+        'INSTRUMENTATION_ENABLED': '0'
+    })
+    sys.path.insert(0, SRC_DIR)
+    from main import app
+    from db_setup import database_file_size
+
+    client = app.test_client()
+    results = {'images': count, 'import': benchmark_import(app, count)}
+    results['categories'] = len(spread_categories(app))
+    results['api_portfolio'] = benchmark_portfolio(app, client, options['depths'], options['per_page'], options['repeat'])
+    results['api_categories'] = {
+        cache: measure_cached(app, client, '/api/categories', options['repeat'], cache == 'cached')
+        for cache in ('uncached', 'cached')
+    }
+    results['derivatives'] = benchmark_derivatives(app, client, options['derivative_samples'])
+    results['database_bytes'] = database_file_size(os.environ['DATABASE_PATH'])
+    return results
+
+def git_revision():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit, 'dirty': bool(dirty)}
+
+def environment():
+    import PIL
+    import sqlalchemy
+    import sqlite3
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'pillow': PIL.__version__,
+        'sqlalchemy': sqlalchemy.__version__,
+        'sqlite': sqlite3.sqlite_version
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='library sizes to benchmark (default: %(default)s)')
+    parser.add_argument('--output', help='JSON results file (default: benchmarks/results/<commit>-<time>.json)')
+    parser.add_argument('--work-dir', help='keep generated libraries here and reuse them on later runs')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic libraries')
+    parser.add_argument('--long-edge', type=int, default=800, help='long edge of the generated JPEGs in pixels')
+    parser.add_argument('--depths', type=int, nargs='+', default=list(DEFAULT_DEPTHS),
+                        help='/api/portfolio page depths (default: %(default)s)')
+    parser.add_argument('--per-page', type=int, default=12, help='/api/portfolio page size')
+    parser.add_argument('--repeat', type=int, default=200, help='requests per API measurement')
+    parser.add_argument('--derivative-samples', type=int, default=50, help='files rendered per derivative variant')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='fifth-element-bench-')
+    options = {
+        'depths': sorted(set(args.depths)),
+        'per_page': args.per_page,
+        'repeat': args.repeat,
+        'derivative_samples': args.derivative_samples,
+        'seed': args.seed,
+        'long_edge': args.long_edge
+    }
+    revision = git_revision()
+    report = {
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git': revision,
+        'environment': environment(),
+        'options': options,
+        'libraries': []
+    }
+
+    try:
+        for count in sorted(set(args.sizes)):
+            data_dir = os.path.join(work_dir, f'library-{count}-seed{args.seed}-{args.long_edge}px')
+            started = time.perf_counter()
+            written = build_library(data_dir, count, seed=args.seed, long_edge=args.long_edge)
+            print(f'{count} images: library ready ({written} written in {time.perf_counter() - started:.1f}s)', flush=True)
+
+            run_dir = os.path.join(work_dir, f'run-{count}')
+            shutil.rmtree(run_dir, ignore_errors=True)
+            os.makedirs(run_dir)
+            # A fresh interpreter per library, as the app reads its paths from the environment on import
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                results = pool.submit(benchmark_library, count, data_dir, run_dir, options).result()
+            results['library_bytes'] = library_bytes(data_dir)
+            report['libraries'].append(results)
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+            cold = results['import']['cold']
+            first_page = results['api_portfolio']['pages'].get('1', {}).get('cursor_uncached', {})
+            print(
+                f"{count} images: cold import {cold['files_per_second']} files/s, "
+                f"/api/portfolio p50 {first_page.get('p50_ms')} ms uncached",
+                flush=True
+            )
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report['finished_at'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    output = args.output or os.path.join(
+        ROOT_DIR, 'benchmarks', 'results',
+        f"{(revision['commit'] or 'unknown')[:12]}-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as fp:
+        json.dump(report, fp, indent=2)
+    print(f'Results written to {output}')
+
+if __name__ == '__main__':
+    main()
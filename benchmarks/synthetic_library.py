@@ -0,0 +1,150 @@
+"""Reproducible synthetic photo libraries for the benchmarks
+
+Every file is derived from its index and the seed alone, so two runs with
+the same arguments write byte-identical libraries and an existing library
+can be reused across runs.
+"""
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from PIL import Image, ImageDraw
+from PIL.TiffImagePlugin import IFDRational
+
+EXIF_IFD = 0x8769
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_ORIENTATION = 0x0112
+TAG_SOFTWARE = 0x0131
+TAG_DATETIME = 0x0132
+TAG_ARTIST = 0x013B
+TAG_EXPOSURE_TIME = 0x829A
+TAG_F_NUMBER = 0x829D
+TAG_EXPOSURE_PROGRAM = 0x8822
+TAG_ISO = 0x8827
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_DATETIME_DIGITIZED = 0x9004
+TAG_FLASH = 0x9209
+TAG_FOCAL_LENGTH = 0x920A
+TAG_MAKER_NOTE = 0x927C
+TAG_WHITE_BALANCE = 0xA403
+TAG_LENS_MODEL = 0xA434
+
+# (make, model, lenses as (name, min focal length, max focal length, widest aperture))
+CAMERAS = (
+    ('Canon', 'Canon EOS R5', (('RF24-70mm F2.8 L IS USM', 24, 70, 2.8), ('RF85mm F1.2 L USM', 85, 85, 1.2))),
+    ('SONY', 'ILCE-7M4', (('FE 24-105mm F4 G OSS', 24, 105, 4.0), ('FE 35mm F1.8', 35, 35, 1.8))),
+    ('NIKON CORPORATION', 'NIKON Z 6_2', (('NIKKOR Z 24-70mm f/4 S', 24, 70, 4.0), ('NIKKOR Z 50mm f/1.8 S', 50, 50, 1.8))),
+    ('FUJIFILM', 'X-T4', (('XF16-55mmF2.8 R LM WR', 16, 55, 2.8), ('XF56mmF1.2 R', 56, 56, 1.2))),
+)
+EXPOSURE_TIMES = (IFDRational(1, 4000), IFDRational(1, 1000), IFDRational(1, 250), IFDRational(1, 60), IFDRational(1, 8), IFDRational(2, 1))
+ISO_VALUES = (100, 200, 400, 800, 1600, 3200, 6400)
+F_STOPS = (1.2, 1.4, 1.8, 2.0, 2.8, 4.0, 5.6, 8.0, 11.0, 16.0)
+FIRST_SHOT = datetime(2016, 1, 1)
+# Exif IFD tags every generated file must carry, checked after a build
+REQUIRED_EXIF_TAGS = (TAG_EXPOSURE_TIME, TAG_F_NUMBER, TAG_ISO, TAG_FOCAL_LENGTH, TAG_LENS_MODEL, TAG_MAKER_NOTE)
+
+def library_path(index):
+    """Relative path of file index: year/month folders, like a camera import"""
+    taken = shot_time(index)
+    return os.path.join(f'{taken:%Y}', f'{taken:%m}', f'IMG_{index:06d}.jpg')
+
+def shot_time(index):
+    return FIRST_SHOT + timedelta(minutes=47 * index)
+
+def synthetic_exif(rng, index):
+    """Image.Exif with the tags a camera writes, including a MakerNote blob"""
+    make, model, lenses = rng.choice(CAMERAS)
+    lens, min_focal, max_focal, widest = rng.choice(lenses)
+    taken = f'{shot_time(index):%Y:%m:%d %H:%M:%S}'
+
+    exif = Image.Exif()
+    exif[TAG_MAKE] = make
+    exif[TAG_MODEL] = model
+    exif[TAG_SOFTWARE] = 'Synthetic Library 1.0'
+    exif[TAG_DATETIME] = taken
+    exif[TAG_ARTIST] = 'Fifth Element Photography'
+    # Orientation stays 1, so the stored dimensions are the displayed ones
+    exif[TAG_ORIENTATION] = 1
+
+    # Pillow only writes a sub-IFD that is assigned as a whole; edits through get_ifd() are dropped
+    exif[EXIF_IFD] = {
+        TAG_EXPOSURE_TIME: rng.choice(EXPOSURE_TIMES),
+        TAG_F_NUMBER: IFDRational(int(rng.choice([f for f in F_STOPS if f >= widest]) * 10), 10),
+        TAG_EXPOSURE_PROGRAM: rng.choice((1, 2, 3)),
+        TAG_ISO: rng.choice(ISO_VALUES),
+        TAG_DATETIME_ORIGINAL: taken,
+        TAG_DATETIME_DIGITIZED: taken,
+        TAG_FLASH: rng.choice((0, 16)),
+        TAG_FOCAL_LENGTH: IFDRational(rng.randint(min_focal, max_focal), 1),
+        TAG_WHITE_BALANCE: rng.choice((0, 1)),
+        TAG_LENS_MODEL: lens,
+        # Real maker notes are a few kilobytes of vendor data that imports have to skip
+        TAG_MAKER_NOTE: rng.randbytes(rng.randint(2048, 8192))
+    }
+    return exif
+
+def synthetic_image(rng, long_edge):
+    """Landscape or portrait frame of overlapping shapes on a two tone background"""
+    short_edge = long_edge * 2 // 3
+    size = (long_edge, short_edge) if rng.random() < 0.7 else (short_edge, long_edge)
+    top = tuple(rng.randrange(256) for _ in range(3))
+    bottom = tuple(rng.randrange(256) for _ in range(3))
+
+    img = Image.new('RGB', size, top)
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((0, size[1] // 2, size[0], size[1]), fill=bottom)
+    for _ in range(rng.randint(4, 12)):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        radius = rng.randint(long_edge // 40, long_edge // 4)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        shape = draw.ellipse if rng.random() < 0.5 else draw.rectangle
+        shape((x - radius, y - radius, x + radius, y + radius), fill=color)
+    return img
+
+def write_file(data_dir, index, seed, long_edge, quality):
+    rng = random.Random(f'{seed}:{index}')
+    path = os.path.join(data_dir, library_path(index))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.tmp'
+    synthetic_image(rng, long_edge).save(temp_path, 'JPEG', quality=quality, exif=synthetic_exif(rng, index))
+    os.replace(temp_path, path)
+
+def _write_range(args):
+    data_dir, start, stop, seed, long_edge, quality = args
+    written = 0
+    for index in range(start, stop):
+        if not os.path.exists(os.path.join(data_dir, library_path(index))):
+            write_file(data_dir, index, seed, long_edge, quality)
+            written += 1
+    return written
+
+def build_library(data_dir, count, seed=0, long_edge=800, quality=85, workers=None, chunk=250):
+    """Make sure data_dir holds files 0..count-1; returns how many had to be written
+
+    Files that already exist are kept, so a library built for a smaller
+    count is extended rather than rebuilt.
+    """
+    ranges = [
+        (data_dir, start, min(start + chunk, count), seed, long_edge, quality)
+        for start in range(0, count, chunk)
+    ]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        written = sum(pool.map(_write_range, ranges))
+    if count:
+        check_exif(os.path.join(data_dir, library_path(0)))
+    return written
+
+def check_exif(path):
+    """Fail if a generated file lost any of REQUIRED_EXIF_TAGS on the way to disk"""
+    with Image.open(path) as img:
+        exif_ifd = img.getexif().get_ifd(EXIF_IFD)
+    missing = [f'0x{tag:04X}' for tag in REQUIRED_EXIF_TAGS if tag not in exif_ifd]
+    assert not missing, f'{path} is missing Exif IFD tags {", ".join(missing)}'
+
+def library_bytes(data_dir):
+    total = 0
+    for root, dirs, files in os.walk(data_dir):
+        dirs[:] = [name for name in dirs if not name.startswith('.')]
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
@@ -137,7 +137,9 @@ function Portfolio() {
                     className="group relative overflow-hidden rounded-lg bg-gray-900 aspect-square cursor-pointer hover:scale-105 transition-transform duration-300"
                   >
                     <img
-                      src={image.web_path}
+                      src={image.derivatives?.[960] || image.web_path}
+                      srcSet={image.srcset || undefined}
+                      sizes="(min-width: 1280px) 25vw, (min-width: 1024px) 33vw, (min-width: 768px) 50vw, 100vw"
                       alt={image.alt_text || image.title || image.filename}
                       className="w-full h-full object-cover opacity-100"
                       loading="lazy"
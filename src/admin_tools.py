@@ -1,147 +1,808 @@
 import os
 import json
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from datetime import datetime
+from flask import current_app
 from PIL import Image
 from PIL.ExifTags import TAGS
-from models.portfolio import db, Category, PortfolioImage, FeaturedImage
+from sqlalchemy import case, func, or_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models.portfolio import db, Category, PortfolioImage, FeaturedImage, FileManifestEntry
+from api_cache import cached_snapshot, invalidate_api_cache
+from exif_fields import compact_exif, dump_exif, parse_exif_fields
+from search import adjust_facet_counts, deferred_facet_counts, refresh_statistics
+from duplicates import DEFAULT_MAX_DISTANCE, BKTree, find_duplicate, is_distinctive_hash, load_hash_tree, perceptual_hash
+from image_probe import displayed_size, exif_tags, probe_image
+from instrumentation import timed
+from placeholders import image_placeholders
 from werkzeug.utils import secure_filename
 
-def scan_data_directory():
-    """Scan /data directory for image files and return list of image info"""
-    data_dir = '/data'
-    if not os.path.exists(data_dir):
-        return []
-    
-    image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
-    images = []
-    
-    for root, dirs, files in os.walk(data_dir):
-        for file in files:
-            if any(file.lower().endswith(ext) for ext in image_extensions):
-                file_path = os.path.join(root, file)
-                relative_path = os.path.relpath(file_path, data_dir)
-                
-                # Get basic file info
+DATA_DIR = os.environ.get('DATA_DIR', '/data')
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
+SQL_IN_CHUNK = 500  # keeps IN (...) lists below SQLite's bound parameter limit
+MAX_REPORTED_FILES = 50
+EXTRACTION_QUEUE_FACTOR = 2  # results buffered per extraction worker
+
+def walk_image_files(data_dir=DATA_DIR):
+    """Yield (relative_path, file_path, stat) for every image file under data_dir
+    
+    Hidden directories such as the derivative cache in /data/.cache are skipped.
+    """
+    pending = [data_dir]
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(current) as entries:
+                entries = list(entries)
+        except OSError:
+            continue
+        
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith('.'):
+                        pending.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                    yield os.path.relpath(entry.path, data_dir), entry.path, entry.stat()
+            except OSError:
+                continue
+
+def file_signature(stat):
+    """Signature used to decide whether a file changed since the last scan"""
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+class DataDirectoryScan:
+    """Stream the new and changed image files under /data
+    
+    Iterating yields (relative_path, file_path, stat) for every file whose
+    signature differs from the file manifest, using stat calls only. Once
+    the iteration is finished, `deleted` holds the manifest paths that no
+    longer exist. With full=True every file is yielded.
+    """
+    
+    def __init__(self, full=False):
+        self.full = full
+        self.found = 0
+        self.unchanged = 0
+        self.deleted = []
+        self._manifest = {
+            path: (size, mtime_ns, inode)
+            for path, size, mtime_ns, inode in db.session.query(
+                FileManifestEntry.path, FileManifestEntry.size,
+                FileManifestEntry.mtime_ns, FileManifestEntry.inode
+            )
+        }
+    
+    def __iter__(self):
+        if os.path.exists(DATA_DIR):
+            for relative_path, file_path, stat in walk_image_files(DATA_DIR):
+                self.found += 1
+                previous = self._manifest.pop(relative_path, None)
+                if self.full or previous != file_signature(stat):
+                    yield relative_path, file_path, stat
+                else:
+                    self.unchanged += 1
+        
+        self.deleted = sorted(self._manifest)
+        self._manifest = {}
+
+class ChangedFilesScan:
+    """DataDirectoryScan over a known list of paths relative to /data
+    
+    Used by the directory watcher, which already knows which files changed:
+    only these paths are checked against the file manifest, and those that
+    no longer exist end up in `deleted`. Paths outside the image extensions
+    or inside hidden directories are ignored.
+    """
+    
+    def __init__(self, paths):
+        self.paths = sorted({
+            os.path.normpath(path) for path in paths
+            if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+            and not any(part.startswith('.') for part in os.path.normpath(path).split(os.sep))
+        })
+        self.found = 0
+        self.unchanged = 0
+        self.deleted = []
+        self._manifest = {}
+        for chunk in chunked(self.paths, SQL_IN_CHUNK):
+            self._manifest.update(
+                (path, (size, mtime_ns, inode))
+                for path, size, mtime_ns, inode in db.session.query(
+                    FileManifestEntry.path, FileManifestEntry.size,
+                    FileManifestEntry.mtime_ns, FileManifestEntry.inode
+                ).filter(FileManifestEntry.path.in_(chunk))
+            )
+    
+    def __iter__(self):
+        for relative_path in self.paths:
+            file_path = os.path.join(DATA_DIR, relative_path)
+            previous = self._manifest.pop(relative_path, None)
+            try:
                 stat = os.stat(file_path)
-                file_size = stat.st_size
-                created_at = datetime.fromtimestamp(stat.st_ctime)
-                
-                # Try to get image dimensions and EXIF
+            except OSError:
+                if previous is not None:
+                    self.deleted.append(relative_path)
+                continue
+            if not os.path.isfile(file_path):
+                continue
+            
+            self.found += 1
+            if previous != file_signature(stat):
+                yield relative_path, file_path, stat
+            else:
+                self.unchanged += 1
+
+def scan_data_directory(scan, workers=None, executor='thread', hash_images=True, placeholders=True):
+    """Read the files of a DataDirectoryScan and yield (img_info, error) pairs
+    
+    Files are opened by a pool of `workers` threads or processes. For files
+    that could not be read img_info only carries the filename and error is
+    the message.
+    """
+    for relative_path, stat, metadata, error in iter_image_metadata(
+        scan, workers=workers, executor=executor, hash_images=hash_images, placeholders=placeholders
+    ):
+        if error:
+            yield {'filename': relative_path}, error
+            continue
+        
+        yield {
+            'filename': relative_path,
+            'original_filename': os.path.basename(relative_path),
+            'file_size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'inode': stat.st_ino,
+            'width': metadata['width'],
+            'height': metadata['height'],
+            'created_at': datetime.fromtimestamp(stat.st_ctime),
+            'exif_data': metadata['exif_data'],
+            'exif_fields': metadata['exif_fields'],
+            'perceptual_hash': metadata['perceptual_hash'],
+            'blurhash': metadata['blurhash'],
+            'dominant_color': metadata['dominant_color'],
+            'web_path': f'/data/{relative_path}'
+        }, None
+
+def extract_image_metadata(file_path, hash_images=True, placeholders=True):
+    """Read dimensions and EXIF data of a single image file
+    
+    Dimensions and EXIF come from the file headers (see image_probe); only
+    the perceptual hash and the placeholders need the pixels, which are
+    decoded once at reduced scale for both. With hash_images and
+    placeholders off a file is read no further than its headers. Runs
+    inside the extraction pool, so it must stay a module level function
+    that only takes and returns picklable values.
+    """
+    with timed('probe'):
+        probe = probe_image(file_path)
+    # Stored the way the image is shown, so a portrait shot turned by EXIF counts as portrait
+    width, height = displayed_size(probe)
+    if not width or not height:
+        raise ValueError('image has no dimensions')
+    exif = exif_tags(probe['exif'])
+    
+    pixel_values = {'perceptual_hash': None, 'blurhash': None, 'dominant_color': None}
+    if hash_images or placeholders:
+        try:
+            with Image.open(file_path) as img:
+                if placeholders:
+                    with timed('placeholders'):
+                        pixel_values.update(image_placeholders(img))
+                if hash_images:
+                    with timed('perceptual_hash'):
+                        pixel_values['perceptual_hash'] = perceptual_hash(img)
+        except (OSError, SyntaxError, ValueError):
+            # Headers we can read but pixels PIL cannot decode; import without them
+            pass
+    
+    return {
+        'width': width,
+        'height': height,
+        'exif_data': compact_exif(exif),
+        'exif_fields': parse_exif_fields(exif),
+        **pixel_values
+    }
+
+def iter_image_metadata(files, workers=None, executor='thread', hash_images=True, placeholders=True):
+    """Extract metadata for (relative_path, file_path, stat) tuples in parallel
+    
+    At most `workers` files are read at the same time and only a bounded
+    number of results is buffered, so memory does not grow with the library.
+    Yields (relative_path, stat, metadata, error) in completion order; error
+    is a message string when the file could not be read.
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+    max_in_flight = workers * EXTRACTION_QUEUE_FACTOR
+    files = iter(files)
+    
+    with pool_class(max_workers=workers) as pool:
+        in_flight = {}
+        
+        def submit_next():
+            item = next(files, None)
+            if item is None:
+                return False
+            relative_path, file_path, stat = item
+            in_flight[pool.submit(extract_image_metadata, file_path, hash_images, placeholders)] = (relative_path, stat)
+            return True
+        
+        while len(in_flight) < max_in_flight and submit_next():
+            pass
+        
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                relative_path, stat = in_flight.pop(future)
+                submit_next()
                 try:
-                    with Image.open(file_path) as img:
-                        width, height = img.size
-                        exif_data = extract_exif_data(img)
+                    metadata, error = future.result(), None
                 except Exception as e:
-                    width = height = 0
-                    exif_data = {}
-                
-                images.append({
-                    'filename': relative_path,
-                    'original_filename': file,
-                    'file_size': file_size,
-                    'width': width,
-                    'height': height,
-                    'created_at': created_at,
-                    'exif_data': exif_data,
-                    'web_path': f'/data/{relative_path}'
-                })
-    
-    return images
+                    metadata, error = None, f'{type(e).__name__}: {e}'
+                yield relative_path, stat, metadata, error
 
-def extract_exif_data(image):
-    """Extract EXIF data from PIL Image object"""
-    exif_data = {}
+def update_file_manifest(images, deleted=()):
+    """Stage manifest updates for scanned and deleted files in the current session"""
+    if images:
+        now = datetime.utcnow()
+        statement = sqlite_insert(FileManifestEntry.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=[FileManifestEntry.path],
+            set_={
+                'size': statement.excluded.size,
+                'mtime_ns': statement.excluded.mtime_ns,
+                'inode': statement.excluded.inode,
+                'scanned_at': statement.excluded.scanned_at
+            }
+        )
+        db.session.execute(statement, [
+            {
+                'path': img_info['filename'],
+                'size': img_info['file_size'],
+                'mtime_ns': img_info['mtime_ns'],
+                'inode': img_info['inode'],
+                'scanned_at': now
+            }
+            for img_info in images
+        ])
+    
+    for chunk in chunked(deleted, SQL_IN_CHUNK):
+        FileManifestEntry.query.filter(FileManifestEntry.path.in_(chunk)).delete(synchronize_session=False)
+
+def chunked(items, size):
+    """Yield consecutive lists of at most size items from any iterable"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def existing_image_ids(filenames):
+    """Return {filename: image id} for the filenames that already have a portfolio image"""
+    existing = {}
+    for chunk in chunked(filenames, SQL_IN_CHUNK):
+        existing.update(
+            db.session.query(PortfolioImage.filename, PortfolioImage.id).filter(PortfolioImage.filename.in_(chunk))
+        )
+    return existing
+
+def queue_derivatives(filenames):
+    """Queue derivative rendering for the portfolio images with these filenames"""
+    from derivatives import enqueue_derivatives
+    image_ids = []
+    for chunk in chunked(filenames, SQL_IN_CHUNK):
+        image_ids.extend(
+            image_id for (image_id,) in
+            db.session.query(PortfolioImage.id).filter(PortfolioImage.filename.in_(chunk))
+        )
+    enqueue_derivatives(image_ids)
+
+def mark_duplicates(tree, filenames, max_distance=DEFAULT_MAX_DISTANCE, unpublish=False):
+    """Point newly imported images at an earlier copy of the same photo
+    
+    Each image is looked up in tree (a BKTree of image ids) and gets
+    duplicate_of_id set to the closest match within max_distance; with
+    unpublish it is also hidden from the public site. Matches include the
+    images of the same batch. Returns (duplicates, added) where added are
+    the (hash, id) pairs to put into tree once the batch is committed.
+    """
+    pending = BKTree()
+    duplicates = []
+    added = []
+    for chunk in chunked(filenames, SQL_IN_CHUNK):
+        rows = db.session.query(PortfolioImage.id, PortfolioImage.perceptual_hash).filter(
+            PortfolioImage.filename.in_(chunk), PortfolioImage.perceptual_hash.isnot(None)
+        ).order_by(PortfolioImage.id).all()
+        for image_id, image_hash in rows:
+            original_id = find_duplicate(tree, image_hash, max_distance) or find_duplicate(pending, image_hash, max_distance)
+            if original_id is not None:
+                values = {'id': image_id, 'duplicate_of_id': original_id}
+                if unpublish:
+                    values['is_published'] = False
+                duplicates.append(values)
+            if is_distinctive_hash(image_hash):
+                pending.add(image_hash, image_id)
+                added.append((image_hash, image_id))
+    
+    if duplicates:
+        db.session.execute(update(PortfolioImage), duplicates)
+    return len(duplicates), added
+
+def portfolio_image_row(img_info, category_id):
+    """Build the insert values for a newly imported image"""
+    return {
+        'filename': img_info['filename'],
+        'original_filename': img_info['original_filename'],
+        'title': os.path.splitext(img_info['original_filename'])[0].replace('_', ' ').replace('-', ' ').title(),
+        'description': '',
+        'alt_text': "Photography by Fifth Element Photography",
+        'file_size': img_info['file_size'],
+        'width': img_info['width'],
+        'height': img_info['height'],
+        'exif_data': dump_exif(img_info['exif_data']),
+        'perceptual_hash': img_info['perceptual_hash'],
+        'blurhash': img_info['blurhash'],
+        'dominant_color': img_info['dominant_color'],
+        'category_id': category_id,
+        'is_published': True,
+        'display_order': 0,
+        'created_at': img_info['created_at'],
+        **img_info['exif_fields']
+    }
+
+def changed_image_values(image_id, img_info):
+    """Build the update values for an imported image whose file has changed
     
+    Only what is read from the file is refreshed; the title, description,
+    category and publishing state set in the admin are kept.
+    """
+    return {
+        'id': image_id,
+        'file_size': img_info['file_size'],
+        'width': img_info['width'],
+        'height': img_info['height'],
+        'exif_data': dump_exif(img_info['exif_data']),
+        'perceptual_hash': img_info['perceptual_hash'],
+        'blurhash': img_info['blurhash'],
+        'dominant_color': img_info['dominant_color'],
+        # Derivatives of the old file no longer match its cache keys
+        'derivative_widths': None,
+        **img_info['exif_fields']
+    }
+
+def read_exif(image):
+    """EXIF tags of a PIL Image object by name, with their raw values"""
     try:
         exif = image._getexif()
-        if exif:
-            for tag_id, value in exif.items():
-                tag = TAGS.get(tag_id, tag_id)
-                exif_data[tag] = str(value)
     except Exception:
-        pass
+        return {}
+    return {TAGS.get(tag_id, tag_id): value for tag_id, value in (exif or {}).items()}
+
+def extract_exif_data(image):
+    """Extract the whitelisted EXIF tags stored for an image from a PIL Image object"""
+    return compact_exif(read_exif(image))
+
+def read_full_exif(filename):
+    """Every EXIF tag of a /data file, read from the file on demand
     
-    return exif_data
+    Only a whitelist of tags is kept in the database (see compact_exif).
+    Returns (tags, raw) where tags maps tag names to JSON-friendly values,
+    with binary values such as MakerNote summarized by their length, and
+    raw is the TIFF-structured EXIF block or None.
+    """
+    probe = probe_image(os.path.join(DATA_DIR, filename))
+    tags = {}
+    for tag, value in exif_tags(probe['exif']).items():
+        if isinstance(value, bytes):
+            value = f'<{len(value)} bytes>'
+        elif isinstance(value, dict):
+            value = {str(key): str(item) for key, item in value.items()}
+        elif not isinstance(value, (int, str)):
+            value = str(value)
+        tags[str(tag)] = value
+    return tags, probe['exif']
 
-def import_images_from_data():
-    """Import all images from /data directory into database"""
-    images = scan_data_directory()
-    imported_count = 0
-    skipped_count = 0
+def import_images_from_data(full=False, progress=None, paths=None):
+    """Import new and changed images from /data directory into database
+    
+    Scanning, metadata extraction and inserting are chained generators, so
+    only one batch of IMPORT_BATCH_SIZE images is held in memory at a time.
+    Each batch is checked for existing filenames with one IN query; new
+    files are bulk inserted, changed files have their file metadata
+    updated, and the batch is committed on its own; a failing batch is rolled back and
+    reported without undoing the batches imported before it. If given,
+    progress(stats) is called after every batch with the running totals.
+    Given paths (relative to /data), only those files are checked instead
+    of scanning the whole directory.
+    With PREGENERATE_DERIVATIVES set, resized variants of every committed
+    batch are queued for rendering in the background. New images whose
+    perceptual hash is within DUPLICATE_MAX_DISTANCE bits of an imported
+    one are marked as its duplicate and, with IMPORT_DUPLICATE_ACTION
+    'unpublish', left unpublished. With IMPORT_PERCEPTUAL_HASH and
+    IMPORT_PLACEHOLDERS off only the file headers are read.
+    """
+    batch_size = current_app.config.get('IMPORT_BATCH_SIZE', 500)
+    pregenerate = current_app.config.get('PREGENERATE_DERIVATIVES', False)
+    max_distance = current_app.config.get('DUPLICATE_MAX_DISTANCE', DEFAULT_MAX_DISTANCE)
+    unpublish_duplicates = current_app.config.get('IMPORT_DUPLICATE_ACTION', 'flag') == 'unpublish'
+    hash_tree = None
+    scan = DataDirectoryScan(full) if paths is None else ChangedFilesScan(paths)
+    stats = {
+        'found': 0,
+        'processed': 0,
+        'imported': 0,
+        'updated': 0,
+        'skipped': 0,
+        'failed': 0,
+        'deleted': 0,
+        'duplicates': 0,
+        'errors': []
+    }
+    last_error = None
+    
+    def record_error(filename, error):
+        stats['failed'] += 1
+        if len(stats['errors']) < MAX_REPORTED_FILES:
+            stats['errors'].append({'filename': filename, 'error': error})
     
     # Get default category (first one)
     default_category = Category.query.first()
+    category_id = default_category.id if default_category else None
     
-    for img_info in images:
-        # Check if image already exists in database
-        existing = PortfolioImage.query.filter_by(filename=img_info['filename']).first()
-        if existing:
-            skipped_count += 1
-            continue
+    insert_statement = sqlite_insert(PortfolioImage.__table__).on_conflict_do_nothing(
+        index_elements=[PortfolioImage.__table__.c.filename]
+    )
+    
+    results = scan_data_directory(
+        scan,
+        workers=current_app.config.get('IMPORT_WORKERS'),
+        executor=current_app.config.get('IMPORT_EXECUTOR', 'thread'),
+        hash_images=current_app.config.get('IMPORT_PERCEPTUAL_HASH', True),
+        placeholders=current_app.config.get('IMPORT_PLACEHOLDERS', True)
+    )
+    for batch in chunked(results, batch_size):
+        images = []
+        for img_info, error in batch:
+            if error:
+                record_error(img_info['filename'], error)
+            else:
+                images.append(img_info)
         
-        # Create new portfolio image
-        portfolio_image = PortfolioImage(
-            filename=img_info['filename'],
-            original_filename=img_info['original_filename'],
-            title=os.path.splitext(img_info['original_filename'])[0].replace('_', ' ').replace('-', ' ').title(),
-            description='',
-            alt_text=f"Photography by Fifth Element Photography",
-            file_size=img_info['file_size'],
-            width=img_info['width'],
-            height=img_info['height'],
-            exif_data=json.dumps(img_info['exif_data']),
-            category_id=default_category.id if default_category else None,
-            is_published=True,
-            display_order=0,
-            created_at=img_info['created_at']
-        )
+        try:
+            already_imported = existing_image_ids(img_info['filename'] for img_info in images)
+            rows = [
+                portfolio_image_row(img_info, category_id)
+                for img_info in images
+                if img_info['filename'] not in already_imported
+            ]
+            changed = [
+                changed_image_values(already_imported[img_info['filename']], img_info)
+                for img_info in images
+                if img_info['filename'] in already_imported
+            ]
+            if rows and hash_tree is None:
+                hash_tree = load_hash_tree()
+            changed_ids = [values['id'] for values in changed]
+            duplicates, hashed = 0, []
+            # Facet counts follow the whole batch at once instead of row by row
+            with deferred_facet_counts():
+                inserted = db.session.execute(insert_statement, rows).rowcount if rows else 0
+                inserted_ids = []
+                if inserted:
+                    duplicates, hashed = mark_duplicates(
+                        hash_tree, [row['filename'] for row in rows], max_distance, unpublish_duplicates
+                    )
+                    inserted_ids = list(existing_image_ids(row['filename'] for row in rows).values())
+                if changed:
+                    adjust_facet_counts(changed_ids, -1)
+                    db.session.execute(update(PortfolioImage), changed)
+                adjust_facet_counts(inserted_ids + changed_ids, 1)
+            # Staged after the rows, so a file is only marked current once its row is
+            update_file_manifest(images)
+            db.session.commit()
+            if inserted or changed:
+                invalidate_api_cache()
+                for image_hash, image_id in hashed:
+                    hash_tree.add(image_hash, image_id)
+        except Exception as e:
+            db.session.rollback()
+            last_error = str(e)
+            for img_info in images:
+                record_error(img_info['filename'], last_error)
+        else:
+            stats['imported'] += inserted
+            stats['updated'] += len(changed)
+            stats['duplicates'] += duplicates
+            stats['skipped'] += len(images) - inserted - len(changed)
+            if pregenerate and images:
+                queue_derivatives([img_info['filename'] for img_info in images])
         
-        db.session.add(portfolio_image)
-        imported_count += 1
+        stats['processed'] += len(batch)
+        stats['found'] = scan.found
+        if progress:
+            progress(stats)
     
+    stats['found'] = scan.found
+    stats['skipped'] += scan.unchanged
+    stats['deleted'] = len(scan.deleted)
+    stats['deleted_files'] = scan.deleted[:MAX_REPORTED_FILES]
     try:
+        update_file_manifest([], scan.deleted)
         db.session.commit()
-        return {
-            'success': True,
-            'imported': imported_count,
-            'skipped': skipped_count,
-            'total_found': len(images)
-        }
     except Exception as e:
         db.session.rollback()
-        return {
-            'success': False,
-            'error': str(e),
-            'imported': 0,
-            'skipped': 0,
-            'total_found': len(images)
-        }
+        last_error = str(e)
+    
+    if stats['imported']:
+        # New rows shift the value distributions the search queries are planned on
+        refresh_statistics()
+    if progress:
+        progress(stats)
+    
+    return {
+        'success': not (last_error and not stats['imported']),
+        'error': last_error,
+        'imported': stats['imported'],
+        'updated': stats['updated'],
+        'skipped': stats['skipped'],
+        'failed': stats['failed'],
+        'errors': stats['errors'],
+        'total_found': stats['found'],
+        'rescanned': stats['processed'],
+        'deleted': stats['deleted'],
+        'deleted_files': stats['deleted_files'],
+        'duplicates': stats['duplicates']
+    }
 
-def get_portfolio_stats():
-    """Get portfolio statistics"""
-    total_images = PortfolioImage.query.count()
-    published_images = PortfolioImage.query.filter_by(is_published=True).count()
-    total_categories = Category.query.filter_by(is_active=True).count()
-    featured_image = FeaturedImage.query.filter_by(is_active=True).first()
-    
-    # Get images per category
-    category_stats = []
-    categories = Category.query.filter_by(is_active=True).all()
-    for category in categories:
-        image_count = PortfolioImage.query.filter_by(category_id=category.id, is_published=True).count()
-        category_stats.append({
-            'name': category.name,
-            'count': image_count
-        })
+def backfill_exif_columns(batch_size=500, progress=None):
+    """Fill the EXIF columns of existing images from their stored exif_data
     
+    Rows are walked in id order, batch_size at a time; each batch is
+    parsed, written with one bulk UPDATE and committed on its own, so the
+    command can be interrupted and re-run. Images whose exif_data is empty
+    are left untouched.
+    """
+    stats = {'processed': 0, 'updated': 0, 'failed': 0}
+    last_id = 0
+    try:
+        while True:
+            rows = db.session.query(PortfolioImage.id, PortfolioImage.exif_data).filter(
+                PortfolioImage.id > last_id
+            ).order_by(PortfolioImage.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            
+            updates = []
+            for image_id, exif_data in rows:
+                stats['processed'] += 1
+                try:
+                    exif = json.loads(exif_data) if exif_data else {}
+                except ValueError:
+                    stats['failed'] += 1
+                    continue
+                if exif:
+                    updates.append({'id': image_id, **parse_exif_fields(exif)})
+            
+            if updates:
+                db.session.execute(update(PortfolioImage), updates)
+                db.session.commit()
+                stats['updated'] += len(updates)
+            if progress:
+                progress(stats)
+        
+        if stats['updated']:
+            invalidate_api_cache()
+        return {'success': True, **stats}
+    except Exception as e:
+        db.session.rollback()
+        return {'success': False, 'error': str(e), **stats}
+
+def backfill_dimensions(batch_size=500, progress=None):
+    """Store the displayed dimensions of existing images, read from their file headers
+    
+    Imports before the EXIF orientation was applied stored the dimensions
+    of the pixels as encoded, so turned photos (orientation 5-8) have width
+    and height swapped. Only rows whose dimensions change are updated;
+    missing or unreadable files are counted as failed.
+    """
+    stats = {'processed': 0, 'updated': 0, 'failed': 0}
+    last_id = 0
+    try:
+        while True:
+            rows = db.session.query(
+                PortfolioImage.id, PortfolioImage.filename, PortfolioImage.width, PortfolioImage.height
+            ).filter(PortfolioImage.id > last_id).order_by(PortfolioImage.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            
+            updates = []
+            for image_id, filename, width, height in rows:
+                stats['processed'] += 1
+                try:
+                    size = displayed_size(probe_image(os.path.join(DATA_DIR, filename)))
+                except (OSError, SyntaxError, ValueError):
+                    stats['failed'] += 1
+                    continue
+                if all(size) and size != (width, height):
+                    updates.append({'id': image_id, 'width': size[0], 'height': size[1]})
+            
+            if updates:
+                db.session.execute(update(PortfolioImage), updates)
+                db.session.commit()
+                stats['updated'] += len(updates)
+            if progress:
+                progress(stats)
+        
+        if stats['updated']:
+            invalidate_api_cache()
+        return {'success': True, **stats}
+    except Exception as e:
+        db.session.rollback()
+        return {'success': False, 'error': str(e), **stats}
+
+def backfill_from_pixels(missing_column, compute, batch_size=200, progress=None):
+    """Fill values computed from the pixels of existing images where missing_column is NULL
+    
+    compute(img) gets each opened PIL image and returns the column values
+    to set. Files that are missing or unreadable are counted as failed and
+    keep their NULL values.
+    """
+    stats = {'processed': 0, 'updated': 0, 'failed': 0}
+    last_id = 0
+    try:
+        while True:
+            rows = db.session.query(PortfolioImage.id, PortfolioImage.filename).filter(
+                PortfolioImage.id > last_id, missing_column.is_(None)
+            ).order_by(PortfolioImage.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            
+            updates = []
+            for image_id, filename in rows:
+                stats['processed'] += 1
+                try:
+                    with Image.open(os.path.join(DATA_DIR, filename)) as img:
+                        updates.append({'id': image_id, **compute(img)})
+                except (OSError, SyntaxError, ValueError):
+                    stats['failed'] += 1
+            
+            if updates:
+                db.session.execute(update(PortfolioImage), updates)
+                db.session.commit()
+                stats['updated'] += len(updates)
+            if progress:
+                progress(stats)
+        
+        return {'success': True, **stats}
+    except Exception as e:
+        db.session.rollback()
+        return {'success': False, 'error': str(e), **stats}
+
+def backfill_image_hashes(batch_size=200, progress=None):
+    """Compute the perceptual hash of existing images imported without one
+    
+    Existing rows are not marked as duplicates of each other; the
+    duplicates report groups them by hash instead.
+    """
+    return backfill_from_pixels(
+        PortfolioImage.perceptual_hash,
+        lambda img: {'perceptual_hash': perceptual_hash(img)},
+        batch_size=batch_size,
+        progress=progress
+    )
+
+def backfill_placeholders(batch_size=200, progress=None):
+    """Compute the BlurHash and dominant color of existing images imported without them"""
+    result = backfill_from_pixels(PortfolioImage.blurhash, image_placeholders, batch_size=batch_size, progress=progress)
+    if result['updated']:
+        invalidate_api_cache()
+    return result
+
+def compact_exif_data(batch_size=500, progress=None):
+    """Rewrite the exif_data of existing images to the compact whitelist form
+    
+    Imports before the whitelist stored every tag as a string, including
+    MakerNote and thumbnail blobs. Rows are walked in id order and each
+    batch is committed on its own; rows already compact are left alone.
+    The freed pages are only returned to the filesystem by a VACUUM.
+    """
+    stats = {'processed': 0, 'updated': 0, 'failed': 0, 'bytes_before': 0, 'bytes_after': 0}
+    last_id = 0
+    try:
+        while True:
+            rows = db.session.query(PortfolioImage.id, PortfolioImage.exif_data).filter(
+                PortfolioImage.id > last_id
+            ).order_by(PortfolioImage.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            
+            updates = []
+            for image_id, exif_data in rows:
+                stats['processed'] += 1
+                if not exif_data:
+                    continue
+                try:
+                    compact = dump_exif(json.loads(exif_data))
+                except ValueError:
+                    stats['failed'] += 1
+                    continue
+                stats['bytes_before'] += len(exif_data)
+                stats['bytes_after'] += len(compact)
+                if compact != exif_data:
+                    updates.append({'id': image_id, 'exif_data': compact})
+            
+            if updates:
+                db.session.execute(update(PortfolioImage), updates)
+                db.session.commit()
+                stats['updated'] += len(updates)
+            if progress:
+                progress(stats)
+        
+        return {'success': True, **stats}
+    except Exception as e:
+        db.session.rollback()
+        return {'success': False, 'error': str(e), **stats}
+
+def compute_portfolio_stats():
+    """Aggregate the dashboard statistics in one pass over portfolio_images
+    
+    The derivative cache is measured on disk here rather than by a worker's
+    own counter, so every worker reports the same size. Missing derivatives
+    are only counted when imports pregenerate them; otherwise every image
+    would count until its first request.
+    """
+    from derivatives import get_cache
+    missing_derivatives = or_(PortfolioImage.derivative_widths.is_(None), PortfolioImage.derivative_widths == '')
+    rows = db.session.query(
+        PortfolioImage.category_id,
+        func.count(),
+        func.sum(case((PortfolioImage.is_published.is_(True), 1), else_=0)),
+        func.sum(func.coalesce(PortfolioImage.file_size, 0)),
+        func.sum(case((missing_derivatives, 1), else_=0))
+    ).group_by(PortfolioImage.category_id).all()
+    categories = db.session.query(Category.id, Category.name).filter_by(is_active=True).order_by(Category.id).all()
+    has_featured = db.session.query(FeaturedImage.query.filter_by(is_active=True).exists()).scalar()
+    
+    published_by_category = {category_id: published for category_id, _, published, _, _ in rows}
     return {
-        'total_images': total_images,
-        'published_images': published_images,
-        'total_categories': total_categories,
-        'has_featured_image': featured_image is not None,
-        'category_stats': category_stats
+        'total_images': sum(row[1] for row in rows),
+        'published_images': sum(row[2] or 0 for row in rows),
+        'total_categories': len(categories),
+        'has_featured_image': bool(has_featured),
+        'category_stats': [
+            {'name': name, 'count': published_by_category.get(category_id) or 0}
+            for category_id, name in categories
+        ],
+        'total_bytes': sum(row[3] or 0 for row in rows),
+        'derivative_bytes': get_cache().disk_usage(),
+        'missing_derivatives': (
+            sum(row[4] or 0 for row in rows) if current_app.config.get('PREGENERATE_DERIVATIVES') else None
+        )
     }
 
+def get_portfolio_stats():
+    """Get portfolio statistics
+    
+    The aggregates come from a snapshot that is recomputed after the next
+    portfolio write, so dashboard loads in between cost one cache read.
+    The import backlog changes without a write and is read from the
+    running import job.
+    """
+    from import_jobs import active_import_job
+    stats = cached_snapshot('portfolio-stats', compute_portfolio_stats)
+    
+    job = active_import_job()
+    stats['import_backlog'] = max(0, (job.found or 0) - (job.processed or 0)) if job else 0
+    return stats
+
 def update_image_category(image_id, category_id):
     """Update image category"""
     try:
@@ -149,6 +810,7 @@ def update_image_category(image_id, category_id):
         if image:
             image.category_id = category_id
             db.session.commit()
+            invalidate_api_cache()
             return {'success': True}
         return {'success': False, 'error': 'Image not found'}
     except Exception as e:
@@ -165,6 +827,7 @@ def update_image_details(image_id, title, description, alt_text, is_published):
             image.alt_text = alt_text
             image.is_published = is_published
             db.session.commit()
+            invalidate_api_cache()
             return {'success': True}
         return {'success': False, 'error': 'Image not found'}
     except Exception as e:
@@ -172,12 +835,21 @@ def update_image_details(image_id, title, description, alt_text, is_published):
         return {'success': False, 'error': str(e)}
 
 def delete_image(image_id):
-    """Delete image from database (not from file system)"""
+    """Delete image from database (not from file system)
+    
+    Its file manifest entry goes too, so the next incremental import picks
+    the file up again if it is still in /data.
+    """
     try:
         image = PortfolioImage.query.get(image_id)
         if image:
+            PortfolioImage.query.filter_by(duplicate_of_id=image_id).update(
+                {'duplicate_of_id': None}, synchronize_session=False
+            )
+            update_file_manifest([], deleted=[image.filename])
             db.session.delete(image)
             db.session.commit()
+            invalidate_api_cache()
             return {'success': True}
         return {'success': False, 'error': 'Image not found'}
     except Exception as e:
@@ -200,6 +872,7 @@ def set_featured_image(image_id):
         )
         db.session.add(featured)
         db.session.commit()
+        invalidate_api_cache()
         return {'success': True}
     except Exception as e:
         db.session.rollback()
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import struct
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, current_app, make_response, request
+from cache_backends import get_cache_backend
+from instrumentation import record_cache
+
+# Only these responses are worth keeping; errors other than 404 are not cached
+CACHEABLE_STATUS = {200, 404}
+
+class CachedResponse:
+    """Serialized JSON body of an API response plus its ETag"""
+    __slots__ = ('body', 'status', 'etag')
+
+    def __init__(self, body, status):
+        self.body = body
+        self.status = status
+        self.etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+
+    def to_response(self):
+        response = Response(self.body, status=self.status, mimetype='application/json')
+        response.set_etag(self.etag)
+        # Browsers keep the body but check back with If-None-Match every time
+        response.cache_control.no_cache = True
+        return response.make_conditional(request.environ)
+
+class ResponseCache:
+    """Size bounded LRU of API responses in front of a shared cache backend
+
+    Entries are grouped by a generation counter kept in the backend. Admin
+    write paths call invalidate() after committing, which bumps the shared
+    counter; every worker compares its local generation with the shared one
+    at most every sync_interval seconds and drops its entries when they
+    differ, so stale responses live no longer than that interval. With a
+    shared backend, responses rendered by one worker are reused by others.
+    """
+
+    NAMESPACE = 'api'
+
+    def __init__(self, backend, max_bytes, sync_interval=1.0, ttl=3600):
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self.sync_interval = sync_interval
+        self.ttl = ttl
+        self.generation = backend.get_generation(self.NAMESPACE)
+        self._checked_at = time.monotonic()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.sync_interval:
+            return
+        self._checked_at = now
+        shared_generation = self.backend.get_generation(self.NAMESPACE)
+        if shared_generation != self.generation:
+            self._reset(shared_generation)
+
+    def _reset(self, generation):
+        with self._lock:
+            self.generation = generation
+            self._entries.clear()
+            self._size = 0
+
+    def _shared_key(self, key, generation):
+        digest = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).hexdigest()
+        return f'{self.NAMESPACE}:{generation}:{digest}'
+
+    def get(self, key):
+        self._sync()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                record_cache('api', 'hit')
+                return entry
+            generation = self.generation
+
+        if self.backend.shared:
+            value = self.backend.get(self._shared_key(key, generation))
+            if value is not None:
+                entry = CachedResponse(value[2:], struct.unpack('!H', value[:2])[0])
+                self._store(key, entry, generation)
+                record_cache('api', 'hit')
+                return entry
+        record_cache('api', 'miss')
+        return None
+
+    def put(self, key, entry, generation):
+        """Store entry unless the cache was invalidated since generation was read"""
+        if self._store(key, entry, generation) and self.backend.shared:
+            self.backend.set(
+                self._shared_key(key, generation),
+                struct.pack('!H', entry.status) + entry.body,
+                ttl=self.ttl
+            )
+
+    def _store(self, key, entry, generation):
+        size = len(entry.body)
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if generation != self.generation:
+                return False
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous.body)
+            self._entries[key] = entry
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+        return True
+
+    def invalidate(self):
+        self._reset(self.backend.bump_generation(self.NAMESPACE))
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Return the process wide response cache, creating it on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                get_cache_backend(),
+                current_app.config.get('API_CACHE_MAX_BYTES', 16 * 1024 * 1024),
+                sync_interval=current_app.config.get('CACHE_SYNC_INTERVAL', 1.0)
+            )
+        return _cache
+
+def invalidate_api_cache():
+    """Drop all cached API responses in every worker; call after committing portfolio changes"""
+    get_response_cache().invalidate()
+
+def cached_snapshot(name, compute):
+    """Return compute(), kept in the cache backend until the next invalidate_api_cache()
+
+    The JSON-serializable result is stored under the current shared
+    generation, so every worker reuses one snapshot and the first read
+    after a write computes it again.
+    """
+    cache = get_response_cache()
+    generation = cache.backend.get_generation(cache.NAMESPACE)
+    key = f'{cache.NAMESPACE}:{generation}:snapshot:{name}'
+    value = cache.backend.get(key)
+    if value is not None:
+        return json.loads(value)
+    snapshot = compute()
+    cache.backend.set(key, json.dumps(snapshot).encode('utf-8'), ttl=cache.ttl)
+    return snapshot
+
+def cached_response(view):
+    """Serve a JSON view from the response cache, keyed by endpoint and query args"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_app.config.get('API_CACHE_ENABLED', True):
+            return view(*args, **kwargs)
+
+        cache = get_response_cache()
+        key = (request.endpoint, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True))))
+        entry = cache.get(key)
+        if entry is None:
+            generation = cache.generation
+            response = make_response(view(*args, **kwargs))
+            if response.status_code not in CACHEABLE_STATUS or response.mimetype != 'application/json':
+                return response
+            entry = CachedResponse(response.get_data(), response.status_code)
+            cache.put(key, entry, generation)
+        return entry.to_response()
+    return wrapper
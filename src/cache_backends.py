@@ -0,0 +1,253 @@
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from urllib.parse import urlparse
+from flask import current_app
+
+class CacheBackend(ABC):
+    """Key/value store shared by the API cache and the derivative renderer
+
+    Values are bytes. Generation counters are used to broadcast
+    invalidations: a writer bumps a namespace's counter and every worker
+    drops its local entries once it sees the new value.
+    """
+
+    # Whether other processes see what this backend stores
+    shared = True
+
+    @abstractmethod
+    def get(self, key):
+        """Return the value stored under key, or None"""
+
+    @abstractmethod
+    def set(self, key, value, ttl=None):
+        """Store value under key, expiring after ttl seconds if given"""
+
+    @abstractmethod
+    def add(self, key, value, ttl=None):
+        """Store value only if key is missing; returns True if it was stored"""
+
+    @abstractmethod
+    def delete(self, key):
+        """Remove key if it is stored"""
+
+    @abstractmethod
+    def get_generation(self, namespace):
+        """Return the generation counter of namespace, 0 if it was never bumped"""
+
+    @abstractmethod
+    def bump_generation(self, namespace):
+        """Increment and return the generation counter of namespace"""
+
+class MemoryBackend(CacheBackend):
+    """Per-process LRU backend; only coherent with a single worker"""
+
+    shared = False
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, time.time() + ttl if ttl else None)
+            self._size += len(value)
+            while self._size > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] >= time.time()):
+                return False
+        self.set(key, value, ttl)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[0])
+
+    def get_generation(self, namespace):
+        with self._lock:
+            return self._generations.get(namespace, 0)
+
+    def bump_generation(self, namespace):
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            return self._generations[namespace]
+
+class SQLiteBackend(CacheBackend):
+    """Backend in a shared SQLite file, coherent across workers on one host
+
+    Oldest entries are pruned once the stored values exceed max_bytes.
+    """
+
+    PRUNE_EVERY = 100  # writes between size checks
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries '
+                '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL, stored_at REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_cache_entries_stored_at ON cache_entries (stored_at)')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache_generations (namespace TEXT PRIMARY KEY, value INTEGER NOT NULL)'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM cache_entries WHERE key = ? AND (expires_at IS NULL OR expires_at >= ?)',
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        self._connection().execute(
+            'INSERT OR REPLACE INTO cache_entries (key, value, expires_at, stored_at) VALUES (?, ?, ?, ?)',
+            (key, value, now + ttl if ttl else None, now)
+        )
+        self._wrote()
+
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        connection = self._connection()
+        connection.execute('DELETE FROM cache_entries WHERE key = ? AND expires_at < ?', (key, now))
+        cursor = connection.execute(
+            'INSERT OR IGNORE INTO cache_entries (key, value, expires_at, stored_at) VALUES (?, ?, ?, ?)',
+            (key, value, now + ttl if ttl else None, now)
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+
+    def get_generation(self, namespace):
+        row = self._connection().execute(
+            'SELECT value FROM cache_generations WHERE namespace = ?', (namespace,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def bump_generation(self, namespace):
+        connection = self._connection()
+        connection.execute(
+            'INSERT INTO cache_generations (namespace, value) VALUES (?, 1) '
+            'ON CONFLICT(namespace) DO UPDATE SET value = value + 1',
+            (namespace,)
+        )
+        return self.get_generation(namespace)
+
+    def _wrote(self):
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        """Drop expired entries, then the oldest ones while over max_bytes"""
+        connection = self._connection()
+        connection.execute('DELETE FROM cache_entries WHERE expires_at < ?', (time.time(),))
+        total = connection.execute('SELECT COALESCE(SUM(LENGTH(value)), 0) FROM cache_entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        removed = 0
+        for key, size in connection.execute(
+                'SELECT key, LENGTH(value) FROM cache_entries ORDER BY stored_at').fetchall():
+            if total - removed <= self.max_bytes * 0.9:
+                break
+            connection.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+            removed += size
+
+class RedisBackend(CacheBackend):
+    """Backend on a Redis protocol server; needs the optional redis package
+
+    Size limits are left to the server's maxmemory policy.
+    """
+
+    def __init__(self, url, prefix='fifth-element:'):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError('The redis package is required for a redis:// cache backend') from e
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, value, ex=int(ttl) if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        return bool(self.client.set(self.prefix + key, value, ex=int(ttl) if ttl else None, nx=True))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def get_generation(self, namespace):
+        return int(self.client.get(f'{self.prefix}generation:{namespace}') or 0)
+
+    def bump_generation(self, namespace):
+        return int(self.client.incr(f'{self.prefix}generation:{namespace}'))
+
+def create_backend(url, max_bytes=256 * 1024 * 1024):
+    """Create a backend from a URL: memory://, sqlite:///path/to/file.db or redis://host:port/db"""
+    scheme = urlparse(url).scheme
+    if scheme == 'memory':
+        return MemoryBackend(max_bytes)
+    if scheme == 'sqlite':
+        return SQLiteBackend(url[len('sqlite:///'):], max_bytes)
+    if scheme in ('redis', 'rediss', 'unix'):
+        return RedisBackend(url)
+    raise ValueError(f'Unsupported cache backend URL: {url}')
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_cache_backend():
+    """Return the process wide backend configured by CACHE_BACKEND_URL"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend(
+                current_app.config.get('CACHE_BACKEND_URL', 'memory://'),
+                current_app.config.get('CACHE_BACKEND_MAX_BYTES', 256 * 1024 * 1024)
+            )
+        return _backend
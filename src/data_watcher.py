@@ -0,0 +1,346 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from admin_tools import DATA_DIR, IMAGE_EXTENSIONS, file_signature, walk_image_files
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; every process then runs its own watcher
+    fcntl = None
+
+# inotify(7) event bits
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+# How often a worker that does not hold the watcher lock tries to take it over
+LOCK_RETRY_INTERVAL = 30
+# Pause before restarting a watcher that failed
+RESTART_DELAY = 10
+
+def is_watched_path(relative_path):
+    """Whether a path relative to /data can be an importable image"""
+    parts = relative_path.split(os.sep)
+    return (
+        os.path.splitext(relative_path)[1].lower() in IMAGE_EXTENSIONS
+        and not any(part.startswith('.') for part in parts)
+    )
+
+class InotifySource:
+    """Changed paths under data_dir reported by Linux inotify, through ctypes
+
+    Every non-hidden directory gets its own watch. Directories created or
+    moved in are watched and their files reported right away, as they may
+    have been filled before the watch existed. Directories moved or deleted
+    out, and a kernel queue overflow, ask for a rescan instead.
+    """
+
+    def __init__(self, data_dir):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.data_dir = data_dir
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.directories = {}
+        try:
+            self._watch_tree(data_dir)
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def _watch(self, directory):
+        wd = self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            # ENOSPC: fs.inotify.max_user_watches is exhausted
+            raise OSError(errno, f'inotify_add_watch failed for {directory}: {os.strerror(errno)}')
+        self.directories[wd] = directory
+
+    def _watch_tree(self, directory):
+        """Watch directory and its subdirectories; returns the image paths found in them"""
+        found = set()
+        pending = [directory]
+        while pending:
+            current = pending.pop()
+            try:
+                self._watch(current)
+                with os.scandir(current) as entries:
+                    entries = list(entries)
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                else:
+                    found.add(os.path.relpath(entry.path, self.data_dir))
+        return found
+
+    def read(self, timeout):
+        """Wait up to timeout seconds and return (changed paths, rescan needed)"""
+        changed = set()
+        rescan = False
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return changed, rescan
+
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(buffer, offset)
+                name = os.fsdecode(buffer[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0'))
+                offset += EVENT_HEADER.size + length
+
+                if mask & IN_Q_OVERFLOW:
+                    rescan = True
+                    continue
+                if mask & IN_IGNORED:
+                    self.directories.pop(wd, None)
+                    continue
+                directory = self.directories.get(wd)
+                if directory is None or not name or name.startswith('.'):
+                    continue
+
+                path = os.path.join(directory, name)
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        changed.update(self._watch_tree(path))
+                    elif mask & (IN_MOVED_FROM | IN_DELETE):
+                        rescan = True
+                else:
+                    changed.add(os.path.relpath(path, self.data_dir))
+        return changed, rescan
+
+class PollingSource:
+    """Changed paths under data_dir found by comparing stat signatures between walks"""
+
+    def __init__(self, data_dir, interval):
+        self.data_dir = data_dir
+        self.interval = interval
+        self.snapshot = self._walk()
+        self.next_poll = time.monotonic() + interval
+
+    def _walk(self):
+        return {
+            relative_path: file_signature(stat)
+            for relative_path, file_path, stat in walk_image_files(self.data_dir)
+        }
+
+    def close(self):
+        pass
+
+    def read(self, timeout):
+        """Like InotifySource.read; the directory is only walked every interval seconds"""
+        wait = self.next_poll - time.monotonic()
+        if timeout < wait:
+            time.sleep(timeout)
+            return set(), False
+        time.sleep(max(0.0, wait))
+        self.next_poll = time.monotonic() + self.interval
+        previous, self.snapshot = self.snapshot, self._walk()
+        changed = {path for path, signature in self.snapshot.items() if previous.get(path) != signature}
+        changed.update(path for path in previous if path not in self.snapshot)
+        return changed, False
+
+class Debouncer:
+    """Hold changed paths until they have been quiet for quiet_period seconds
+
+    A file is only released once its size and mtime are the same as when
+    its last change was seen, so files that are still being uploaded wait
+    until the writes stop. Deleted files are released as soon as they are
+    quiet.
+    """
+
+    def __init__(self, data_dir, quiet_period):
+        self.data_dir = data_dir
+        self.quiet_period = quiet_period
+        self._pending = {}
+
+    def _signature(self, relative_path):
+        try:
+            return file_signature(os.stat(os.path.join(self.data_dir, relative_path)))
+        except OSError:
+            return None
+
+    def add(self, paths, now):
+        for path in paths:
+            self._pending[path] = (now + self.quiet_period, self._signature(path))
+
+    def next_deadline(self):
+        return min((deadline for deadline, _ in self._pending.values()), default=None)
+
+    def ready(self, now):
+        released = []
+        for path, (deadline, signature) in list(self._pending.items()):
+            if deadline > now:
+                continue
+            current = self._signature(path)
+            if current == signature:
+                released.append(path)
+                del self._pending[path]
+            else:
+                self._pending[path] = (now + self.quiet_period, current)
+        return released
+
+    def __len__(self):
+        return len(self._pending)
+
+class DataDirectoryWatcher:
+    """Import new and changed files under /data as soon as they settle
+
+    Changes come from inotify where it is available and otherwise from
+    polling. Settled paths are imported with run_import_job(paths=...),
+    which checks them against the file manifest like a regular import. A
+    rescan request runs a normal incremental import. Every import runs as
+    an ImportJob, so it shows up like one started from the admin and holds
+    the same lock; while another job is running, paths stay pending until
+    it is done.
+    """
+
+    def __init__(self, app, data_dir=DATA_DIR):
+        self.app = app
+        self.data_dir = data_dir
+        self.debounce = app.config.get('WATCH_DEBOUNCE_SECONDS', 2.0)
+        self.poll_interval = app.config.get('WATCH_POLL_INTERVAL', 5.0)
+        self.backend = app.config.get('WATCH_BACKEND', 'auto')
+        self.debouncer = Debouncer(data_dir, self.debounce)
+        self.rescan = True  # catch up with changes made while nothing was watching
+
+    def open_source(self):
+        if self.backend != 'poll':
+            try:
+                source = InotifySource(self.data_dir)
+                self.app.logger.info('Watching %s with inotify (%d directories)', self.data_dir, len(source.directories))
+                return source
+            except (OSError, AttributeError) as e:
+                if self.backend == 'inotify':
+                    raise
+                self.app.logger.warning('inotify unavailable (%s), polling %s every %ss', e, self.data_dir, self.poll_interval)
+        return PollingSource(self.data_dir, self.poll_interval)
+
+    def run(self, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        source = self.open_source()
+        try:
+            while not stop_event.is_set():
+                self.import_ready()
+                deadline = self.debouncer.next_deadline()
+                timeout = self.poll_interval if deadline is None else max(0.0, deadline - time.monotonic())
+                changed, rescan = source.read(min(timeout, self.poll_interval))
+                self.debouncer.add((path for path in changed if is_watched_path(path)), time.monotonic())
+                self.rescan = self.rescan or rescan
+        finally:
+            source.close()
+
+    def import_ready(self):
+        from import_jobs import active_import_job, claim_import_job, get_import_job, run_import_job
+        with self.app.app_context():
+            if not self.rescan and not len(self.debouncer):
+                return
+            if active_import_job() is not None:
+                return
+
+            paths = None
+            if not self.rescan:
+                paths = self.debouncer.ready(time.monotonic())
+                if not paths:
+                    return
+            job = claim_import_job()
+            if job is None:
+                # An admin import started in the meantime; try these paths again later
+                if paths:
+                    self.debouncer.add(paths, time.monotonic())
+                return
+            self.rescan = False
+            job_id = job.id
+
+        # Runs on this thread, with the same progress, heartbeat and lock as an admin import
+        run_import_job(self.app, job_id, paths=paths)
+
+        with self.app.app_context():
+            job = get_import_job(job_id)
+            if job.status != 'completed':
+                self.app.logger.warning('Watched import failed: %s', job.error)
+            elif job.imported or job.deleted:
+                self.app.logger.info('Watched import: %d imported, %d removed', job.imported, job.deleted)
+
+class WatcherLock:
+    """Non-blocking exclusive file lock so only one process runs the watcher"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        if fcntl is None:
+            return True
+        handle = open(self.path, 'a')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._file = handle
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def watcher_lock_path(app):
+    return os.path.join(os.path.dirname(os.path.abspath(app.config['DATABASE_PATH'])), 'data-watcher.lock')
+
+def run_watcher(app, stop_event=None):
+    """Run the /data watcher in this thread in whichever process holds the watcher lock
+
+    Processes that do not get the lock retry every LOCK_RETRY_INTERVAL
+    seconds, so another worker takes over if the one watching exits.
+    """
+    stop_event = stop_event or threading.Event()
+    lock = WatcherLock(watcher_lock_path(app))
+    while not stop_event.is_set():
+        if not lock.acquire():
+            stop_event.wait(LOCK_RETRY_INTERVAL)
+            continue
+        try:
+            DataDirectoryWatcher(app).run(stop_event)
+        except Exception:
+            app.logger.exception('Data directory watcher failed, restarting in %ss', RESTART_DELAY)
+            stop_event.wait(RESTART_DELAY)
+        finally:
+            lock.release()
+
+def start_watcher(app):
+    """Start run_watcher on a daemon thread; returns the event that stops it"""
+    stop_event = threading.Event()
+    thread = threading.Thread(target=run_watcher, args=(app, stop_event), name='data-watcher', daemon=True)
+    thread.start()
+    return stop_event
@@ -0,0 +1,95 @@
+import os
+from functools import wraps
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from models.portfolio import db
+
+READ_ONLY_BIND = 'readonly'
+
+# Applied to every new SQLite connection
+CONNECTION_PRAGMAS = {
+    'synchronous': 'NORMAL',     # safe with WAL, avoids an fsync per commit
+    'cache_size': -32000,        # 32 MB page cache per connection
+    'mmap_size': 268435456,      # read through a 256 MB memory map
+    'busy_timeout': 10000,       # wait up to 10s for a lock instead of failing
+    'temp_store': 'MEMORY',
+}
+
+def configure_database(app, database_path):
+    """Point SQLAlchemy at database_path with a writer and a read-only engine
+
+    Both engines use a connection pool sized by DB_POOL_SIZE and
+    DB_MAX_OVERFLOW. The read-only engine opens the same file with
+    mode=ro and serves the views wrapped in @read_only.
+    """
+    pool_options = {
+        'poolclass': QueuePool,
+        'pool_size': app.config.get('DB_POOL_SIZE', 10),
+        'max_overflow': app.config.get('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': 30,
+        'connect_args': {'timeout': 30, 'check_same_thread': False},
+    }
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = pool_options
+    app.config['SQLALCHEMY_BINDS'] = {
+        READ_ONLY_BIND: {'url': f'sqlite:///file:{database_path}?mode=ro&uri=true', **pool_options}
+    }
+
+def init_database(app, database_path):
+    """Configure and initialize db for app, installing the connection pragmas"""
+    configure_database(app, database_path)
+    db.init_app(app)
+
+    with app.app_context():
+        writer = db.engines[None]
+        event.listen(writer, 'connect', _writer_connect)
+        # The read-only engine can only open the file once it exists
+        with writer.connect():
+            pass
+        event.listen(db.engines[READ_ONLY_BIND], 'connect', _reader_connect)
+
+def _apply_pragmas(dbapi_connection):
+    cursor = dbapi_connection.cursor()
+    for name, value in CONNECTION_PRAGMAS.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+def _writer_connect(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers keep going while an import holds the write lock
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.close()
+    _apply_pragmas(dbapi_connection)
+
+def _reader_connect(dbapi_connection, connection_record):
+    _apply_pragmas(dbapi_connection)
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA query_only=ON')
+    cursor.close()
+
+def database_file_size(database_path):
+    """Bytes used on disk by the database file and its write-ahead log"""
+    return sum(
+        os.path.getsize(path)
+        for path in (database_path, f'{database_path}-wal')
+        if os.path.exists(path)
+    )
+
+def vacuum_database():
+    """Checkpoint the WAL and rebuild the database file to release free pages"""
+    db.session.remove()
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.exec_driver_sql('VACUUM')
+        connection.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+
+def read_only(view):
+    """Run a view's queries on the read-only engine"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.db_read_only = False
+    return wrapper
@@ -0,0 +1,361 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import update
+from PIL import Image, ImageOps, UnidentifiedImageError
+from werkzeug.security import safe_join
+from admin_tools import DATA_DIR
+from models.portfolio import db, PortfolioImage
+from api_cache import invalidate_api_cache
+from cache_backends import get_cache_backend
+from instrumentation import record_cache, timed
+
+# Widths a derivative can be requested at; other widths snap to the next preset
+WIDTH_PRESETS = (320, 640, 960, 1280, 1920, 2560)
+
+# Variants rendered ahead of time for every imported image
+PREGENERATED_WIDTHS = {'thumbnail': 320, 'grid': 960, 'hero': 1920}
+
+# Output formats in order of preference: (mimetype, PIL format, extension, quality)
+OUTPUT_FORMATS = (
+    ('image/avif', 'AVIF', 'avif', 50),
+    ('image/webp', 'WEBP', 'webp', 80),
+    ('image/jpeg', 'JPEG', 'jpg', 82),
+)
+
+# Cache hits refresh the file mtime (used as LRU clock) at most this often
+TOUCH_INTERVAL = 3600
+# Eviction removes least recently used files until the cache is this full
+EVICTION_TARGET = 0.9
+# How long another worker's render may hold a variant before we render it ourselves
+RENDER_LOCK_TTL = 60
+RENDER_POLL_INTERVAL = 0.1
+
+def snap_width(width):
+    """Return the smallest preset width that is at least width"""
+    for preset in WIDTH_PRESETS:
+        if preset >= width:
+            return preset
+    return WIDTH_PRESETS[-1]
+
+def negotiate_format(accept_header):
+    """Pick the best output format the client accepts and PIL can encode"""
+    Image.init()
+    accept_header = accept_header or ''
+    for output_format in OUTPUT_FORMATS:
+        mimetype, pil_format = output_format[0], output_format[1]
+        if mimetype == 'image/jpeg' or (mimetype in accept_header and pil_format in Image.SAVE):
+            return output_format
+    return OUTPUT_FORMATS[-1]
+
+def render_derivative(source_path, target_path, width, pil_format, quality):
+    """Decode source_path, resize it to width and encode it to target_path"""
+    with Image.open(source_path) as img:
+        with timed('decode'):
+            # Let the JPEG decoder downscale while decoding instead of afterwards
+            img.draft('RGB', (width, width))
+            img.load()
+
+        with timed('resize'):
+            img = ImageOps.exif_transpose(img)
+            if img.width > width:
+                img.thumbnail((width, img.height), Image.LANCZOS)
+
+            has_alpha = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+            if has_alpha and pil_format == 'JPEG':
+                img = img.convert('RGBA')
+                background = Image.new('RGB', img.size, (0, 0, 0))
+                background.paste(img, mask=img.getchannel('A'))
+                img = background
+            elif has_alpha:
+                img = img.convert('RGBA')
+            elif img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+
+        temp_path = f'{target_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with timed('encode'):
+                img.save(temp_path, pil_format, quality=quality)
+            os.replace(temp_path, target_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+class DerivativeCache:
+    """Size capped disk cache of rendered derivatives
+
+    Files are addressed by a hash of the source file identity (path, size,
+    mtime) and the render parameters, so a changed original never serves a
+    stale derivative. File mtimes double as the LRU clock. Concurrent
+    requests for the same missing variant wait for a single render: threads
+    of one worker through an in-process event, other workers through a
+    render lock in the shared cache backend.
+    """
+
+    def __init__(self, cache_dir, max_bytes, backend=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._size = None
+
+    def key_for(self, filename, stat, width, pil_format, quality):
+        identity = f'{filename}\0{stat.st_size}\0{stat.st_mtime_ns}\0{width}\0{pil_format}\0{quality}'
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+    def path_for(self, key, extension):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.{extension}')
+
+    def get_or_render(self, key, extension, render):
+        """Return the cached path for key, calling render(path) if it is missing"""
+        path = self.path_for(key, extension)
+        if self._touch(path):
+            record_cache('derivatives', 'hit')
+            return path
+        record_cache('derivatives', 'miss')
+
+        with self._lock:
+            event = self._in_flight.get(key)
+            owner = event is None
+            if owner:
+                event = self._in_flight[key] = threading.Event()
+
+        if not owner:
+            event.wait()
+            if os.path.exists(path):
+                return path
+            raise OSError(f'Rendering derivative {key} failed')
+
+        try:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self._render_once(key, path, render)
+            return path
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            event.set()
+
+    def _render_once(self, key, path, render):
+        """Render path unless another worker holds the render lock for key"""
+        lock_key = f'render:{key}'
+        if self.backend is None or not self.backend.shared or self.backend.add(lock_key, b'1', ttl=RENDER_LOCK_TTL):
+            try:
+                render(path)
+            finally:
+                if self.backend is not None and self.backend.shared:
+                    self.backend.delete(lock_key)
+            self._added(path)
+            return
+
+        deadline = time.monotonic() + RENDER_LOCK_TTL
+        while time.monotonic() < deadline:
+            time.sleep(RENDER_POLL_INTERVAL)
+            if os.path.exists(path):
+                return
+        render(path)
+        self._added(path)
+
+    def _touch(self, path):
+        """Mark path as recently used; returns False if it does not exist"""
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return False
+        if time.time() - mtime > TOUCH_INTERVAL:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return True
+
+    def disk_usage(self):
+        """Bytes of every file in the cache directory, whichever worker rendered them"""
+        return sum(entry[2] for entry in self._entries())
+
+    def _added(self, path):
+        with self._lock:
+            if self._size is None:
+                self._size = self.disk_usage()
+            else:
+                self._size += os.path.getsize(path)
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self.evict(keep=path)
+
+    def _entries(self):
+        """List (mtime, path, size) of every cached file"""
+        entries = []
+        for root, dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    def evict(self, keep=None):
+        """Remove least recently used files until the cache is below its cap"""
+        entries = sorted(self._entries())
+        total = sum(entry[2] for entry in entries)
+        target = self.max_bytes * EVICTION_TARGET
+        for mtime, path, size in entries:
+            if total <= target:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._size = total
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_cache():
+    """Return the DerivativeCache configured for the current app"""
+    cache_dir = current_app.config.get('DERIVATIVE_CACHE_DIR') or os.path.join(DATA_DIR, '.cache', 'derivatives')
+    max_bytes = current_app.config.get('DERIVATIVE_CACHE_MAX_BYTES', 2 * 1024 ** 3)
+    with _caches_lock:
+        cache = _caches.get(cache_dir)
+        if cache is None:
+            cache = _caches[cache_dir] = DerivativeCache(cache_dir, max_bytes, get_cache_backend())
+        return cache
+
+def encodable_formats():
+    """Output formats the installed PIL can write"""
+    Image.init()
+    return [output_format for output_format in OUTPUT_FORMATS if output_format[1] in Image.SAVE]
+
+def get_derivative(filename, width, accept_header=''):
+    """Return (path, mimetype) of a resized copy of a /data file, or None
+
+    The width is snapped to WIDTH_PRESETS and the format is chosen from the
+    Accept header. Missing variants are rendered once and cached on disk.
+    """
+    source_path = safe_join(DATA_DIR, filename)
+    if source_path is None:
+        return None
+    try:
+        stat = os.stat(source_path)
+    except OSError:
+        return None
+
+    width = snap_width(width)
+    mimetype, pil_format, extension, quality = negotiate_format(accept_header)
+    cache = get_cache()
+    key = cache.key_for(filename, stat, width, pil_format, quality)
+    try:
+        path = cache.get_or_render(
+            key,
+            extension,
+            lambda target_path: render_derivative(source_path, target_path, width, pil_format, quality)
+        )
+    except UnidentifiedImageError:
+        return None
+    return path, mimetype
+
+_pregenerate_pool = None
+_pregenerate_pool_lock = threading.Lock()
+
+def pregenerate_derivatives(filename, widths=None):
+    """Render every encodable format of the given widths for a /data file
+
+    Returns the sorted widths that were rendered for all formats.
+    """
+    source_path = safe_join(DATA_DIR, filename)
+    if source_path is None:
+        return []
+    stat = os.stat(source_path)
+    cache = get_cache()
+
+    rendered = []
+    for width in sorted(set(widths or PREGENERATED_WIDTHS.values())):
+        for mimetype, pil_format, extension, quality in encodable_formats():
+            key = cache.key_for(filename, stat, width, pil_format, quality)
+            cache.get_or_render(
+                key,
+                extension,
+                lambda target_path: render_derivative(source_path, target_path, width, pil_format, quality)
+            )
+        rendered.append(width)
+    return rendered
+
+class DerivativeBatch:
+    """Widths rendered for the images of one enqueue_derivatives() call
+
+    Images render in parallel; the last one to finish records the widths
+    of the whole batch in one update, so the API cache is invalidated once
+    per batch rather than once per image.
+    """
+
+    def __init__(self, app, size):
+        self.app = app
+        self.remaining = size
+        self.rendered = {}
+        self._lock = threading.Lock()
+
+    def done(self, image_id, widths):
+        with self._lock:
+            if widths is not None:
+                self.rendered[image_id] = widths
+            self.remaining -= 1
+            finished = self.remaining == 0
+        if finished and self.rendered:
+            self.record()
+
+    def record(self):
+        with self.app.app_context():
+            try:
+                db.session.execute(update(PortfolioImage), [
+                    {'id': image_id, 'derivative_widths': ','.join(str(width) for width in widths)}
+                    for image_id, widths in self.rendered.items()
+                ])
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.warning('Could not record derivatives of %d images: %s', len(self.rendered), e)
+                return
+            invalidate_api_cache()
+
+def _pregenerate_image(app, image_id, batch):
+    widths = None
+    try:
+        with app.app_context():
+            image = db.session.get(PortfolioImage, image_id)
+            if image is not None:
+                widths = pregenerate_derivatives(image.filename)
+    except Exception as e:
+        app.logger.warning('Could not pregenerate derivatives for image %s: %s', image_id, e)
+    finally:
+        batch.done(image_id, widths)
+
+def enqueue_derivatives(image_ids):
+    """Queue derivative rendering for portfolio images on a background pool
+
+    Once every image of the call has been rendered, their widths are
+    recorded in PortfolioImage.derivative_widths in one commit so the API
+    can advertise them.
+    """
+    global _pregenerate_pool
+    app = current_app._get_current_object()
+    with _pregenerate_pool_lock:
+        if _pregenerate_pool is None:
+            _pregenerate_pool = ThreadPoolExecutor(
+                max_workers=app.config.get('DERIVATIVE_WORKERS', 2),
+                thread_name_prefix='derivatives'
+            )
+    if not image_ids:
+        return
+    batch = DerivativeBatch(app, len(image_ids))
+    for image_id in image_ids:
+        _pregenerate_pool.submit(_pregenerate_image, app, image_id, batch)
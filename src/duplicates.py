@@ -0,0 +1,158 @@
+from PIL import Image, ImageOps
+from sqlalchemy.orm import load_only
+from models.portfolio import db, PortfolioImage
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# dHash compares HASH_SIZE + 1 columns of HASH_SIZE rows, giving HASH_SIZE² bits
+HASH_SIZE = 8
+HASH_MASK = (1 << HASH_SIZE * HASH_SIZE) - 1
+
+# Hashes differing in at most this many bits are treated as the same photo;
+# re-encodes and resizes stay within 2-4, different shots rarely come below 10
+DEFAULT_MAX_DISTANCE = 6
+
+# Flat or smooth images (solid colors, plain gradients) hash to almost all
+# zeros or all ones whatever their color, so such hashes are never matched
+MIN_HASH_BITS = 8
+
+def perceptual_hash(image):
+    """64-bit difference hash (dHash) of a PIL image, as a signed integer
+
+    Each bit records whether a pixel of a 9x8 grayscale thumbnail is
+    brighter than its right neighbour, which survives resizing, recompression
+    and small exposure edits. JPEGs are decoded at reduced scale via
+    draft(), so call this after reading anything that needs the full size.
+    The value is signed so it fits SQLite's 64-bit INTEGER.
+    """
+    image.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+    gray = ImageOps.exif_transpose(image.convert('L'))
+    small = gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+
+    if numpy is not None:
+        pixels = numpy.asarray(small, dtype=numpy.int16)
+        bits = numpy.packbits(pixels[:, 1:] > pixels[:, :-1])
+        value = int.from_bytes(bits.tobytes(), 'big')
+    else:
+        pixels = list(small.getdata())
+        value = 0
+        for row in range(HASH_SIZE):
+            offset = row * (HASH_SIZE + 1)
+            for column in range(HASH_SIZE):
+                value = (value << 1) | (pixels[offset + column + 1] > pixels[offset + column])
+
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def is_distinctive_hash(value):
+    """Whether a hash has at least MIN_HASH_BITS set and MIN_HASH_BITS clear bits"""
+    bits = (value & HASH_MASK).bit_count()
+    return MIN_HASH_BITS <= bits <= HASH_SIZE * HASH_SIZE - MIN_HASH_BITS
+
+def hamming_distance(a, b):
+    return ((a ^ b) & HASH_MASK).bit_count()
+
+class BKTree:
+    """Burkhard-Keller tree of hashes for lookups within a Hamming distance
+
+    Every child edge is labelled with its distance to the parent, and the
+    triangle inequality lets a search skip every subtree whose label is
+    further than max_distance from the query's distance to the node, so
+    only a small part of the tree is visited for small distances.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, key):
+        node = [value & HASH_MASK, key, {}]
+        self.size += 1
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming_distance(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value, max_distance):
+        """Return (distance, key) of every stored hash within max_distance of value"""
+        if self.root is None:
+            return []
+        value &= HASH_MASK
+        matches = []
+        pending = [self.root]
+        while pending:
+            node = pending.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                matches.append((distance, node[1]))
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    pending.append(child)
+        return matches
+
+def load_hash_tree():
+    """BKTree of the perceptual hashes of every imported image, keyed by image id"""
+    tree = BKTree()
+    rows = db.session.query(PortfolioImage.id, PortfolioImage.perceptual_hash).filter(
+        PortfolioImage.perceptual_hash.isnot(None)
+    ).order_by(PortfolioImage.id)
+    for image_id, value in rows:
+        if is_distinctive_hash(value):
+            tree.add(value, image_id)
+    return tree
+
+def find_duplicate(tree, value, max_distance=DEFAULT_MAX_DISTANCE):
+    """Id of the closest (then oldest) image in tree within max_distance, or None
+    
+    Hashes that are not distinctive never match anything.
+    """
+    if not is_distinctive_hash(value):
+        return None
+    matches = tree.search(value, max_distance)
+    return min(matches)[1] if matches else None
+
+def duplicate_groups(max_distance=DEFAULT_MAX_DISTANCE):
+    """Group images whose perceptual hashes are within max_distance of each other
+
+    Returns lists of PortfolioImage, largest group first; inside a group
+    the image with the most pixels (then the oldest) comes first as the
+    copy worth keeping.
+    """
+    images = PortfolioImage.query.options(load_only(
+        PortfolioImage.filename, PortfolioImage.title, PortfolioImage.alt_text, PortfolioImage.width,
+        PortfolioImage.height, PortfolioImage.file_size, PortfolioImage.is_published,
+        PortfolioImage.duplicate_of_id, PortfolioImage.perceptual_hash
+    )).filter(PortfolioImage.perceptual_hash.isnot(None)).order_by(PortfolioImage.id).all()
+    tree = BKTree()
+    parent = {}
+
+    def find(image_id):
+        while parent[image_id] != image_id:
+            parent[image_id] = parent[parent[image_id]]
+            image_id = parent[image_id]
+        return image_id
+
+    images = [image for image in images if is_distinctive_hash(image.perceptual_hash)]
+    for image in images:
+        parent[image.id] = image.id
+        for _, match_id in tree.search(image.perceptual_hash, max_distance):
+            parent[find(image.id)] = find(match_id)
+        tree.add(image.perceptual_hash, image.id)
+
+    groups = {}
+    for image in images:
+        groups.setdefault(find(image.id), []).append(image)
+    groups = [
+        sorted(group, key=lambda image: (-(image.width or 0) * (image.height or 0), image.id))
+        for group in groups.values() if len(group) > 1
+    ]
+    return sorted(groups, key=len, reverse=True)
@@ -0,0 +1,146 @@
+import json
+import re
+from datetime import datetime
+
+# PortfolioImage columns filled from EXIF
+EXIF_COLUMNS = (
+    'camera_make', 'camera_model', 'lens', 'date_taken',
+    'focal_length', 'aperture', 'shutter_speed', 'iso',
+    'focal_length_mm', 'f_number', 'exposure_time', 'iso_speed',
+)
+
+# Tags kept in PortfolioImage.exif_data; MakerNote, thumbnails, GPS and the
+# rest are left in the original file and read from there on request
+EXIF_TEXT_TAGS = (
+    'Make', 'Model', 'LensMake', 'LensModel', 'Software', 'Artist', 'Copyright', 'ImageDescription',
+    'DateTimeOriginal', 'DateTimeDigitized', 'DateTime',
+)
+EXIF_NUMBER_TAGS = (
+    'FocalLength', 'FocalLengthIn35mmFilm', 'FNumber', 'ExposureTime', 'ExposureBiasValue',
+    'ISOSpeedRatings', 'PhotographicSensitivity', 'ExposureProgram', 'MeteringMode', 'Flash',
+    'WhiteBalance', 'Orientation',
+)
+
+EXIF_DATETIME_FORMATS = ('%Y:%m:%d %H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y:%m:%d %H:%M', '%Y:%m:%d')
+TEXT_COLUMN_LENGTH = 100
+
+_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+
+def to_number(value):
+    """Convert an EXIF rational, int, tuple or its string form to a float
+
+    Handles PIL IFDRational values, (numerator, denominator) tuples and the
+    strings older imports stored ("2.8", "28/10", "(28, 10)"). Returns None
+    for missing, zero-denominator or unparseable values.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (tuple, list)):
+        if len(value) == 2 and all(isinstance(part, (int, float)) for part in value):
+            return float(value[0]) / value[1] if value[1] else None
+        return to_number(value[0]) if value else None
+    if isinstance(value, str):
+        numbers = _NUMBER.findall(value)
+        if not numbers:
+            return None
+        if len(numbers) == 2 and ('/' in value or value.lstrip().startswith('(')):
+            return float(numbers[0]) / float(numbers[1]) if float(numbers[1]) else None
+        return float(numbers[0])
+    try:
+        number = float(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    # IFDRational(0, 0) converts to nan
+    return None if number != number else number
+
+def parse_exif_datetime(value):
+    """Parse an EXIF "YYYY:MM:DD HH:MM:SS" timestamp, or None"""
+    if not value:
+        return None
+    value = str(value).strip('\x00 ')
+    for date_format in EXIF_DATETIME_FORMATS:
+        try:
+            return datetime.strptime(value[:19], date_format)
+        except ValueError:
+            continue
+    return None
+
+def clean_text(value):
+    """Strip the NUL padding cameras leave in ASCII tags"""
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'ignore')
+    value = str(value).replace('\x00', '').strip()
+    return value[:TEXT_COLUMN_LENGTH] or None
+
+def format_exposure(seconds):
+    """Display form of an exposure time: 1/250 s, 0.8 s or 30 s"""
+    if seconds >= 1 or seconds <= 0:
+        return f'{seconds:g} s'
+    reciprocal = 1 / seconds
+    if abs(reciprocal - round(reciprocal)) < 0.05 * reciprocal:
+        return f'1/{round(reciprocal)} s'
+    return f'{seconds:.2g} s'
+
+def compact_exif(exif):
+    """Whitelisted tags of a {tag name: value} mapping as plain JSON values
+
+    Text is stripped of NUL padding and numbers become int or float, for
+    raw PIL values as well as the stringified values of older imports, so
+    compacting is idempotent.
+    """
+    exif = exif or {}
+    compact = {}
+    for tag in EXIF_TEXT_TAGS:
+        value = clean_text(exif.get(tag))
+        if value:
+            compact[tag] = value
+    for tag in EXIF_NUMBER_TAGS:
+        value = to_number(exif.get(tag))
+        if value is not None:
+            compact[tag] = int(value) if value.is_integer() else value
+    return compact
+
+def dump_exif(exif):
+    """Serialized form of compact_exif(exif) stored in PortfolioImage.exif_data"""
+    return json.dumps(compact_exif(exif), separators=(',', ':'))
+
+def parse_exif_fields(exif):
+    """Typed column values for a {tag name: value} EXIF mapping
+
+    Works on raw PIL values at import time and on the stringified values
+    stored in PortfolioImage.exif_data. Always returns every EXIF_COLUMNS
+    key so the rows of one bulk insert share the same columns.
+    """
+    exif = exif or {}
+    fields = dict.fromkeys(EXIF_COLUMNS)
+
+    fields['camera_make'] = clean_text(exif.get('Make'))
+    fields['camera_model'] = clean_text(exif.get('Model'))
+    fields['lens'] = clean_text(exif.get('LensModel'))
+    fields['date_taken'] = (parse_exif_datetime(exif.get('DateTimeOriginal'))
+                            or parse_exif_datetime(exif.get('DateTimeDigitized'))
+                            or parse_exif_datetime(exif.get('DateTime')))
+
+    focal_length = to_number(exif.get('FocalLength'))
+    if focal_length and focal_length > 0:
+        fields['focal_length_mm'] = round(focal_length, 1)
+        fields['focal_length'] = f'{focal_length:g} mm'
+
+    f_number = to_number(exif.get('FNumber'))
+    if f_number and f_number > 0:
+        fields['f_number'] = round(f_number, 1)
+        fields['aperture'] = f'f/{round(f_number, 1):g}'
+
+    exposure_time = to_number(exif.get('ExposureTime'))
+    if exposure_time and exposure_time > 0:
+        fields['exposure_time'] = exposure_time
+        fields['shutter_speed'] = format_exposure(exposure_time)
+
+    iso = to_number(exif.get('ISOSpeedRatings', exif.get('PhotographicSensitivity')))
+    if iso and iso > 0:
+        fields['iso_speed'] = int(iso)
+        fields['iso'] = str(int(iso))
+
+    return fields
@@ -0,0 +1,174 @@
+import mimetypes
+import os
+import re
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import quote
+from flask import Response, abort, request, send_file
+from werkzeug.http import http_date, is_resource_modified
+from werkzeug.security import safe_join
+
+# Vite emits bundle files as <name>-<8 character hash>.<ext>; their content never changes
+FINGERPRINTED_ASSET = re.compile(r'(^|/)assets/[^/]+-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$')
+ONE_YEAR = 365 * 24 * 3600
+RANGE_CHUNK_SIZE = 256 * 1024
+
+def file_etag(stat):
+    """Strong ETag derived from the file identity (inode, size, mtime)"""
+    return f'{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}'
+
+def send_cached_file(path, mimetype=None, max_age=None, immutable=False, revalidate=False, etag=None):
+    """Send a file with a strong ETag and Cache-Control headers
+
+    Conditional requests (If-None-Match / If-Modified-Since) are answered
+    with 304 Not Modified by werkzeug. Use max_age for the freshness
+    lifetime, immutable for content-hashed URLs and revalidate for files
+    that must be checked with the server on every use. etag overrides the
+    stat based ETag for files whose name already identifies their content.
+
+    Single byte ranges get a 206 from werkzeug; requests for several ranges
+    are answered with multipart/byteranges. Full responses go through the
+    server's wsgi.file_wrapper, which lets gunicorn use sendfile().
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        abort(404)
+
+    etag = etag or file_etag(stat)
+    ranges = request.range
+    if ranges and len(ranges.ranges) > 1:
+        if _range_applies(etag, stat):
+            response = multipart_range_response(path, stat, ranges, mimetype, etag)
+            _apply_cache_control(response, max_age, immutable, revalidate)
+            return response
+        # werkzeug rejects multiple ranges with 416 even where a 304 or 200 is due
+        request.environ.pop('HTTP_RANGE', None)
+
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        etag=etag,
+        last_modified=stat.st_mtime,
+        max_age=None if revalidate else max_age
+    )
+    _apply_cache_control(response, max_age, immutable, revalidate)
+    return response
+
+def _apply_cache_control(response, max_age, immutable, revalidate):
+    if revalidate:
+        response.cache_control.no_cache = True
+    else:
+        if max_age is not None:
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+        if immutable:
+            response.cache_control.immutable = True
+
+def _range_applies(etag, stat):
+    """Whether a Range header should be honoured instead of sending a 304 or the full file"""
+    last_modified = datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return False
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range.strip() not in (f'"{etag}"', http_date(last_modified)):
+        return False
+    return True
+
+def multipart_range_response(path, stat, ranges, mimetype, etag):
+    """Build a 206 multipart/byteranges response for several byte ranges"""
+    size = stat.st_size
+    mimetype = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    spans = []
+    for start, stop in ranges.ranges:
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        else:
+            stop = min(stop if stop is not None else size, size)
+        if start < stop:
+            spans.append((start, stop))
+
+    if not spans:
+        response = Response(status=416)
+        response.headers['Content-Range'] = f'bytes */{size}'
+        return response
+
+    boundary = uuid.uuid4().hex
+    headers = [
+        (f'--{boundary}\r\nContent-Type: {mimetype}\r\n'
+         f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n').encode('latin-1')
+        for start, stop in spans
+    ]
+    closing = f'--{boundary}--\r\n'.encode('latin-1')
+    length = sum(len(header) + (stop - start) + 2 for header, (start, stop) in zip(headers, spans)) + len(closing)
+
+    def generate():
+        with open(path, 'rb') as f:
+            for header, (start, stop) in zip(headers, spans):
+                yield header
+                f.seek(start)
+                remaining = stop - start
+                while remaining > 0:
+                    chunk = f.read(min(RANGE_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+                yield b'\r\n'
+        yield closing
+
+    response = Response(generate(), status=206, mimetype=f'multipart/byteranges; boundary={boundary}')
+    response.content_length = length
+    response.set_etag(etag)
+    response.last_modified = stat.st_mtime
+    response.accept_ranges = 'bytes'
+    return response
+
+def send_data_file(data_dir, filename, max_age=None, sendfile_mode=None, accel_prefix='/internal-data/'):
+    """Send an original from the data volume, optionally offloading it to a front proxy
+
+    sendfile_mode 'x-accel' answers with an X-Accel-Redirect to
+    accel_prefix + filename (nginx internal location) and 'x-sendfile'
+    with an X-Sendfile header carrying the absolute path (Apache, lighttpd).
+    The proxy then streams the bytes and handles ranges itself, while
+    validators and 304s are still produced here.
+    """
+    path = safe_join(data_dir, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    if sendfile_mode not in ('x-accel', 'x-sendfile'):
+        return send_cached_file(path, max_age=max_age)
+
+    stat = os.stat(path)
+    response = Response(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+    if sendfile_mode == 'x-accel':
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(filename)
+    else:
+        response.headers['X-Sendfile'] = path
+    response.set_etag(file_etag(stat))
+    response.last_modified = stat.st_mtime
+    response.accept_ranges = 'bytes'
+    _apply_cache_control(response, max_age, immutable=False, revalidate=False)
+    # Only turns the response into a 304 when the validators match
+    return response.make_conditional(request.environ)
+
+def send_cached_from_directory(directory, filename, **kwargs):
+    """send_cached_file() for a path inside directory, refusing path traversal"""
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    return send_cached_file(path, **kwargs)
+
+def send_static_file(static_folder, filename, max_age):
+    """Send a frontend file with a cache policy matching how it is built
+
+    Fingerprinted Vite bundles are cached for a year as immutable,
+    index.html is always revalidated so new deploys are picked up, and
+    everything else gets max_age.
+    """
+    if filename == 'index.html':
+        return send_cached_from_directory(static_folder, filename, revalidate=True)
+    if FINGERPRINTED_ASSET.search(filename):
+        return send_cached_from_directory(static_folder, filename, max_age=ONE_YEAR, immutable=True)
+    return send_cached_from_directory(static_folder, filename, max_age=max_age)
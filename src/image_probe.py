@@ -0,0 +1,215 @@
+import struct
+from PIL import Image
+from PIL.ExifTags import TAGS
+
+# Start of frame markers carry the dimensions; C4 (DHT), C8 (JPG) and CC (DAC) share the range
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Markers without a length field
+JPEG_STANDALONE_MARKERS = {0x01, 0xD8} | set(range(0xD0, 0xD8))
+EXIF_HEADER = b'Exif\x00\x00'
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+WEBP_VP8X_EXIF_FLAG = 0x08
+
+# IFD0 tags of a TIFF that describe its pixel data rather than the photo
+TIFF_STRUCTURE_TAGS = {
+    254, 255, 256, 257, 258, 259, 262, 266, 273, 277, 278, 279, 280, 281, 284,
+    317, 320, 322, 323, 324, 325, 330, 338, 339, 340, 341, 347, 530, 531, 532,
+    700, 33723, 34377, 34675,
+}
+
+ORIENTATION_TAG = 274
+# Orientations that turn the stored pixels by 90 degrees, so the image shows as height x width
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+def probe_image(file_path):
+    """Read format, dimensions, orientation and raw EXIF of an image file
+
+    Only the container headers are read: JPEG markers up to the start of
+    frame, PNG chunk headers, WebP RIFF chunks and TIFF IFD0, which is a
+    few kilobytes for most files. Formats without a header parser, and
+    headers that cannot be parsed, fall back to PIL. Returns a dict with
+    format, width, height, orientation (1 when missing) and exif, the
+    TIFF-structured EXIF block as bytes or None.
+    """
+    with open(file_path, 'rb') as fp:
+        head = fp.read(16)
+        fp.seek(0)
+        try:
+            if head[:3] == b'\xff\xd8\xff':
+                result = probe_jpeg(fp)
+            elif head[:8] == PNG_SIGNATURE:
+                result = probe_png(fp)
+            elif head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+                result = probe_webp(fp)
+            elif head[:4] in (b'II*\x00', b'MM\x00*'):
+                result = probe_tiff(fp)
+            else:
+                result = None
+        except (struct.error, EOFError, SyntaxError, ValueError):
+            result = None
+
+    if result is None or not result['width'] or not result['height']:
+        return probe_with_pil(file_path)
+    result['orientation'] = exif_orientation(result['exif'])
+    return result
+
+def read_exact(fp, size):
+    data = fp.read(size)
+    if len(data) != size:
+        raise EOFError('file ends inside a header')
+    return data
+
+def probe_jpeg(fp):
+    fp.seek(2)
+    exif = None
+    while True:
+        if read_exact(fp, 1) != b'\xff':
+            return None
+        marker = read_exact(fp, 1)[0]
+        while marker == 0xFF:  # fill bytes
+            marker = read_exact(fp, 1)[0]
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        if marker in (0xD9, 0xDA):  # end of image or start of scan before any frame header
+            return None
+
+        length, = struct.unpack('>H', read_exact(fp, 2))
+        if length < 2:
+            return None
+        if marker in JPEG_SOF_MARKERS:
+            precision, height, width = struct.unpack('>BHH', read_exact(fp, 5))
+            return {'format': 'JPEG', 'width': width, 'height': height, 'exif': exif}
+        if marker == 0xE1 and exif is None:
+            segment = read_exact(fp, length - 2)
+            if segment.startswith(EXIF_HEADER):
+                exif = segment[len(EXIF_HEADER):]
+        else:
+            fp.seek(length - 2, 1)
+
+def probe_png(fp):
+    fp.seek(len(PNG_SIGNATURE))
+    length, chunk_type = struct.unpack('>I4s', read_exact(fp, 8))
+    if chunk_type != b'IHDR':
+        return None
+    width, height = struct.unpack('>II', read_exact(fp, 8))
+    fp.seek(length - 8 + 4, 1)  # rest of IHDR and its CRC
+
+    # eXIf is allowed after the image data, so IDAT chunks are seeked over rather than stopping there
+    exif = None
+    while True:
+        header = fp.read(8)
+        if len(header) < 8:
+            break
+        length, chunk_type = struct.unpack('>I4s', header)
+        if chunk_type == b'IEND':
+            break
+        if chunk_type == b'eXIf':
+            exif = read_exact(fp, length)
+            if exif.startswith(EXIF_HEADER):
+                exif = exif[len(EXIF_HEADER):]
+            break
+        fp.seek(length + 4, 1)
+    return {'format': 'PNG', 'width': width, 'height': height, 'exif': exif}
+
+def probe_webp(fp):
+    fp.seek(12)
+    chunk_type, length = struct.unpack('<4sI', read_exact(fp, 8))
+    if chunk_type == b'VP8 ':
+        frame = read_exact(fp, 10)
+        if frame[3:6] != b'\x9d\x01\x2a':
+            return None
+        width, height = struct.unpack('<HH', frame[6:10])
+        return {'format': 'WEBP', 'width': width & 0x3FFF, 'height': height & 0x3FFF, 'exif': None}
+    if chunk_type == b'VP8L':
+        signature, bits = struct.unpack('<BI', read_exact(fp, 5))
+        if signature != 0x2F:
+            return None
+        return {'format': 'WEBP', 'width': (bits & 0x3FFF) + 1, 'height': ((bits >> 14) & 0x3FFF) + 1, 'exif': None}
+    if chunk_type != b'VP8X':
+        return None
+
+    flags, width, height = struct.unpack('<B3x3s3s', read_exact(fp, 10))
+    result = {
+        'format': 'WEBP',
+        'width': int.from_bytes(width, 'little') + 1,
+        'height': int.from_bytes(height, 'little') + 1,
+        'exif': None
+    }
+    if not flags & WEBP_VP8X_EXIF_FLAG:
+        return result
+
+    # The EXIF chunk follows the image data; chunks are padded to an even length
+    fp.seek(length - 10 + (length & 1), 1)
+    while True:
+        header = fp.read(8)
+        if len(header) < 8:
+            return result
+        chunk_type, length = struct.unpack('<4sI', header)
+        if chunk_type == b'EXIF':
+            exif = read_exact(fp, length)
+            result['exif'] = exif[len(EXIF_HEADER):] if exif.startswith(EXIF_HEADER) else exif
+            return result
+        fp.seek(length + (length & 1), 1)
+
+def probe_tiff(fp):
+    # IFD0 of a TIFF is the EXIF IFD0, so PIL's EXIF reader can load it straight from the file
+    exif = Image.Exif()
+    exif.load_from_fp(fp)
+    width, height = exif.get(256), exif.get(257)
+    if not isinstance(width, int) or not isinstance(height, int):
+        return None
+
+    for tag in TIFF_STRUCTURE_TAGS & set(exif):
+        del exif[tag]
+    try:
+        # Serialized while the file is open, as nested IFDs are read from it
+        raw = exif.tobytes()[len(EXIF_HEADER):] if len(exif) else None
+    except (struct.error, TypeError, ValueError):
+        raw = None
+    return {'format': 'TIFF', 'width': width, 'height': height, 'exif': raw}
+
+def probe_with_pil(file_path):
+    """Fallback for formats and files the header parsers do not handle"""
+    with Image.open(file_path) as img:
+        width, height = img.size
+        raw = img.info.get('exif')
+        if not isinstance(raw, bytes):
+            exif = img.getexif()
+            raw = exif.tobytes() if len(exif) else None
+    if raw and raw.startswith(EXIF_HEADER):
+        raw = raw[len(EXIF_HEADER):]
+    return {
+        'format': img.format,
+        'width': width,
+        'height': height,
+        'exif': raw or None,
+        'orientation': exif_orientation(raw)
+    }
+
+def load_exif(raw):
+    exif = Image.Exif()
+    if raw:
+        exif.load(raw)
+    return exif
+
+def exif_orientation(raw):
+    """Orientation tag (1-8) of raw EXIF bytes, 1 when missing or invalid"""
+    try:
+        orientation = load_exif(raw).get(ORIENTATION_TAG, 1)
+    except (struct.error, SyntaxError, ValueError, OSError):
+        return 1
+    return orientation if isinstance(orientation, int) and 1 <= orientation <= 8 else 1
+
+def displayed_size(probe):
+    """(width, height) of a probed image as it is displayed, after its EXIF orientation"""
+    if probe['orientation'] in TRANSPOSED_ORIENTATIONS:
+        return probe['height'], probe['width']
+    return probe['width'], probe['height']
+
+def exif_tags(raw):
+    """EXIF tags of raw EXIF bytes by name, merged like PIL's _getexif()"""
+    try:
+        tags = load_exif(raw)._get_merged_dict()
+    except (struct.error, SyntaxError, ValueError, OSError):
+        return {}
+    return {TAGS.get(tag_id, tag_id): value for tag_id, value in tags.items()}
@@ -0,0 +1,138 @@
+import json
+import threading
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from models.portfolio import db, ImportJob
+from admin_tools import import_images_from_data
+
+# A running job whose updated_at has not moved for this long is assumed to
+# have died with its worker process.
+STALE_JOB_AFTER = timedelta(minutes=10)
+# How often a running job touches updated_at, whatever its batches are doing
+HEARTBEAT_INTERVAL = 60
+
+def claim_import_job(full=False):
+    """Insert a running ImportJob and return it, or None if another import is running
+    
+    The unique index on running jobs makes the insert itself the lock, so
+    of two concurrent callers only one gets a job. Running jobs that have
+    gone stale are failed first, in the same transaction.
+    """
+    now = datetime.utcnow()
+    ImportJob.query.filter(
+        ImportJob.status == 'running',
+        or_(ImportJob.updated_at.is_(None), ImportJob.updated_at < now - STALE_JOB_AFTER)
+    ).update({
+        ImportJob.status: 'failed',
+        ImportJob.error: 'Import stopped responding',
+        ImportJob.finished_at: now
+    }, synchronize_session=False)
+    
+    job = ImportJob(id=uuid.uuid4().hex, status='running', full_rescan=full)
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return None
+    return job
+
+def start_import_job(app, full=False):
+    """Start an import in a background thread and return its ImportJob
+    
+    Only one import runs at a time; if one is already running, that job is
+    returned instead of starting a new one.
+    """
+    job = claim_import_job(full)
+    if job is None:
+        running = ImportJob.query.filter_by(status='running').first()
+        if running:
+            return running
+        # The running job finished between the insert and this query
+        job = claim_import_job(full)
+        if job is None:
+            raise RuntimeError('Another import is starting')
+    
+    thread = threading.Thread(
+        target=run_import_job,
+        args=(app, job.id, full),
+        name=f'import-{job.id}',
+        daemon=True
+    )
+    thread.start()
+    return job
+
+def run_import_job(app, job_id, full=False, paths=None):
+    """Run an import and record its progress on the ImportJob row
+    
+    A heartbeat thread keeps updated_at current while it runs, so a batch
+    that takes longer than STALE_JOB_AFTER does not release the lock.
+    """
+    stop_heartbeat = threading.Event()
+    heartbeat = threading.Thread(
+        target=_heartbeat,
+        args=(app, job_id, stop_heartbeat),
+        name=f'import-{job_id}-heartbeat',
+        daemon=True
+    )
+    heartbeat.start()
+    
+    try:
+        with app.app_context():
+            def progress(stats):
+                job = db.session.get(ImportJob, job_id)
+                job.found = stats['found']
+                job.processed = stats['processed']
+                job.imported = stats['imported']
+                job.updated = stats['updated']
+                job.skipped = stats['skipped']
+                job.failed = stats['failed']
+                job.deleted = stats['deleted']
+                job.duplicates = stats['duplicates']
+                job.errors = json.dumps(stats['errors'])
+                db.session.commit()
+            
+            try:
+                result = import_images_from_data(full, progress=progress, paths=paths)
+                status = 'completed' if result['success'] else 'failed'
+                error = result.get('error')
+            except Exception as e:
+                db.session.rollback()
+                status = 'failed'
+                error = str(e)
+            
+            job = db.session.get(ImportJob, job_id)
+            job.status = status
+            job.error = error
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+    finally:
+        stop_heartbeat.set()
+        heartbeat.join()
+
+def _heartbeat(app, job_id, stop_event):
+    """Touch the running job's updated_at every HEARTBEAT_INTERVAL until stop_event is set"""
+    with app.app_context():
+        while not stop_event.wait(HEARTBEAT_INTERVAL):
+            try:
+                ImportJob.query.filter_by(id=job_id, status='running').update(
+                    {ImportJob.updated_at: datetime.utcnow()}, synchronize_session=False
+                )
+                db.session.commit()
+            except SQLAlchemyError as e:
+                # The import may hold the write lock for longer than busy_timeout; try again next time
+                db.session.rollback()
+                app.logger.warning('Import job %s heartbeat failed: %s', job_id, e)
+
+def active_import_job():
+    """Return the running ImportJob that is still reporting progress, or None"""
+    running = ImportJob.query.filter_by(status='running').order_by(ImportJob.started_at.desc()).first()
+    if running and running.updated_at and datetime.utcnow() - running.updated_at < STALE_JOB_AFTER:
+        return running
+    return None
+
+def get_import_job(job_id):
+    """Return the ImportJob with the given id, or None"""
+    return db.session.get(ImportJob, job_id)
@@ -0,0 +1,310 @@
+import bisect
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import Response, current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the SQL statements per request histogram
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 500)
+METRIC_PREFIX = 'fifth_element_'
+
+# Request argument that profiles a single request when INSTRUMENTATION_PROFILING is on
+PROFILE_ARG = '_profile'
+DEFAULT_PROFILE_INTERVAL = 0.001
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+class CounterMetric:
+    """Monotonic counter per label combination"""
+    
+    kind = 'counter'
+    
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+    
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+    
+    def samples(self):
+        for label_values, value in sorted(self.values().items()):
+            yield f'{self.name}{format_labels(self.labels, label_values)} {value}'
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label combination"""
+    
+    kind = 'histogram'
+    
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+    
+    def samples(self):
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        bucket_labels = self.labels + ('le',)
+        for label_values, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{format_labels(bucket_labels, label_values + (bound,))} {cumulative}'
+            yield f'{self.name}_sum{format_labels(self.labels, label_values)} {total}'
+            yield f'{self.name}_count{format_labels(self.labels, label_values)} {count}'
+
+class MetricsRegistry:
+    """Metrics of this process, rendered in the Prometheus text format
+    
+    Every worker keeps its own registry, so with several workers each
+    scrape of /metrics reports the worker that answered it.
+    """
+    
+    def __init__(self):
+        self.request_duration = Histogram(
+            METRIC_PREFIX + 'http_request_duration_seconds', 'Time spent handling requests',
+            ('endpoint', 'method', 'status')
+        )
+        self.request_queries = Histogram(
+            METRIC_PREFIX + 'http_request_sql_queries', 'SQL statements executed per request',
+            ('endpoint',), QUERY_COUNT_BUCKETS
+        )
+        self.sql_duration = Histogram(
+            METRIC_PREFIX + 'sql_query_duration_seconds', 'Time spent executing SQL statements', ('statement',)
+        )
+        self.pil_duration = Histogram(
+            METRIC_PREFIX + 'pil_operation_duration_seconds', 'Time spent decoding, resizing and encoding images',
+            ('operation',)
+        )
+        self.cache_requests = CounterMetric(
+            METRIC_PREFIX + 'cache_requests_total', 'Cache lookups by cache and result', ('cache', 'result')
+        )
+        self.metrics = [self.request_duration, self.request_queries, self.sql_duration, self.pil_duration, self.cache_requests]
+    
+    def cache_hit_ratios(self):
+        """{cache: hits / lookups} from cache_requests"""
+        lookups, hits = {}, {}
+        for (cache, result), value in self.cache_requests.values().items():
+            lookups[cache] = lookups.get(cache, 0) + value
+            if result == 'hit':
+                hits[cache] = hits.get(cache, 0) + value
+        return {cache: hits.get(cache, 0) / total for cache, total in lookups.items() if total}
+    
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        
+        name = METRIC_PREFIX + 'cache_hit_ratio'
+        lines.append(f'# HELP {name} Share of cache lookups that were hits since the worker started')
+        lines.append(f'# TYPE {name} gauge')
+        for cache, ratio in sorted(self.cache_hit_ratios().items()):
+            lines.append(f'{name}{format_labels(("cache",), (cache,))} {ratio:.4f}')
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+_enabled = False
+
+class RequestTiming:
+    """Time spent in SQL and PIL during one request, for the Server-Timing header"""
+    __slots__ = ('started', 'sql_count', 'sql_seconds', 'pil_seconds')
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.pil_seconds = 0.0
+    
+    def server_timing(self):
+        total = (time.perf_counter() - self.started) * 1000
+        parts = [f'app;dur={total:.1f}', f'db;dur={self.sql_seconds * 1000:.1f};desc="{self.sql_count} queries"']
+        if self.pil_seconds:
+            parts.append(f'pil;dur={self.pil_seconds * 1000:.1f}')
+        return ', '.join(parts)
+
+_current_timing = ContextVar('request_timing', default=None)
+
+@contextmanager
+def timed(operation):
+    """Record the duration of a PIL operation (decode, resize, encode ...) when instrumentation is on"""
+    if not _enabled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.pil_duration.observe(elapsed, operation)
+        timing = _current_timing.get()
+        if timing is not None:
+            timing.pil_seconds += elapsed
+
+def record_cache(cache, result):
+    """Count a lookup in one of the caches; result is 'hit' or 'miss'"""
+    if _enabled:
+        metrics.cache_requests.inc(cache, result)
+
+def _statement_kind(statement):
+    words = statement.lstrip().split(None, 1)
+    kind = words[0].upper() if words else ''
+    return kind if kind in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH') else 'OTHER'
+
+def _before_sql(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+def _after_sql(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    elapsed = time.perf_counter() - started
+    metrics.sql_duration.observe(elapsed, _statement_kind(statement))
+    timing = _current_timing.get()
+    if timing is not None:
+        timing.sql_count += 1
+        timing.sql_seconds += elapsed
+
+def _endpoint_label():
+    # Unmatched URLs share one label so 404 scans cannot add series
+    return request.endpoint or 'unmatched'
+
+class SamplingProfiler:
+    """Samples the stack of one thread from a background thread
+    
+    Stacks are collected every interval seconds with sys._current_frames()
+    and reported in the collapsed format read by flamegraph.pl and
+    speedscope: one 'outer;inner count' line per distinct stack.
+    """
+    
+    def __init__(self, thread_id, interval=DEFAULT_PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+    
+    def start(self):
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+    
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]))
+
+def _start_request():
+    g.request_timing = RequestTiming()
+    _current_timing.set(g.request_timing)
+    if current_app.config.get('INSTRUMENTATION_PROFILING') and request.args.get(PROFILE_ARG):
+        interval = current_app.config.get('PROFILE_INTERVAL', DEFAULT_PROFILE_INTERVAL)
+        g.request_profiler = SamplingProfiler(threading.get_ident(), interval).start()
+
+def _finish_request(response):
+    timing = g.pop('request_timing', None)
+    if timing is None:
+        return response
+    _current_timing.set(None)
+    endpoint = _endpoint_label()
+    metrics.request_duration.observe(
+        time.perf_counter() - timing.started, endpoint, request.method, response.status_code
+    )
+    metrics.request_queries.observe(timing.sql_count, endpoint)
+    response.headers['Server-Timing'] = timing.server_timing()
+    
+    profiler = g.pop('request_profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        # The profile replaces the body; the original status is kept in a header
+        profiled = Response(profiler.collapsed(), mimetype='text/plain')
+        profiled.headers['Server-Timing'] = response.headers['Server-Timing']
+        profiled.headers['X-Profile-Samples'] = str(profiler.samples)
+        profiled.headers['X-Profiled-Status'] = str(response.status_code)
+        return profiled
+    return response
+
+def _abort_request(error):
+    # after_request is skipped for unhandled exceptions, which are recorded here as 500s
+    timing = g.pop('request_timing', None)
+    if timing is not None:
+        _current_timing.set(None)
+        metrics.request_duration.observe(time.perf_counter() - timing.started, _endpoint_label(), request.method, 500)
+        metrics.request_queries.observe(timing.sql_count, _endpoint_label())
+    profiler = g.pop('request_profiler', None)
+    if profiler is not None:
+        profiler.stop()
+
+def init_instrumentation(app):
+    """Record request, SQL, PIL and cache metrics for app
+    
+    Adds a Server-Timing header (total, SQL and PIL time) to every response
+    and, with INSTRUMENTATION_PROFILING on, returns a sampled profile of the
+    request instead of its body when it carries ?_profile=1. The metrics are
+    rendered by render_metrics() for the /metrics endpoint.
+    """
+    global _enabled
+    if _enabled:
+        return
+    _enabled = True
+    event.listen(Engine, 'before_cursor_execute', _before_sql)
+    event.listen(Engine, 'after_cursor_execute', _after_sql)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_abort_request)
+
+def instrumentation_enabled():
+    return _enabled
+
+def render_metrics():
+    """All metrics of this process in the Prometheus text exposition format"""
+    return metrics.render()
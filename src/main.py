@@ -3,16 +3,21 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory, request, jsonify, render_template, redirect, url_for
+from flask import Flask, send_from_directory, request, jsonify, render_template, redirect, url_for, abort
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from PIL import Image
 from PIL.ExifTags import TAGS
 import json
+import click
 from datetime import datetime
 
 # Import models
-from models.portfolio import db, Category, PortfolioImage, FeaturedImage
+from sqlalchemy.orm import joinedload, load_only
+from models.portfolio import db, Category, PortfolioImage, FeaturedImage, category_image_counts, upgrade_schema
+from api_cache import cached_response, invalidate_api_cache
+from db_setup import init_database, read_only
+from instrumentation import init_instrumentation, instrumentation_enabled, render_metrics
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
@@ -20,16 +25,77 @@ app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
 # Database configuration
 database_dir = os.path.join(os.path.dirname(__file__), 'database')
 os.makedirs(database_dir, exist_ok=True)
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(database_dir, 'app.db')}"
+app.config['DATABASE_PATH'] = os.environ.get('DATABASE_PATH', os.path.join(database_dir, 'app.db'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 10))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+
+# Import configuration
+app.config['IMPORT_WORKERS'] = int(os.environ.get('IMPORT_WORKERS', os.cpu_count() or 1))
+app.config['IMPORT_EXECUTOR'] = os.environ.get('IMPORT_EXECUTOR', 'thread')  # 'thread' or 'process'
+app.config['IMPORT_BATCH_SIZE'] = int(os.environ.get('IMPORT_BATCH_SIZE', 500))
+# Near-duplicate detection: max differing perceptual hash bits, and 'flag' or 'unpublish' for new duplicates
+app.config['DUPLICATE_MAX_DISTANCE'] = int(os.environ.get('DUPLICATE_MAX_DISTANCE', 6))
+app.config['IMPORT_DUPLICATE_ACTION'] = os.environ.get('IMPORT_DUPLICATE_ACTION', 'flag')
+# Groups of copies per page of the /admin/duplicates report
+app.config['DUPLICATE_GROUPS_PER_PAGE'] = int(os.environ.get('DUPLICATE_GROUPS_PER_PAGE', 50))
+# Perceptual hashes and BlurHash/dominant color placeholders share one reduced-scale decode per image;
+# with both off imports only read file headers (fill them later with `flask hash-images` / `flask placeholders`)
+app.config['IMPORT_PERCEPTUAL_HASH'] = os.environ.get('IMPORT_PERCEPTUAL_HASH', '1') == '1'
+app.config['IMPORT_PLACEHOLDERS'] = os.environ.get('IMPORT_PLACEHOLDERS', '1') == '1'
+
+# Images per page of the admin portfolio grid
+app.config['ADMIN_PAGE_SIZE'] = int(os.environ.get('ADMIN_PAGE_SIZE', 60))
+
+# Import new files from /data automatically: inotify where available, otherwise polling
+app.config['WATCH_DATA_DIR'] = os.environ.get('WATCH_DATA_DIR', '0') == '1'
+app.config['WATCH_BACKEND'] = os.environ.get('WATCH_BACKEND', 'auto')  # 'auto', 'inotify' or 'poll'
+app.config['WATCH_DEBOUNCE_SECONDS'] = float(os.environ.get('WATCH_DEBOUNCE_SECONDS', 2.0))
+app.config['WATCH_POLL_INTERVAL'] = float(os.environ.get('WATCH_POLL_INTERVAL', 5.0))
+
+# Resized image (derivative) cache
+app.config['DERIVATIVE_CACHE_DIR'] = os.environ.get('DERIVATIVE_CACHE_DIR')  # defaults to /data/.cache/derivatives
+app.config['DERIVATIVE_CACHE_MAX_BYTES'] = int(os.environ.get('DERIVATIVE_CACHE_MAX_MB', 2048)) * 1024 * 1024
+# Render the preset widths of every imported image in the background; srcset only lists rendered widths
+app.config['PREGENERATE_DERIVATIVES'] = os.environ.get('PREGENERATE_DERIVATIVES', '1') == '1'
+app.config['DERIVATIVE_WORKERS'] = int(os.environ.get('DERIVATIVE_WORKERS', 2))
+
+# HTTP caching (seconds browsers may reuse a response without revalidating)
+app.config['DATA_MAX_AGE'] = int(os.environ.get('DATA_MAX_AGE', 86400))
+app.config['STATIC_MAX_AGE'] = int(os.environ.get('STATIC_MAX_AGE', 3600))
+
+# Let a front proxy send /data originals: '' (serve from Python), 'x-accel' (nginx) or 'x-sendfile'
+app.config['DATA_SENDFILE_MODE'] = os.environ.get('DATA_SENDFILE_MODE', '')
+app.config['DATA_ACCEL_PREFIX'] = os.environ.get('DATA_ACCEL_PREFIX', '/internal-data/')
+
+# Cache backend shared by all workers: memory://, sqlite:///path/to/cache.db or redis://host:port/0
+app.config['CACHE_BACKEND_URL'] = os.environ.get('CACHE_BACKEND_URL', f"sqlite:///{os.path.join(database_dir, 'cache.db')}")
+app.config['CACHE_BACKEND_MAX_BYTES'] = int(os.environ.get('CACHE_BACKEND_MAX_MB', 256)) * 1024 * 1024
+# Seconds before a worker notices an invalidation made by another worker
+app.config['CACHE_SYNC_INTERVAL'] = float(os.environ.get('CACHE_SYNC_INTERVAL', 1.0))
+
+# Public API response cache, emptied whenever the admin changes the portfolio
+app.config['API_CACHE_ENABLED'] = os.environ.get('API_CACHE_ENABLED', '1') == '1'
+app.config['API_CACHE_MAX_BYTES'] = int(os.environ.get('API_CACHE_MAX_MB', 16)) * 1024 * 1024
+
+# Request latency, SQL, PIL and cache metrics on /metrics plus a Server-Timing header on every response
+app.config['INSTRUMENTATION_ENABLED'] = os.environ.get('INSTRUMENTATION_ENABLED', '0') == '1'
+# Answer requests carrying ?_profile=1 with a sampled profile of the request (collapsed stacks)
+app.config['INSTRUMENTATION_PROFILING'] = os.environ.get('INSTRUMENTATION_PROFILING', '0') == '1'
+app.config['PROFILE_INTERVAL'] = float(os.environ.get('PROFILE_INTERVAL_MS', 1)) / 1000
 
 # Initialize database
-db.init_app(app)
+init_database(app, app.config['DATABASE_PATH'])
+if app.config['INSTRUMENTATION_ENABLED']:
+    init_instrumentation(app)
 CORS(app)
 
 # Create tables and default data
 with app.app_context():
     db.create_all()
+    upgrade_schema()
+    from search import install_search_index
+    app.config['SEARCH_FTS_ENABLED'] = install_search_index()
     
     # Create default categories if none exist
     if Category.query.count() == 0:
@@ -48,32 +114,115 @@ with app.app_context():
         db.session.commit()
         print("Default categories created")
 
+_watcher_started = False
+
+@app.before_request
+def start_data_watcher():
+    """Start the /data watcher with the first request, so CLI commands never run it"""
+    global _watcher_started
+    if app.config['WATCH_DATA_DIR'] and not _watcher_started:
+        _watcher_started = True
+        from data_watcher import start_watcher
+        start_watcher(app)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics of this worker, when instrumentation is enabled"""
+    if not instrumentation_enabled():
+        abort(404)
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 # Data volume routes
 @app.route('/data/<path:filename>')
 def serve_data_file(filename):
     """Serve files from the /data volume"""
-    return send_from_directory('/data', filename)
+    from admin_tools import DATA_DIR
+    from http_cache import send_data_file
+    return send_data_file(
+        DATA_DIR,
+        filename,
+        max_age=app.config['DATA_MAX_AGE'],
+        sendfile_mode=app.config['DATA_SENDFILE_MODE'],
+        accel_prefix=app.config['DATA_ACCEL_PREFIX']
+    )
+
+@app.route('/img/<int:width>/<path:filename>')
+def serve_derivative(width, filename):
+    """Serve a resized copy of a file from the /data volume
+    
+    The width snaps to the nearest preset and the format (AVIF, WebP or
+    JPEG) follows the Accept header.
+    """
+    from derivatives import get_derivative
+    derivative = get_derivative(filename, width, request.headers.get('Accept', ''))
+    if derivative is None:
+        abort(404)
+    
+    from http_cache import send_cached_file
+    path, mimetype = derivative
+    # Cache file names are content addressed, and their mtime moves on LRU touches
+    response = send_cached_file(
+        path,
+        mimetype=mimetype,
+        max_age=app.config['DATA_MAX_AGE'],
+        etag=os.path.splitext(os.path.basename(path))[0]
+    )
+    response.vary.add('Accept')
+    return response
 
 # API Routes for Portfolio
 @app.route('/api/categories')
+@cached_response
+@read_only
 def get_categories():
     """Get all active categories"""
     categories = Category.query.filter_by(is_active=True).order_by(Category.display_order).all()
-    return jsonify([cat.to_dict() for cat in categories])
+    image_counts = category_image_counts()
+    return jsonify([cat.to_dict(image_count=image_counts.get(cat.id, 0)) for cat in categories])
 
 @app.route('/api/portfolio')
+@cached_response
+@read_only
 def get_portfolio():
-    """Get portfolio images with optional category filtering"""
+    """Get portfolio images with optional category filtering
+    
+    Pass cursor (empty for the first page) to page with keyset cursors
+    instead of page numbers; the total is then only counted when
+    include_total=1 is given.
+    """
     category_id = request.args.get('category_id', type=int)
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 12, type=int)
+    cursor = request.args.get('cursor')
+    
+    if cursor is not None:
+        from pagination import MAX_PAGE_SIZE, keyset_page
+        filters = [PortfolioImage.is_published == True]
+        if category_id:
+            filters.append(PortfolioImage.category_id == category_id)
+        
+        per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+        try:
+            images, next_cursor = keyset_page(filters, cursor, per_page)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        result = {
+            'images': [img.to_dict() for img in images],
+            'next_cursor': next_cursor,
+            'has_next': next_cursor is not None,
+            'per_page': per_page
+        }
+        if request.args.get('include_total', type=int) == 1:
+            result['total'] = PortfolioImage.query.filter(*filters).count()
+        return jsonify(result)
     
-    query = PortfolioImage.query.filter_by(is_published=True)
+    query = PortfolioImage.query.options(joinedload(PortfolioImage.category)).filter_by(is_published=True)
     
     if category_id:
         query = query.filter_by(category_id=category_id)
     
-    query = query.order_by(PortfolioImage.display_order, PortfolioImage.created_at.desc())
+    query = query.order_by(PortfolioImage.display_order, PortfolioImage.created_at.desc(), PortfolioImage.id.desc())
     
     pagination = query.paginate(page=page, per_page=per_page, error_out=False)
     
@@ -87,10 +236,55 @@ def get_portfolio():
         'has_prev': pagination.has_prev
     })
 
+@app.route('/api/search')
+@cached_response
+@read_only
+def search_portfolio():
+    """Search published images by text and facets, with facet counts
+    
+    q matches words (as prefixes) in titles and descriptions. Facet filters
+    (category, camera, lens, focal_range, year, orientation) may be
+    repeated to match any of several values. Results use the feed order and
+    page with cursor like /api/portfolio.
+    """
+    from pagination import MAX_PAGE_SIZE
+    from search import FACETS, search_images
+    
+    selected = {}
+    for facet in FACETS:
+        values = [value for value in request.args.getlist(facet) if value]
+        if values:
+            selected[facet] = values
+    
+    per_page = max(1, min(request.args.get('per_page', 12, type=int), MAX_PAGE_SIZE))
+    try:
+        images, next_cursor, total, facets = search_images(
+            selected,
+            request.args.get('q', ''),
+            cursor=request.args.get('cursor'),
+            limit=per_page,
+            fts_enabled=app.config.get('SEARCH_FTS_ENABLED', True)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'images': [img.to_dict() for img in images],
+        'next_cursor': next_cursor,
+        'has_next': next_cursor is not None,
+        'per_page': per_page,
+        'total': total,
+        'facets': facets
+    })
+
 @app.route('/api/featured-image')
+@cached_response
+@read_only
 def get_featured_image():
     """Get the current featured image"""
-    featured = FeaturedImage.query.filter_by(is_active=True).first()
+    featured = FeaturedImage.query.options(
+        joinedload(FeaturedImage.portfolio_image).joinedload(PortfolioImage.category)
+    ).filter_by(is_active=True).first()
     if featured and featured.portfolio_image:
         return jsonify(featured.portfolio_image.to_dict())
     return jsonify({'error': 'No featured image set'}), 404
@@ -145,6 +339,22 @@ def admin_dashboard():
                     <div class="stat-number">{'✓' if stats['has_featured_image'] else '✗'}</div>
                     <div>Featured Image</div>
                 </div>
+                <div class="stat-card">
+                    <div class="stat-number">{stats['total_bytes'] / 1024 ** 3:.2f} GB</div>
+                    <div>Originals on Disk</div>
+                </div>
+                <div class="stat-card">
+                    <div class="stat-number">{stats['derivative_bytes'] / 1024 ** 3:.2f} GB</div>
+                    <div>Derivative Cache</div>
+                </div>
+                <div class="stat-card">
+                    <div class="stat-number">{'–' if stats['missing_derivatives'] is None else stats['missing_derivatives']}</div>
+                    <div>Missing Derivatives</div>
+                </div>
+                <div class="stat-card">
+                    <div class="stat-number">{stats['import_backlog']}</div>
+                    <div>Import Backlog</div>
+                </div>
             </div>
             
             <div class="category-stats">
@@ -169,6 +379,10 @@ def admin_dashboard():
                     <h3>⭐ Featured Image</h3>
                     <p>Set the featured image with EXIF data display</p>
                 </a>
+                <a href="/admin/duplicates" class="nav-link">
+                    <h3>🧬 Duplicate Images</h3>
+                    <p>Review near-identical copies found during import</p>
+                </a>
                 <a href="/" class="nav-link">
                     <h3>🌐 View Website</h3>
                     <p>See your live photography website</p>
@@ -208,43 +422,77 @@ def admin_import():
                 fetch('/admin/import/execute', {{ method: 'POST' }})
                     .then(response => response.json())
                     .then(data => {{
-                        const resultBox = document.getElementById('result-box');
-                        const resultContent = document.getElementById('result-content');
-                        
                         if (data.success) {{
-                            resultBox.className = 'result-box success';
-                            resultContent.innerHTML = `
-                                <h3>✅ Import Successful!</h3>
-                                <p><strong>Total images found:</strong> ${{data.total_found}}</p>
-                                <p><strong>Images imported:</strong> ${{data.imported}}</p>
-                                <p><strong>Images skipped:</strong> ${{data.skipped}} (already in database)</p>
-                            `;
+                            pollImport(data.job_id);
                         }} else {{
-                            resultBox.className = 'result-box error';
-                            resultContent.innerHTML = `
-                                <h3>❌ Import Failed</h3>
-                                <p><strong>Error:</strong> ${{data.error}}</p>
-                            `;
+                            showError(data.error);
                         }}
-                        
-                        resultBox.style.display = 'block';
-                        document.getElementById('import-btn').disabled = false;
-                        document.getElementById('import-btn').textContent = 'Import Images';
                     }})
-                    .catch(error => {{
-                        const resultBox = document.getElementById('result-box');
-                        const resultContent = document.getElementById('result-content');
-                        
-                        resultBox.className = 'result-box error';
-                        resultContent.innerHTML = `
-                            <h3>❌ Import Failed</h3>
-                            <p><strong>Error:</strong> ${{error.message}}</p>
-                        `;
-                        resultBox.style.display = 'block';
-                        
-                        document.getElementById('import-btn').disabled = false;
-                        document.getElementById('import-btn').textContent = 'Import Images';
-                    }});
+                    .catch(error => showError(error.message));
+            }}
+            
+            function pollImport(jobId) {{
+                fetch('/admin/import/status/' + jobId)
+                    .then(response => response.json())
+                    .then(job => {{
+                        if (job.status === 'running') {{
+                            showProgress(job);
+                            setTimeout(() => pollImport(jobId), 1000);
+                        }} else if (job.status === 'completed') {{
+                            showResult(job);
+                        }} else {{
+                            showError(job.error || 'Import failed');
+                        }}
+                    }})
+                    .catch(error => showError(error.message));
+            }}
+            
+            function showProgress(job) {{
+                const resultBox = document.getElementById('result-box');
+                resultBox.className = 'result-box';
+                document.getElementById('result-content').innerHTML = `
+                    <h3>⏳ Importing...</h3>
+                    <p><strong>Files found:</strong> ${{job.found}}</p>
+                    <p><strong>Files processed:</strong> ${{job.processed}} (${{job.files_per_second}} files/s)</p>
+                    <p><strong>Imported:</strong> ${{job.imported}} &nbsp; <strong>Updated:</strong> ${{job.updated}} &nbsp; <strong>Skipped:</strong> ${{job.skipped}} &nbsp; <strong>Failed:</strong> ${{job.failed}}</p>
+                `;
+                resultBox.style.display = 'block';
+            }}
+            
+            function showResult(job) {{
+                const resultBox = document.getElementById('result-box');
+                resultBox.className = 'result-box success';
+                document.getElementById('result-content').innerHTML = `
+                    <h3>✅ Import Successful!</h3>
+                    <p><strong>Total images found:</strong> ${{job.found}}</p>
+                    <p><strong>Images imported:</strong> ${{job.imported}}</p>
+                    <p><strong>Images updated:</strong> ${{job.updated}} (file changed since it was imported)</p>
+                    <p><strong>Images skipped:</strong> ${{job.skipped}} (already in database)</p>
+                    <p><strong>Files rescanned:</strong> ${{job.processed}} (new or changed since last import)</p>
+                    <p><strong>Files removed from /data:</strong> ${{job.deleted}}</p>
+                    <p><strong>Near-duplicates detected:</strong> ${{job.duplicates}}</p>
+                    <p><strong>Files that could not be read:</strong> ${{job.failed}}</p>
+                    ${{job.errors.map(e => `<p><code>${{e.filename}}</code>: ${{e.error}}</p>`).join('')}}
+                    <p><strong>Duration:</strong> ${{job.elapsed_seconds}}s (${{job.files_per_second}} files/s)</p>
+                `;
+                resultBox.style.display = 'block';
+                resetButton();
+            }}
+            
+            function showError(message) {{
+                const resultBox = document.getElementById('result-box');
+                resultBox.className = 'result-box error';
+                document.getElementById('result-content').innerHTML = `
+                    <h3>❌ Import Failed</h3>
+                    <p><strong>Error:</strong> ${{message}}</p>
+                `;
+                resultBox.style.display = 'block';
+                resetButton();
+            }}
+            
+            function resetButton() {{
+                document.getElementById('import-btn').disabled = false;
+                document.getElementById('import-btn').textContent = 'Import Images';
             }}
         </script>
     </head>
@@ -264,6 +512,7 @@ def admin_import():
                     <li>✅ Creates titles from filenames</li>
                     <li>✅ Assigns to default category (you can change later)</li>
                     <li>✅ Skips images already in database</li>
+                    <li>✅ Only opens files that are new or changed since the last import</li>
                 </ul>
                 <p><strong>Note:</strong> This only adds images to the database - your original files remain unchanged.</p>
             </div>
@@ -284,11 +533,15 @@ def admin_import():
 
 @app.route('/admin/import/execute', methods=['POST'])
 def admin_import_execute():
-    """Execute the import process"""
+    """Start the import process as a background job"""
     try:
-        from admin_tools import import_images_from_data
-        result = import_images_from_data()
-        return jsonify(result)
+        from import_jobs import start_import_job
+        job = start_import_job(app, full=request.args.get('full', type=int) == 1)
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status_url': url_for('admin_import_status', job_id=job.id)
+        }), 202
     except Exception as e:
         return jsonify({
             'success': False,
@@ -298,11 +551,48 @@ def admin_import_execute():
             'total_found': 0
         })
 
+@app.route('/admin/import/status/<job_id>')
+def admin_import_status(job_id):
+    """Report progress of an import job"""
+    from import_jobs import get_import_job
+    job = get_import_job(job_id)
+    if not job:
+        return jsonify({'error': 'Import job not found'}), 404
+    return jsonify(job.to_dict())
+
 @app.route('/admin/portfolio')
 def admin_portfolio():
-    """Portfolio management interface"""
-    images = PortfolioImage.query.order_by(PortfolioImage.created_at.desc()).all()
-    categories = Category.query.filter_by(is_active=True).all()
+    """Portfolio management interface
+    
+    Shows one page of ADMIN_PAGE_SIZE images, newest import first. Pages
+    are addressed by image id (?after=<id> for older, ?before=<id> for
+    newer images), so every page costs the same whatever its position.
+    """
+    from pagination import MAX_PAGE_SIZE
+    per_page = max(1, min(request.args.get('per_page', app.config['ADMIN_PAGE_SIZE'], type=int), MAX_PAGE_SIZE))
+    after = request.args.get('after', type=int)
+    before = request.args.get('before', type=int)
+    
+    query = PortfolioImage.query.options(load_only(
+        PortfolioImage.filename, PortfolioImage.title, PortfolioImage.alt_text,
+        PortfolioImage.category_id, PortfolioImage.width, PortfolioImage.height,
+        PortfolioImage.is_published, PortfolioImage.dominant_color
+    ))
+    if before is not None:
+        # Newer page: walk up from before, then show it in the usual order
+        images = query.filter(PortfolioImage.id > before).order_by(PortfolioImage.id.asc()).limit(per_page + 1).all()
+        has_newer = len(images) > per_page
+        images = images[:per_page][::-1]
+        has_older = True
+    else:
+        if after is not None:
+            query = query.filter(PortfolioImage.id < after)
+        images = query.order_by(PortfolioImage.id.desc()).limit(per_page + 1).all()
+        has_older = len(images) > per_page
+        images = images[:per_page]
+        has_newer = after is not None
+    
+    category_names = dict(db.session.query(Category.id, Category.name).filter_by(is_active=True).all())
     
     # Generate image cards HTML
     if not images:
@@ -310,12 +600,12 @@ def admin_portfolio():
     else:
         image_cards = []
         for img in images:
-            category_name = next((cat.name for cat in categories if cat.id == img.category_id), 'Uncategorized')
+            category_name = category_names.get(img.category_id, 'Uncategorized')
             status = 'Published' if img.is_published else 'Draft'
             
-            card_html = f'''
+            image_cards.append(f'''
                 <div class="image-card">
-                    <img src="{img.web_path}" alt="{img.alt_text}" onerror="this.src='data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMjAwIiBoZWlnaHQ9IjE1MCIgdmlld0JveD0iMCAwIDIwMCAxNTAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIyMDAiIGhlaWdodD0iMTUwIiBmaWxsPSIjMzMzIi8+Cjx0ZXh0IHg9IjEwMCIgeT0iNzUiIGZpbGw9IiM2NjYiIHRleHQtYW5jaG9yPSJtaWRkbGUiIGR5PSIwLjNlbSI+SW1hZ2UgTm90IEZvdW5kPC90ZXh0Pgo8L3N2Zz4K'">
+                    <img src="{img.derivative_path(320)}" alt="{img.alt_text}" width="320" height="{round(320 * img.height / img.width) if img.width and img.height else 240}" loading="lazy" decoding="async" style="background: {img.dominant_color or '#333'}" onerror="imageMissing(this)">
                     <div class="image-info">
                         <div class="image-title">{img.title}</div>
                         <div class="image-meta">
@@ -325,11 +615,17 @@ def admin_portfolio():
                         </div>
                     </div>
                 </div>
-            '''
-            image_cards.append(card_html)
+            ''')
         
         images_html = '<div class="image-grid">' + ''.join(image_cards) + '</div>'
     
+    page_links = []
+    if has_newer and images:
+        page_links.append(f'<a href="/admin/portfolio?before={images[0].id}&per_page={per_page}" class="btn">← Newer</a>')
+    if has_older and images:
+        page_links.append(f'<a href="/admin/portfolio?after={images[-1].id}&per_page={per_page}" class="btn">Older →</a>')
+    pager_html = f'<div class="pager">{"".join(page_links)}</div>' if page_links else ''
+    
     return f"""
     <!DOCTYPE html>
     <html>
@@ -351,7 +647,14 @@ def admin_portfolio():
             .image-title {{ font-weight: bold; margin-bottom: 5px; }}
             .image-meta {{ font-size: 0.9em; color: #ccc; }}
             .no-images {{ text-align: center; padding: 40px; color: #666; }}
+            .pager {{ display: flex; justify-content: center; gap: 20px; margin: 30px 0; }}
         </style>
+        <script>
+            function imageMissing(img) {{
+                img.onerror = null;
+                img.src = 'data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMjAwIiBoZWlnaHQ9IjE1MCIgdmlld0JveD0iMCAwIDIwMCAxNTAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIyMDAiIGhlaWdodD0iMTUwIiBmaWxsPSIjMzMzIi8+Cjx0ZXh0IHg9IjEwMCIgeT0iNzUiIGZpbGw9IiM2NjYiIHRleHQtYW5jaG9yPSJtaWRkbGUiIGR5PSIwLjNlbSI+SW1hZ2UgTm90IEZvdW5kPC90ZXh0Pgo8L3N2Zz4K';
+            }}
+        </script>
     </head>
     <body>
         <div class="container">
@@ -366,14 +669,17 @@ def admin_portfolio():
             </div>
             
             {images_html}
+            {pager_html}
         </div>
     </body>
     </html>
     """
+
 @app.route('/admin/categories')
 def admin_categories():
     """Category management interface"""
     categories = Category.query.order_by(Category.display_order).all()
+    image_counts = category_image_counts()
     
     return f"""
     <!DOCTYPE html>
@@ -460,7 +766,7 @@ def admin_categories():
                         <h3>{cat.name}</h3>
                         <p>{cat.description or 'No description'}</p>
                     </div>
-                    <div class="image-count">{len(cat.images)} images</div>
+                    <div class="image-count">{image_counts.get(cat.id, 0)} images</div>
                 </div>
                 ''' for cat in categories])}
             </div>
@@ -500,17 +806,41 @@ def admin_add_category():
         
         db.session.add(category)
         db.session.commit()
+        invalidate_api_cache()
         
         return jsonify({'success': True, 'message': 'Category added successfully'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/admin/portfolio/<int:image_id>/exif')
+def admin_image_exif(image_id):
+    """Full EXIF of an image, read from its file; ?raw=1 downloads the EXIF block itself"""
+    image = PortfolioImage.query.get_or_404(image_id)
+    from admin_tools import read_full_exif
+    try:
+        tags, raw = read_full_exif(image.filename)
+    except (OSError, SyntaxError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    if request.args.get('raw'):
+        if raw is None:
+            return jsonify({'success': False, 'error': 'Image has no EXIF data'}), 404
+        return app.response_class(raw, mimetype='application/octet-stream', headers={
+            'Content-Disposition': f'attachment; filename="{image.id}.exif"'
+        })
+    return jsonify({'success': True, 'exif': tags})
+
 @app.route('/admin/featured')
 def admin_featured():
-    """Featured image management interface"""
-    images = PortfolioImage.query.filter_by(is_published=True).order_by(PortfolioImage.created_at.desc()).all()
-    current_featured = FeaturedImage.query.filter_by(is_active=True).first()
+    """Featured image management interface
+    
+    The picker grid is filled page by page from /admin/featured/images,
+    so the page itself only needs the current featured image.
+    """
+    current_featured = FeaturedImage.query.options(
+        joinedload(FeaturedImage.portfolio_image)
+    ).filter_by(is_active=True).first()
+    current_image = current_featured.portfolio_image if current_featured else None
     
     return f"""
     <!DOCTYPE html>
@@ -525,17 +855,91 @@ def admin_featured():
             .btn:hover {{ background: #45a049; }}
             .current-featured {{ background: #2a2a2a; padding: 20px; border-radius: 8px; margin-bottom: 30px; text-align: center; }}
             .current-featured img {{ max-width: 300px; max-height: 200px; object-fit: cover; border-radius: 4px; }}
+            .filters {{ display: flex; flex-wrap: wrap; gap: 10px; margin-bottom: 20px; }}
+            .filters input, .filters select {{ background: #2a2a2a; color: white; border: 1px solid #444; border-radius: 4px; padding: 8px; }}
+            .filters input {{ flex: 1; min-width: 200px; }}
             .image-grid {{ display: grid; grid-template-columns: repeat(auto-fill, minmax(200px, 1fr)); gap: 20px; }}
             .image-card {{ background: #2a2a2a; border-radius: 8px; overflow: hidden; cursor: pointer; transition: transform 0.2s; }}
             .image-card:hover {{ transform: scale(1.05); }}
             .image-card img {{ width: 100%; height: 150px; object-fit: cover; }}
             .image-info {{ padding: 15px; }}
             .image-title {{ font-weight: bold; margin-bottom: 5px; }}
+            .image-meta {{ font-size: 0.85em; color: #ccc; margin-bottom: 8px; }}
             .set-featured-btn {{ background: #2196F3; color: white; padding: 5px 10px; border: none; border-radius: 4px; cursor: pointer; font-size: 0.9em; }}
             .set-featured-btn:hover {{ background: #1976D2; }}
             .featured-badge {{ background: #4CAF50; color: white; padding: 2px 8px; border-radius: 12px; font-size: 0.8em; }}
+            .picker-footer {{ text-align: center; margin: 30px 0; color: #999; }}
         </style>
         <script>
+            let featuredId = {current_image.id if current_image else 'null'};
+            let nextCursor = '';
+            let requestId = 0;
+            
+            function pickerQuery(cursor) {{
+                const params = new URLSearchParams();
+                params.set('q', document.getElementById('q').value);
+                for (const facet of ['category', 'camera', 'year']) {{
+                    const value = document.getElementById(facet).value;
+                    if (value) params.set(facet, value);
+                }}
+                params.set('cursor', cursor);
+                return params;
+            }}
+            
+            function fillSelect(facet, entries) {{
+                const select = document.getElementById(facet);
+                if (select.options.length > 1) return;
+                for (const entry of entries || []) {{
+                    select.add(new Option(`${{entry.label || entry.value}} (${{entry.count}})`, entry.value));
+                }}
+            }}
+            
+            function imageCard(img) {{
+                const card = document.createElement('div');
+                card.className = 'image-card';
+                card.innerHTML = `
+                    <img src="${{img.thumbnail}}" alt="" loading="lazy" decoding="async" style="background: ${{img.dominant_color || '#333'}}">
+                    <div class="image-info">
+                        <div class="image-title"></div>
+                        <div class="image-meta"></div>
+                        ${{img.id === featuredId
+                            ? '<span class="featured-badge">Current Featured</span>'
+                            : `<button class="set-featured-btn" onclick="setFeatured(${{img.id}})">Set as Featured</button>`}}
+                    </div>`;
+                card.querySelector('.image-title').textContent = img.title || '';
+                card.querySelector('.image-meta').textContent =
+                    [img.category_name, img.camera_model, img.date_taken && img.date_taken.slice(0, 10)].filter(Boolean).join(' · ');
+                return card;
+            }}
+            
+            function loadImages(reset) {{
+                const current = ++requestId;
+                if (reset) nextCursor = '';
+                fetch('/admin/featured/images?' + pickerQuery(nextCursor))
+                    .then(response => response.json())
+                    .then(data => {{
+                        if (current !== requestId) return;
+                        const grid = document.getElementById('image-grid');
+                        if (reset) grid.innerHTML = '';
+                        if (data.error) {{
+                            document.getElementById('picker-status').textContent = 'Error: ' + data.error;
+                            return;
+                        }}
+                        for (const facet of ['category', 'camera', 'year']) fillSelect(facet, data.facets[facet]);
+                        data.images.forEach(img => grid.appendChild(imageCard(img)));
+                        nextCursor = data.next_cursor;
+                        document.getElementById('picker-status').textContent =
+                            `Showing ${{grid.children.length}} of ${{data.total}} published images`;
+                        document.getElementById('load-more').style.display = data.has_next ? 'inline-block' : 'none';
+                    }});
+            }}
+            
+            let searchTimer = null;
+            function filtersChanged() {{
+                clearTimeout(searchTimer);
+                searchTimer = setTimeout(() => loadImages(true), 250);
+            }}
+            
             function setFeatured(imageId) {{
                 fetch('/admin/featured/set', {{
                     method: 'POST',
@@ -551,6 +955,8 @@ def admin_featured():
                     }}
                 }});
             }}
+            
+            document.addEventListener('DOMContentLoaded', () => loadImages(true));
         </script>
     </head>
     <body>
@@ -562,21 +968,140 @@ def admin_featured():
             
             <div class="current-featured">
                 <h3>Current Featured Image</h3>
-                {f'<img src="{current_featured.portfolio_image.web_path}" alt="{current_featured.portfolio_image.title}"><br><strong>{current_featured.portfolio_image.title}</strong>' if current_featured else '<p>No featured image set</p>'}
+                {f'<img src="{current_image.derivative_path(640)}" alt="{current_image.title}"><br><strong>{current_image.title}</strong>' if current_image else '<p>No featured image set</p>'}
             </div>
             
             <h3>Select New Featured Image</h3>
-            <div class="image-grid">
-                {''.join([f'''
-                <div class="image-card">
-                    <img src="{img.web_path}" alt="{img.title}">
-                    <div class="image-info">
-                        <div class="image-title">{img.title}</div>
-                        {f'<span class="featured-badge">Current Featured</span>' if current_featured and current_featured.portfolio_image_id == img.id else f'<button class="set-featured-btn" onclick="setFeatured({img.id})">Set as Featured</button>'}
+            <div class="filters">
+                <input id="q" type="search" placeholder="Search titles and descriptions" oninput="filtersChanged()">
+                <select id="category" onchange="filtersChanged()"><option value="">All categories</option></select>
+                <select id="camera" onchange="filtersChanged()"><option value="">All cameras</option></select>
+                <select id="year" onchange="filtersChanged()"><option value="">All years</option></select>
+            </div>
+            <div class="image-grid" id="image-grid"></div>
+            <div class="picker-footer">
+                <p id="picker-status">Loading…</p>
+                <button id="load-more" class="btn" style="display: none" onclick="loadImages(false)">Load more</button>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+
+@app.route('/admin/featured/images')
+def admin_featured_images():
+    """One page of published images for the featured image picker
+    
+    Takes q, category, camera and year filters and a cursor like
+    /api/search, and returns only what the picker cards show.
+    """
+    from pagination import MAX_PAGE_SIZE
+    from search import search_images
+    
+    selected = {facet: [request.args[facet]] for facet in ('category', 'camera', 'year') if request.args.get(facet)}
+    per_page = max(1, min(request.args.get('per_page', 24, type=int), MAX_PAGE_SIZE))
+    try:
+        images, next_cursor, total, facets = search_images(
+            selected,
+            request.args.get('q', ''),
+            cursor=request.args.get('cursor'),
+            limit=per_page,
+            fts_enabled=app.config.get('SEARCH_FTS_ENABLED', True)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'images': [{
+            'id': img.id,
+            'title': img.title,
+            'thumbnail': img.derivative_path(320),
+            'dominant_color': img.dominant_color,
+            'category_name': img.category.name if img.category else None,
+            'camera_model': img.camera_model,
+            'date_taken': img.date_taken.isoformat() if img.date_taken else None
+        } for img in images],
+        'next_cursor': next_cursor,
+        'has_next': next_cursor is not None,
+        'total': total,
+        'facets': {facet: facets.get(facet, []) for facet in ('category', 'camera', 'year')}
+    })
+
+@app.route('/admin/duplicates')
+def admin_duplicates():
+    """Report of near-duplicate images grouped by perceptual hash"""
+    from duplicates import duplicate_groups
+    groups = duplicate_groups(app.config['DUPLICATE_MAX_DISTANCE'])
+    per_page = app.config['DUPLICATE_GROUPS_PER_PAGE']
+    pages = max(1, -(-len(groups) // per_page))
+    page = min(max(1, request.args.get('page', 1, type=int)), pages)
+    
+    if not groups:
+        groups_html = '<div class="no-images"><h3>No Duplicates Found</h3><p>Images are compared by perceptual hash when they are imported.</p></div>'
+    else:
+        group_sections = []
+        for group in groups[(page - 1) * per_page:page * per_page]:
+            cards = []
+            for index, img in enumerate(group):
+                status = 'Published' if img.is_published else 'Draft'
+                badge = '<span class="keep-badge">Keep</span>' if index == 0 else f'<span class="copy-badge">Copy of #{img.duplicate_of_id or group[0].id}</span>'
+                cards.append(f'''
+                    <div class="image-card">
+                        <img src="{img.derivative_path(320)}" alt="{img.alt_text}" loading="lazy">
+                        <div class="image-info">
+                            <div class="image-title">#{img.id} {img.title}</div>
+                            <div class="image-meta">
+                                {img.filename}<br>
+                                Size: {img.width}x{img.height}, {(img.file_size or 0) // 1024} KB<br>
+                                Status: {status}
+                            </div>
+                            {badge}
+                        </div>
                     </div>
-                </div>
-                ''' for img in images])}
+                ''')
+            group_sections.append(f'<div class="group"><h3>{len(group)} copies</h3><div class="image-grid">{"".join(cards)}</div></div>')
+        groups_html = ''.join(group_sections)
+    
+    page_links = []
+    if page > 1:
+        page_links.append(f'<a href="/admin/duplicates?page={page - 1}" class="btn">← Previous</a>')
+    if page < pages:
+        page_links.append(f'<a href="/admin/duplicates?page={page + 1}" class="btn">Next →</a>')
+    pager_html = f'<div class="pager">{"".join(page_links)}</div>' if page_links else ''
+    
+    return f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>Duplicate Images - Fifth Element Photography</title>
+        <style>
+            body {{ font-family: Arial, sans-serif; margin: 20px; background: #1a1a1a; color: white; }}
+            .container {{ max-width: 1200px; margin: 0 auto; }}
+            .header {{ display: flex; justify-content: space-between; align-items: center; margin-bottom: 30px; }}
+            .btn {{ background: #4CAF50; color: white; padding: 10px 20px; text-decoration: none; border-radius: 4px; border: none; cursor: pointer; }}
+            .btn:hover {{ background: #45a049; }}
+            .group {{ background: #2a2a2a; padding: 20px; border-radius: 8px; margin-bottom: 30px; }}
+            .image-grid {{ display: grid; grid-template-columns: repeat(auto-fill, minmax(200px, 1fr)); gap: 20px; }}
+            .image-card {{ background: #1a1a1a; border-radius: 8px; overflow: hidden; }}
+            .image-card img {{ width: 100%; height: 150px; object-fit: cover; }}
+            .image-info {{ padding: 15px; }}
+            .image-title {{ font-weight: bold; margin-bottom: 5px; }}
+            .image-meta {{ font-size: 0.9em; color: #ccc; margin-bottom: 8px; word-break: break-all; }}
+            .keep-badge {{ background: #4CAF50; color: white; padding: 2px 8px; border-radius: 12px; font-size: 0.8em; }}
+            .copy-badge {{ background: #f44336; color: white; padding: 2px 8px; border-radius: 12px; font-size: 0.8em; }}
+            .no-images {{ text-align: center; padding: 40px; color: #666; }}
+            .pager {{ display: flex; justify-content: center; gap: 20px; margin: 30px 0; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="header">
+                <h1>Duplicate Images</h1>
+                <a href="/admin" class="btn">← Back to Dashboard</a>
             </div>
+            <p>{len(groups)} groups of images that differ in at most {app.config['DUPLICATE_MAX_DISTANCE']} perceptual hash bits. The largest copy of each group is marked to keep.{f' Page {page} of {pages}.' if pages > 1 else ''}</p>
+            {groups_html}
+            {pager_html}
         </div>
     </body>
     </html>
@@ -604,15 +1129,108 @@ def serve(path):
     if static_folder_path is None:
         return "Static folder not configured", 404
 
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
+    from http_cache import send_static_file
+    if path != "" and os.path.isfile(os.path.join(static_folder_path, path)):
+        return send_static_file(static_folder_path, path, app.config['STATIC_MAX_AGE'])
     else:
         index_path = os.path.join(static_folder_path, 'index.html')
         if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
+            return send_static_file(static_folder_path, 'index.html', app.config['STATIC_MAX_AGE'])
         else:
             return "index.html not found", 404
 
+@app.cli.command('backfill-exif')
+@click.option('--batch-size', default=500, show_default=True, help='Images parsed and committed per batch')
+def backfill_exif_command(batch_size):
+    """Fill camera, lens and exposure columns of existing images from their EXIF data"""
+    from admin_tools import backfill_exif_columns
+    result = backfill_exif_columns(
+        batch_size=batch_size,
+        progress=lambda stats: click.echo(f"Processed {stats['processed']}, updated {stats['updated']}")
+    )
+    if not result['success']:
+        raise click.ClickException(result['error'])
+    click.echo(f"Done: {result['updated']} of {result['processed']} images updated, {result['failed']} unreadable")
+
+@app.cli.command('backfill-dimensions')
+@click.option('--batch-size', default=500, show_default=True, help='Images probed and committed per batch')
+def backfill_dimensions_command(batch_size):
+    """Store existing images' dimensions as displayed, swapping them for EXIF-rotated photos"""
+    from admin_tools import backfill_dimensions
+    result = backfill_dimensions(
+        batch_size=batch_size,
+        progress=lambda stats: click.echo(f"Processed {stats['processed']}, updated {stats['updated']}")
+    )
+    if not result['success']:
+        raise click.ClickException(result['error'])
+    click.echo(f"Done: {result['updated']} of {result['processed']} images updated, {result['failed']} unreadable")
+
+@app.cli.command('placeholders')
+@click.option('--batch-size', default=200, show_default=True, help='Images processed and committed per batch')
+def placeholders_command(batch_size):
+    """Compute BlurHash placeholders and dominant colors of existing images"""
+    from admin_tools import backfill_placeholders
+    result = backfill_placeholders(
+        batch_size=batch_size,
+        progress=lambda stats: click.echo(f"Processed {stats['processed']}, updated {stats['updated']}")
+    )
+    if not result['success']:
+        raise click.ClickException(result['error'])
+    click.echo(f"Done: {result['updated']} of {result['processed']} images updated, {result['failed']} unreadable")
+
+@app.cli.command('compact-exif')
+@click.option('--batch-size', default=500, show_default=True, help='Images rewritten and committed per batch')
+@click.option('--vacuum/--no-vacuum', default=True, show_default=True, help='Rebuild the database file afterwards to release the freed space')
+def compact_exif_command(batch_size, vacuum):
+    """Shrink stored EXIF data to the whitelisted tags and report the database size"""
+    from admin_tools import compact_exif_data
+    from db_setup import database_file_size, vacuum_database
+    size_before = database_file_size(app.config['DATABASE_PATH'])
+    result = compact_exif_data(
+        batch_size=batch_size,
+        progress=lambda stats: click.echo(f"Processed {stats['processed']}, compacted {stats['updated']}")
+    )
+    if not result['success']:
+        raise click.ClickException(result['error'])
+    if vacuum:
+        vacuum_database()
+    size_after = database_file_size(app.config['DATABASE_PATH'])
+    click.echo(f"Done: {result['updated']} of {result['processed']} images compacted, {result['failed']} unreadable")
+    click.echo(f"EXIF data: {result['bytes_before'] / 1024 ** 2:.2f} MB -> {result['bytes_after'] / 1024 ** 2:.2f} MB")
+    click.echo(f"Database file: {size_before / 1024 ** 2:.2f} MB -> {size_after / 1024 ** 2:.2f} MB")
+
+@app.cli.command('watch')
+def watch_command():
+    """Watch /data and import new photos as they arrive, until interrupted"""
+    from data_watcher import run_watcher
+    app.logger.setLevel('INFO')
+    try:
+        run_watcher(app)
+    except KeyboardInterrupt:
+        pass
+
+@app.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Rebuild the full-text index and facet counts used by /api/search"""
+    from search import rebuild_search_index, refresh_statistics
+    rebuild_search_index(app.config.get('SEARCH_FTS_ENABLED', True))
+    refresh_statistics()
+    invalidate_api_cache()
+    click.echo('Search index rebuilt')
+
+@app.cli.command('hash-images')
+@click.option('--batch-size', default=200, show_default=True, help='Images hashed and committed per batch')
+def hash_images_command(batch_size):
+    """Compute perceptual hashes of existing images for the duplicates report"""
+    from admin_tools import backfill_image_hashes
+    result = backfill_image_hashes(
+        batch_size=batch_size,
+        progress=lambda stats: click.echo(f"Processed {stats['processed']}, hashed {stats['updated']}")
+    )
+    if not result['success']:
+        raise click.ClickException(result['error'])
+    click.echo(f"Done: {result['updated']} of {result['processed']} images hashed, {result['failed']} unreadable")
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
@@ -1,8 +1,23 @@
+from flask import current_app, g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import inspect, text
+from sqlalchemy.sql import Select
 from datetime import datetime
+import json
 import os
 
-db = SQLAlchemy()
+class RoutingSession(Session):
+    """Session that sends SELECTs to the read-only engine inside @read_only views"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and isinstance(clause, Select)
+                and has_app_context() and g.get('db_read_only')
+                and 'readonly' in self._db.engines):
+            return self._db.engines['readonly']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class Category(db.Model):
     """Category model for organizing portfolio images"""
@@ -23,7 +38,9 @@ class Category(db.Model):
     def __repr__(self):
         return f'<Category {self.name}>'
     
-    def to_dict(self):
+    def to_dict(self, image_count=None):
+        if image_count is None:
+            image_count = category_image_counts([self.id]).get(self.id, 0)
         return {
             'id': self.id,
             'name': self.name,
@@ -31,17 +48,24 @@ class Category(db.Model):
             'description': self.description,
             'display_order': self.display_order,
             'is_active': self.is_active,
-            'image_count': len(self.images),
+            'image_count': image_count,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+def category_image_counts(category_ids=None):
+    """Number of images per category id, from a single GROUP BY query"""
+    query = db.session.query(PortfolioImage.category_id, db.func.count(PortfolioImage.id))
+    if category_ids is not None:
+        query = query.filter(PortfolioImage.category_id.in_(category_ids))
+    return dict(query.group_by(PortfolioImage.category_id).all())
+
 class PortfolioImage(db.Model):
     """Portfolio image model for managing photography portfolio"""
     __tablename__ = 'portfolio_images'
     
     id = db.Column(db.Integer, primary_key=True)
-    filename = db.Column(db.String(255), nullable=False)
+    filename = db.Column(db.String(255), nullable=False, unique=True, index=True)
     original_filename = db.Column(db.String(255))
     title = db.Column(db.String(200))
     description = db.Column(db.Text)
@@ -55,17 +79,28 @@ class PortfolioImage(db.Model):
     width = db.Column(db.Integer)
     height = db.Column(db.Integer)
     format = db.Column(db.String(10))  # jpg, png, etc.
+    derivative_widths = db.Column(db.String(100))  # comma separated widths rendered in the derivative cache
+    perceptual_hash = db.Column(db.BigInteger, index=True)  # signed 64-bit dHash, see duplicates.py
+    duplicate_of_id = db.Column(db.Integer, db.ForeignKey('portfolio_images.id'), index=True)
+    blurhash = db.Column(db.String(64))  # placeholder shown while the image loads, see placeholders.py
+    dominant_color = db.Column(db.String(7))  # #rrggbb
     
     # EXIF data (stored as JSON string)
     exif_data = db.Column(db.Text)  # JSON string of EXIF data
     camera_make = db.Column(db.String(100))
-    camera_model = db.Column(db.String(100))
-    lens = db.Column(db.String(100))
-    focal_length = db.Column(db.String(50))
+    camera_model = db.Column(db.String(100), index=True)
+    lens = db.Column(db.String(100), index=True)
+    focal_length = db.Column(db.String(50))  # display forms: "50 mm", "f/2.8", "1/250 s", "100"
     aperture = db.Column(db.String(50))
     shutter_speed = db.Column(db.String(50))
     iso = db.Column(db.String(50))
-    date_taken = db.Column(db.DateTime)
+    date_taken = db.Column(db.DateTime, index=True)
+    
+    # Numeric EXIF values for filtering and sorting
+    focal_length_mm = db.Column(db.Float, index=True)
+    f_number = db.Column(db.Float)
+    exposure_time = db.Column(db.Float)  # in seconds
+    iso_speed = db.Column(db.Integer)
     
     # Portfolio management
     display_order = db.Column(db.Integer, default=0)
@@ -89,6 +124,31 @@ class PortfolioImage(db.Model):
         """Get the web-accessible path for the image"""
         return f'/data/{self.filename}'
     
+    def derivative_path(self, width):
+        """Get the web path of a resized copy of the image"""
+        return f'/img/{width}/{self.filename}'
+    
+    @property
+    def rendered_widths(self):
+        """Widths whose derivatives have already been rendered"""
+        if not self.derivative_widths:
+            return []
+        return [int(width) for width in self.derivative_widths.split(',') if width]
+    
+    @property
+    def srcset(self):
+        """srcset attribute value for the rendered derivatives, None before any are rendered
+        
+        Widths that have not been rendered are never listed; clients fall
+        back to web_path until they are.
+        """
+        candidates = {}
+        for width in self.rendered_widths:
+            # Derivatives are never upscaled, so describe them by their real width
+            actual_width = min(width, self.width) if self.width else width
+            candidates.setdefault(actual_width, self.derivative_path(width))
+        return ', '.join(f'{path} {width}w' for width, path in sorted(candidates.items())) or None
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -111,14 +171,34 @@ class PortfolioImage(db.Model):
             'shutter_speed': self.shutter_speed,
             'iso': self.iso,
             'date_taken': self.date_taken.isoformat() if self.date_taken else None,
+            'focal_length_mm': self.focal_length_mm,
+            'f_number': self.f_number,
+            'exposure_time': self.exposure_time,
+            'iso_speed': self.iso_speed,
             'display_order': self.display_order,
             'is_featured': self.is_featured,
             'is_published': self.is_published,
+            'duplicate_of_id': self.duplicate_of_id,
             'web_path': self.web_path,
+            'derivatives': {width: self.derivative_path(width) for width in self.rendered_widths},
+            'srcset': self.srcset,
+            'blurhash': self.blurhash,
+            'dominant_color': self.dominant_color,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+# Cover the public feed order (display_order, newest first) with and without a category filter
+db.Index(
+    'ix_portfolio_images_feed',
+    PortfolioImage.is_published, PortfolioImage.display_order,
+    PortfolioImage.created_at.desc(), PortfolioImage.id.desc()
+)
+db.Index(
+    'ix_portfolio_images_category_feed',
+    PortfolioImage.category_id, PortfolioImage.is_published, PortfolioImage.display_order,
+    PortfolioImage.created_at.desc(), PortfolioImage.id.desc()
+)
 class FeaturedImage(db.Model):
     """Model for managing the featured image display"""
     __tablename__ = 'featured_images'
@@ -143,3 +223,164 @@ class FeaturedImage(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+class FileManifestEntry(db.Model):
+    """Last seen stat signature of a file under /data, used for incremental scans"""
+    __tablename__ = 'file_manifest'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(1024), nullable=False, unique=True)  # relative to /data
+    size = db.Column(db.BigInteger)
+    mtime_ns = db.Column(db.BigInteger)
+    inode = db.Column(db.BigInteger)
+    scanned_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<FileManifestEntry {self.path}>'
+
+class SearchFacetCount(db.Model):
+    """Number of published images per facet value, kept current by triggers (see search.py)
+    
+    Rows with an empty by_facet count all published images; the others
+    count only the images that also have by_value for by_facet.
+    """
+    __tablename__ = 'search_facet_counts'
+    
+    facet = db.Column(db.String(32), primary_key=True)
+    value = db.Column(db.String(255), primary_key=True)
+    by_facet = db.Column(db.String(32), primary_key=True, default='')
+    by_value = db.Column(db.String(255), primary_key=True, default='')
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<SearchFacetCount {self.facet}={self.value} {self.by_facet}={self.by_value}: {self.count}>'
+
+class ImportJob(db.Model):
+    """Progress of a background import from /data"""
+    __tablename__ = 'import_jobs'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    status = db.Column(db.String(20), default='running')  # running, completed, failed
+    full_rescan = db.Column(db.Boolean, default=False)
+    found = db.Column(db.Integer, default=0)
+    processed = db.Column(db.Integer, default=0)
+    imported = db.Column(db.Integer, default=0)
+    updated = db.Column(db.Integer, default=0)  # already imported files whose metadata was refreshed
+    skipped = db.Column(db.Integer, default=0)
+    failed = db.Column(db.Integer, default=0)
+    deleted = db.Column(db.Integer, default=0)
+    duplicates = db.Column(db.Integer, default=0)
+    errors = db.Column(db.Text)  # JSON list of {filename, error}
+    error = db.Column(db.Text)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<ImportJob {self.id} {self.status}>'
+    
+    def to_dict(self):
+        elapsed = ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds() if self.started_at else 0
+        return {
+            'id': self.id,
+            'status': self.status,
+            'full_rescan': self.full_rescan,
+            'found': self.found,
+            'processed': self.processed,
+            'imported': self.imported,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'deleted': self.deleted,
+            'duplicates': self.duplicates,
+            'errors': json.loads(self.errors) if self.errors else [],
+            'error': self.error,
+            'elapsed_seconds': round(elapsed, 2),
+            'files_per_second': round(self.processed / elapsed, 1) if elapsed > 0 else 0,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+# The import lock: the database refuses a second running job, see start_import_job
+db.Index(
+    'ux_import_jobs_running', ImportJob.status,
+    unique=True, sqlite_where=ImportJob.status == 'running'
+)
+
+def _fail_extra_running_jobs(connection):
+    """Fail all but the newest running import job; returns how many were failed
+    
+    Imports started concurrently before ux_import_jobs_running existed may
+    both still be marked running.
+    """
+    return connection.execute(text(
+        "UPDATE import_jobs SET status = 'failed', error = 'Import stopped responding' "
+        "WHERE status = 'running' AND id NOT IN "
+        "(SELECT id FROM import_jobs WHERE status = 'running' ORDER BY started_at DESC LIMIT 1)"
+    )).rowcount
+
+def _merge_duplicate_filenames(connection):
+    """Delete all but the first row of every filename; returns how many were deleted
+    
+    Databases created before filename was unique can hold the same file
+    twice. References to the deleted rows are moved to the row that is kept.
+    """
+    duplicates = (
+        "FROM portfolio_images AS dup JOIN portfolio_images AS kept "
+        "ON kept.filename = dup.filename AND kept.id = "
+        "(SELECT MIN(id) FROM portfolio_images WHERE filename = dup.filename) "
+        "WHERE dup.id != kept.id"
+    )
+    moved = f"(SELECT kept.id {duplicates} AND dup.id = {{column}})"
+    connection.execute(text(
+        f"UPDATE featured_images SET portfolio_image_id = {moved.format(column='featured_images.portfolio_image_id')} "
+        f"WHERE portfolio_image_id IN (SELECT dup.id {duplicates})"
+    ))
+    connection.execute(text(
+        f"UPDATE portfolio_images SET duplicate_of_id = {moved.format(column='portfolio_images.duplicate_of_id')} "
+        f"WHERE duplicate_of_id IN (SELECT dup.id {duplicates})"
+    ))
+    connection.execute(text(
+        "UPDATE portfolio_images SET duplicate_of_id = NULL WHERE duplicate_of_id = id"
+    ))
+    return connection.execute(text(
+        f"DELETE FROM portfolio_images WHERE id IN (SELECT dup.id {duplicates})"
+    )).rowcount
+
+# Clean-ups that let upgrade_schema create a table's unique indexes over existing rows
+INDEX_PREPARATION = {
+    'import_jobs': _fail_extra_running_jobs,
+    'portfolio_images': _merge_duplicate_filenames
+}
+
+def upgrade_schema():
+    """Add columns and indexes that db.create_all() does not add to existing tables
+    
+    Rows that would break a unique index are cleaned up first, see
+    INDEX_PREPARATION. An index that still cannot be created raises, so the
+    app does not start on a schema without its constraints.
+    """
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        with db.engine.begin() as connection:
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_type = column.type.compile(dialect=connection.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            
+            missing = [index for index in table.indexes if index.name not in existing_indexes]
+            if not missing:
+                continue
+            prepare = INDEX_PREPARATION.get(table.name)
+            if prepare and any(index.unique for index in missing):
+                changed = prepare(connection)
+                if changed:
+                    current_app.logger.warning('%s: cleaned up %d rows before creating %s', table.name, changed,
+                                               ', '.join(index.name for index in missing))
+            for index in missing:
+                index.create(connection)
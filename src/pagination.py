@@ -0,0 +1,78 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, select, union_all
+from sqlalchemy.orm import joinedload
+from models.portfolio import PortfolioImage
+
+MAX_PAGE_SIZE = 100
+
+# Order of the public portfolio feed; the trailing id makes it total
+FEED_ORDER = (PortfolioImage.display_order.asc(), PortfolioImage.created_at.desc(), PortfolioImage.id.desc())
+
+def encode_cursor(image):
+    """Opaque cursor pointing just after image in the feed order"""
+    key = [image.display_order, image.created_at.isoformat() if image.created_at else None, image.id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor into (display_order, created_at, id); raises ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        display_order, created_at, image_id = json.loads(base64.urlsafe_b64decode(padded))
+        return (
+            int(display_order) if display_order is not None else None,
+            datetime.fromisoformat(created_at) if created_at else None,
+            int(image_id)
+        )
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def _after_cursor(display_order, created_at, image_id):
+    """Criteria for the rows after a cursor, one per index range
+
+    Each criterion is an equality prefix plus a single range on the feed
+    index, so SQLite can seek straight to it instead of walking every row
+    before the cursor. SQLite sorts NULLs first ascending and last
+    descending: rows without a display_order open the feed, and rows
+    without a created_at close their display_order group.
+    """
+    if display_order is None:
+        same_order = PortfolioImage.display_order.is_(None)
+        criteria = [PortfolioImage.display_order.isnot(None)]
+    else:
+        same_order = PortfolioImage.display_order == display_order
+        criteria = [PortfolioImage.display_order > display_order]
+    if created_at is None:
+        criteria.append(and_(same_order, PortfolioImage.created_at.is_(None), PortfolioImage.id < image_id))
+    else:
+        criteria.append(and_(same_order, PortfolioImage.created_at == created_at, PortfolioImage.id < image_id))
+        criteria.append(and_(same_order, PortfolioImage.created_at < created_at))
+        criteria.append(and_(same_order, PortfolioImage.created_at.is_(None)))
+    return criteria
+
+def keyset_page(filters, cursor=None, limit=12):
+    """Fetch one page of the portfolio feed after cursor
+
+    filters are SQLAlchemy criteria such as is_published == True. Returns
+    (images, next_cursor); next_cursor is None on the last page. The cost
+    of a page does not depend on how deep into the feed it is.
+    """
+    query = PortfolioImage.query.options(joinedload(PortfolioImage.category))
+
+    if cursor:
+        # One small ordered, limited scan per index range; the outer query
+        # only looks up and sorts those few candidate ids by primary key
+        ranges = [
+            select(PortfolioImage.id).where(*filters, criterion)
+            .order_by(*FEED_ORDER).limit(limit + 1).subquery()
+            for criterion in _after_cursor(*decode_cursor(cursor))
+        ]
+        candidate_ids = union_all(*(select(subquery.c.id) for subquery in ranges))
+        query = query.filter(PortfolioImage.id.in_(candidate_ids))
+    else:
+        query = query.filter(*filters)
+
+    images = query.order_by(*FEED_ORDER).limit(limit + 1).all()
+    next_cursor = encode_cursor(images[limit - 1]) if len(images) > limit else None
+    return images[:limit], next_cursor
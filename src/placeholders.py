@@ -0,0 +1,128 @@
+import math
+from PIL import Image, ImageOps
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Placeholders are computed from a thumbnail this many pixels on its long side
+PREVIEW_SIZE = 32
+# BlurHash components along the long and the short side of the image
+BLURHASH_COMPONENTS = (4, 3)
+# Palette size when looking for the dominant color
+DOMINANT_PALETTE = 5
+
+BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+def preview_image(image):
+    """Small upright RGB copy of a PIL image that the placeholders are computed from
+
+    JPEGs are decoded at reduced scale via draft(), so call this after
+    reading anything that needs the full size.
+    """
+    image.draft('RGB', (PREVIEW_SIZE * 4, PREVIEW_SIZE * 4))
+    preview = ImageOps.exif_transpose(image)
+    if preview.mode != 'RGB':
+        if preview.mode in ('RGBA', 'LA', 'PA') or 'transparency' in preview.info:
+            # Composite on white like the gallery background
+            preview = preview.convert('RGBA')
+            background = Image.new('RGB', preview.size, (255, 255, 255))
+            background.paste(preview, mask=preview.getchannel('A'))
+            preview = background
+        else:
+            preview = preview.convert('RGB')
+    # exif_transpose returned a copy, so this leaves image alone
+    preview.thumbnail((PREVIEW_SIZE, PREVIEW_SIZE), Image.BILINEAR)
+    return preview
+
+def encode_base83(value, length):
+    return ''.join(BASE83[value // 83 ** (length - 1 - i) % 83] for i in range(length))
+
+def srgb_to_linear(value):
+    value /= 255
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+def linear_to_srgb(value):
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+def blurhash_factors(preview, x_components, y_components):
+    """Cosine transform coefficients of a preview, as [(r, g, b)] in row major component order"""
+    width, height = preview.size
+    if numpy is not None:
+        pixels = numpy.asarray(preview, dtype=numpy.float64) / 255
+        linear = numpy.where(pixels <= 0.04045, pixels / 12.92, ((pixels + 0.055) / 1.055) ** 2.4)
+        basis_x = numpy.cos(numpy.pi * numpy.outer(numpy.arange(x_components), numpy.arange(width)) / width)
+        basis_y = numpy.cos(numpy.pi * numpy.outer(numpy.arange(y_components), numpy.arange(height)) / height)
+        factors = numpy.einsum('jy,ix,yxc->jic', basis_y, basis_x, linear) / (width * height)
+        factors[:, :, :] *= 2
+        factors[0, 0, :] /= 2
+        return [tuple(float(channel) for channel in factor) for factor in factors.reshape(-1, 3)]
+
+    lookup = [srgb_to_linear(value) for value in range(256)]
+    pixels = [(lookup[r], lookup[g], lookup[b]) for r, g, b in preview.getdata()]
+    basis_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(x_components)]
+    basis_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(y_components)]
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            r = g = b = 0.0
+            for y in range(height):
+                row = basis_y[j][y]
+                offset = y * width
+                for x in range(width):
+                    basis = row * basis_x[i][x]
+                    pixel = pixels[offset + x]
+                    r += basis * pixel[0]
+                    g += basis * pixel[1]
+                    b += basis * pixel[2]
+            scale = (1 if i == 0 and j == 0 else 2) / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+    return factors
+
+def blurhash(preview):
+    """BlurHash (https://blurha.sh) string of a preview image, about 28 characters
+
+    Uses 4x3 components for landscape and 3x4 for portrait images, which
+    the gallery decodes into a blurred placeholder at any size.
+    """
+    long_side, short_side = BLURHASH_COMPONENTS
+    width, height = preview.size
+    x_components, y_components = (long_side, short_side) if width >= height else (short_side, long_side)
+    factors = blurhash_factors(preview, x_components, y_components)
+    dc, ac = factors[0], factors[1:]
+
+    result = encode_base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        actual_maximum = max(abs(channel) for factor in ac for channel in factor)
+        quantised_maximum = int(max(0, min(82, math.floor(actual_maximum * 166 - 0.5))))
+        maximum = (quantised_maximum + 1) / 166
+        result += encode_base83(quantised_maximum, 1)
+    else:
+        maximum = 1
+        result += encode_base83(0, 1)
+
+    result += encode_base83((linear_to_srgb(dc[0]) << 16) + (linear_to_srgb(dc[1]) << 8) + linear_to_srgb(dc[2]), 4)
+    for factor in ac:
+        r, g, b = (
+            int(max(0, min(18, math.floor(math.copysign(abs(channel / maximum) ** 0.5, channel) * 9 + 9.5))))
+            for channel in factor
+        )
+        result += encode_base83(r * 19 * 19 + g * 19 + b, 2)
+    return result
+
+def dominant_color(preview):
+    """Most common color of a preview after reducing it to a small palette, as #rrggbb"""
+    palette_image = preview.quantize(colors=DOMINANT_PALETTE, method=Image.Quantize.MEDIANCUT)
+    palette = palette_image.getpalette()
+    count, index = max(palette_image.getcolors())
+    r, g, b = palette[index * 3:index * 3 + 3]
+    return f'#{r:02x}{g:02x}{b:02x}'
+
+def image_placeholders(image):
+    """{'blurhash', 'dominant_color'} of a PIL image, computed from one small preview"""
+    preview = preview_image(image)
+    return {'blurhash': blurhash(preview), 'dominant_color': dominant_color(preview)}
@@ -0,0 +1,460 @@
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import and_, case, cast, column, func, literal, literal_column, or_, select, table, text
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from models.portfolio import db, Category, PortfolioImage, SearchFacetCount
+from pagination import keyset_page
+
+SEARCH_TABLE = 'portfolio_search'
+# Columns indexed for free-text search
+SEARCH_COLUMNS = ('title', 'description')
+
+# Focal length buckets in mm: (name, lower bound, upper bound)
+FOCAL_RANGES = (
+    ('ultra-wide', None, 24),
+    ('wide', 24, 35),
+    ('standard', 35, 70),
+    ('telephoto', 70, 200),
+    ('super-telephoto', 200, None),
+)
+
+# Facet values listed per dimension, most frequent first
+FACET_LIMIT = 50
+# Text searches matching more images than this page through the feed index
+FEED_SCAN_MIN_MATCHES = 2000
+# Facet row holding the number of published images
+TOTAL_FACET = '_total'
+# Facet row counting writes that changed facet values; versions the FacetIndex
+CHANGES_FACET = '_changes'
+BUMP_CHANGES = (
+    f"INSERT INTO search_facet_counts (facet, value, by_facet, by_value, count) "
+    f"VALUES ('{CHANGES_FACET}', 'all', '', '', 1) "
+    f"ON CONFLICT (facet, value, by_facet, by_value) DO UPDATE SET count = count + 1"
+)
+
+# Image ids per IN list when counting a batch, below SQLite's bound parameter limit
+ADJUST_CHUNK = 500
+
+def focal_range_criterion(name):
+    """Criterion for the FOCAL_RANGES bucket called name, or None if there is none"""
+    for range_name, lower, upper in FOCAL_RANGES:
+        if range_name == name:
+            criteria = [PortfolioImage.focal_length_mm.isnot(None)]
+            if lower is not None:
+                criteria.append(PortfolioImage.focal_length_mm >= lower)
+            if upper is not None:
+                criteria.append(PortfolioImage.focal_length_mm < upper)
+            return and_(*criteria)
+    return None
+
+def year_criterion(year):
+    """date_taken within year, as a range the date_taken index can serve"""
+    return and_(PortfolioImage.date_taken >= datetime(year, 1, 1),
+                PortfolioImage.date_taken < datetime(year + 1, 1, 1))
+
+# Value of every facet dimension for an image row
+FACETS = {
+    'category': PortfolioImage.category_id,
+    'camera': PortfolioImage.camera_model,
+    'lens': PortfolioImage.lens,
+    'focal_range': case(*((focal_range_criterion(name), name) for name, _, _ in FOCAL_RANGES)),
+    'year': func.strftime('%Y', PortfolioImage.date_taken),
+    'orientation': case(
+        (PortfolioImage.width > PortfolioImage.height, 'landscape'),
+        (PortfolioImage.width < PortfolioImage.height, 'portrait'),
+        (PortfolioImage.width == PortfolioImage.height, 'square'),
+    ),
+}
+
+# Columns whose changes can move an image between facet values
+FACET_SOURCE_COLUMNS = ('is_published', 'category_id', 'camera_model', 'lens', 'focal_length_mm',
+                        'date_taken', 'width', 'height')
+
+def facet_criterion(facet, values):
+    """Criterion matching any of values (strings from the query string) for facet"""
+    if facet == 'category':
+        ids = [int(value) for value in values if value.isdigit()]
+        return PortfolioImage.category_id.in_(ids)
+    if facet == 'focal_range':
+        criteria = [focal_range_criterion(value) for value in values]
+        return or_(*(criterion for criterion in criteria if criterion is not None), False)
+    if facet == 'year':
+        return or_(*(year_criterion(int(value)) for value in values if value.isdigit()), False)
+    if facet in ('camera', 'lens', 'orientation'):
+        return FACETS[facet].in_(values)
+    raise ValueError(f'Unknown facet: {facet}')
+
+def match_expression(query):
+    """FTS5 MATCH string for free text: every word must match, as a prefix"""
+    words = re.findall(r'\w+', query or '')
+    return ' '.join(f'"{word}"*' for word in words)
+
+def text_matches(query, fts_enabled=True):
+    """Select of the ids whose title or description match query, or None for empty text"""
+    match = match_expression(query)
+    if not match:
+        return None
+    if fts_enabled:
+        search_table = table(SEARCH_TABLE, column('rowid'))
+        return select(search_table.c.rowid).where(literal_column(SEARCH_TABLE).op('MATCH')(match))
+    # Without FTS5 fall back to a table scan
+    words = re.findall(r'\w+', query)
+    return select(PortfolioImage.id).where(*(
+        or_(PortfolioImage.title.ilike(f'%{word}%'), PortfolioImage.description.ilike(f'%{word}%'))
+        for word in words
+    ))
+
+def selected_criteria(selected):
+    """Criteria for a {facet: [values]} selection"""
+    return {facet: facet_criterion(facet, values) for facet, values in selected.items()}
+
+class FacetIndex:
+    """Bitsets of published image ids per facet value
+
+    Bit n of a bitset is set when the image with id n has that value, so
+    any combination of filters is a few big-int ANDs and every count a
+    popcount, whatever the number of matches. A snapshot is loaded per
+    process and reloaded once the change counter the facet triggers bump
+    has moved.
+    """
+
+    def __init__(self, version, published, bitsets):
+        self.version = version
+        self.published = published
+        self.bitsets = bitsets
+
+    @classmethod
+    def load(cls, version):
+        expressions = [cast(expression, db.String) for expression in FACETS.values()]
+        statement = select(PortfolioImage.id, *expressions).where(PortfolioImage.is_published == True)
+        # Plain DB-API rows; SQLAlchemy's result processing would double the load time
+        connection = db.session.connection(bind_arguments={'clause': statement})
+        rows = connection.exec_driver_sql(_compile(statement)).fetchall()
+        size = max((row[0] for row in rows), default=0) // 8 + 1
+        published = bytearray(size)
+        buffers = {facet: {} for facet in FACETS}
+        for image_id, *values in rows:
+            byte, bit = divmod(image_id, 8)
+            mask = 1 << bit
+            published[byte] |= mask
+            for facet, value in zip(FACETS, values):
+                if value is not None:
+                    buffer = buffers[facet].get(value)
+                    if buffer is None:
+                        buffer = buffers[facet][value] = bytearray(size)
+                    buffer[byte] |= mask
+        bitsets = {
+            facet: {value: int.from_bytes(buffer, 'little') for value, buffer in values.items()}
+            for facet, values in buffers.items()
+        }
+        return cls(version, int.from_bytes(published, 'little'), bitsets)
+
+    @staticmethod
+    def bitset_of(image_ids):
+        ids = list(image_ids)
+        buffer = bytearray(max(ids, default=0) // 8 + 1)
+        for image_id in ids:
+            buffer[image_id // 8] |= 1 << (image_id % 8)
+        return int.from_bytes(buffer, 'little')
+
+    def matching(self, selected, base):
+        """Bitset of the images in base having one of the selected values of every facet"""
+        for facet, values in selected.items():
+            bitsets = self.bitsets.get(facet, {})
+            union = 0
+            for value in values:
+                union |= bitsets.get(value, 0)
+            base &= union
+        return base
+
+    def counts(self, facet, matches):
+        counted = ((value, (bitset & matches).bit_count()) for value, bitset in self.bitsets[facet].items())
+        counted = sorted((entry for entry in counted if entry[1]), key=lambda entry: entry[1], reverse=True)
+        return [{'value': value, 'count': count} for value, count in counted[:FACET_LIMIT]]
+
+_facet_index = None
+_facet_index_lock = threading.Lock()
+
+def get_facet_index():
+    """Return the current FacetIndex, reloading it after facet relevant writes"""
+    global _facet_index
+    row = db.session.get(SearchFacetCount, (CHANGES_FACET, 'all', '', ''))
+    version = row.count if row else 0
+    with _facet_index_lock:
+        if _facet_index is None or _facet_index.version != version:
+            _facet_index = FacetIndex.load(version)
+        return _facet_index
+
+def facet_counts(selected, text_ids=None):
+    """Facet value counts for published images matching the selection and text
+
+    selected maps facet names to the chosen values and text_ids is the
+    bitset of text matches, if any. Each dimension is counted with the
+    filters of every other dimension applied but not its own, so visitors
+    see how many results picking another value would give. Dimensions
+    filtered by at most one other facet and no text are read from
+    search_facet_counts; the rest are counted on the FacetIndex.
+    """
+    counts = {}
+    index = None
+    for facet in FACETS:
+        others = {name: values for name, values in selected.items() if name != facet}
+        if text_ids is None and len(others) <= 1:
+            by_facet, by_values = next(iter(others.items()), ('', ['']))
+            counts[facet] = stored_facet_counts(facet, by_facet, by_values)
+            continue
+        
+        if index is None:
+            index = get_facet_index()
+        base = index.published if text_ids is None else text_ids
+        counts[facet] = index.counts(facet, index.matching(others, base))
+    return counts
+
+def stored_facet_counts(facet, by_facet='', by_values=('',)):
+    """Counts of facet values among images having any of by_values for by_facet"""
+    total = func.sum(SearchFacetCount.count)
+    rows = db.session.query(SearchFacetCount.value, total).filter(
+        SearchFacetCount.facet == facet,
+        SearchFacetCount.by_facet == by_facet,
+        SearchFacetCount.by_value.in_(list(by_values))
+    ).group_by(SearchFacetCount.value).having(total > 0).order_by(total.desc()).limit(FACET_LIMIT).all()
+    return [{'value': value, 'count': count} for value, count in rows]
+
+def search_total(selected, text_ids=None):
+    """Number of published images matching the selection and text"""
+    if text_ids is None and len(selected) <= 1:
+        facet, values = next(iter(selected.items()), (TOTAL_FACET, ['published']))
+        return db.session.query(func.coalesce(func.sum(SearchFacetCount.count), 0)).filter(
+            SearchFacetCount.facet == facet,
+            SearchFacetCount.value.in_(values),
+            SearchFacetCount.by_facet == ''
+        ).scalar()
+    index = get_facet_index()
+    return index.matching(selected, index.published if text_ids is None else text_ids).bit_count()
+
+def search_images(selected, query='', cursor=None, limit=12, fts_enabled=True):
+    """Search published images; returns (images, next_cursor, total, facets)
+
+    selected maps facet names to lists of accepted values and query is
+    free text. Images come in feed order, paged with keyset cursors.
+    """
+    criteria = selected_criteria(selected)
+    matches = text_matches(query, fts_enabled)
+    text_ids = None
+    if matches is not None:
+        index = get_facet_index()
+        text_ids = index.published & FacetIndex.bitset_of(db.session.execute(matches).scalars())
+    total = search_total(selected, text_ids)
+    
+    filters = [PortfolioImage.is_published == True, *criteria.values()]
+    if matches is not None:
+        # Past a few thousand matches, walking the feed index in order fills
+        # a page sooner than fetching and sorting every match; id + 0 keeps
+        # SQLite from driving the query by primary key lookups instead
+        matched_id = PortfolioImage.id + 0 if total > FEED_SCAN_MIN_MATCHES else PortfolioImage.id
+        filters.append(matched_id.in_(matches))
+    images, next_cursor = keyset_page(filters, cursor, limit)
+    return images, next_cursor, total, label_categories(facet_counts(selected, text_ids))
+
+def label_categories(counts):
+    """Add the category name to every category facet value"""
+    ids = [int(entry['value']) for entry in counts.get('category', [])]
+    if not ids:
+        return counts
+    names = dict(db.session.query(Category.id, Category.name).filter(Category.id.in_(ids)).all())
+    for entry in counts['category']:
+        entry['label'] = names.get(int(entry['value']))
+    return counts
+
+def _compile(expression):
+    return str(expression.compile(dialect=sqlite.dialect(), compile_kwargs={'literal_binds': True}))
+
+def _counted_expressions():
+    return {**FACETS, TOTAL_FACET: literal('published')}
+
+def _facet_count_statements(row, delta):
+    """Trigger body statements adding delta to the facet counts of NEW or OLD"""
+    values = {
+        facet: _compile(expression).replace(f'{PortfolioImage.__tablename__}.', f'{row}.')
+        for facet, expression in _counted_expressions().items()
+    }
+    pairs = [(facet, "''", '') for facet in values]
+    pairs.extend((facet, by_value, by_facet) for facet in FACETS for by_facet, by_value in values.items()
+                 if by_facet not in (facet, TOTAL_FACET))
+    statements = [f'{BUMP_CHANGES};']
+    for facet, by_value, by_facet in pairs:
+        value = values[facet]
+        statements.append(
+            f"INSERT INTO search_facet_counts (facet, value, by_facet, by_value, count) "
+            f"SELECT '{facet}', CAST({value} AS TEXT), '{by_facet}', CAST({by_value} AS TEXT), {delta} "
+            f"WHERE {value} IS NOT NULL AND {by_value} IS NOT NULL "
+            f"ON CONFLICT (facet, value, by_facet, by_value) DO UPDATE SET count = count + {delta};"
+        )
+    return ' '.join(statements)
+
+def _trigger_ddl():
+    images = PortfolioImage.__tablename__
+    columns = ', '.join(SEARCH_COLUMNS)
+    new_values = ', '.join(f'NEW.{name}' for name in SEARCH_COLUMNS)
+    old_values = ', '.join(f'OLD.{name}' for name in SEARCH_COLUMNS)
+    return {
+        'portfolio_search_insert':
+            f"CREATE TRIGGER portfolio_search_insert AFTER INSERT ON {images} BEGIN "
+            f"INSERT INTO {SEARCH_TABLE} (rowid, {columns}) VALUES (NEW.id, {new_values}); END",
+        'portfolio_search_delete':
+            f"CREATE TRIGGER portfolio_search_delete AFTER DELETE ON {images} BEGIN "
+            f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, {columns}) VALUES ('delete', OLD.id, {old_values}); END",
+        'portfolio_search_update':
+            f"CREATE TRIGGER portfolio_search_update AFTER UPDATE OF {columns} ON {images} BEGIN "
+            f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, {columns}) VALUES ('delete', OLD.id, {old_values}); "
+            f"INSERT INTO {SEARCH_TABLE} (rowid, {columns}) VALUES (NEW.id, {new_values}); END",
+        'facet_counts_insert':
+            f"CREATE TRIGGER facet_counts_insert AFTER INSERT ON {images} WHEN NEW.is_published BEGIN "
+            f"{_facet_count_statements('NEW', 1)} END",
+        'facet_counts_delete':
+            f"CREATE TRIGGER facet_counts_delete AFTER DELETE ON {images} WHEN OLD.is_published BEGIN "
+            f"{_facet_count_statements('OLD', -1)} END",
+        'facet_counts_update_old':
+            f"CREATE TRIGGER facet_counts_update_old AFTER UPDATE OF {', '.join(FACET_SOURCE_COLUMNS)} "
+            f"ON {images} WHEN OLD.is_published BEGIN {_facet_count_statements('OLD', -1)} END",
+        'facet_counts_update_new':
+            f"CREATE TRIGGER facet_counts_update_new AFTER UPDATE OF {', '.join(FACET_SOURCE_COLUMNS)} "
+            f"ON {images} WHEN NEW.is_published BEGIN {_facet_count_statements('NEW', 1)} END",
+    }
+
+def install_search_index():
+    """Create the FTS5 table and the triggers maintaining it and the facet counts
+
+    Triggers are recreated on every start so they follow changes to FACETS.
+    The index and counts are rebuilt from portfolio_images when the FTS
+    table is first created. Every write to portfolio_images then updates
+    the counts of each facet value and each pair of values, except inside
+    deferred_facet_counts(). Returns False if SQLite lacks FTS5; search
+    then falls back to LIKE matching.
+    """
+    fts_enabled = True
+    with db.engine.begin() as connection:
+        created = not connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SEARCH_TABLE,)
+        ).first()
+        if created:
+            try:
+                connection.exec_driver_sql(
+                    f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5({', '.join(SEARCH_COLUMNS)}, "
+                    f"content='{PortfolioImage.__tablename__}', content_rowid='id', "
+                    f"tokenize='unicode61 remove_diacritics 2')"
+                )
+            except OperationalError as e:
+                current_app.logger.warning('Full-text search unavailable: %s', e)
+                fts_enabled = False
+
+        for name, ddl in _trigger_ddl().items():
+            connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {name}')
+            if fts_enabled or name.startswith('facet_counts'):
+                connection.exec_driver_sql(ddl)
+
+    if created and (fts_enabled or SearchFacetCount.query.first() is None):
+        rebuild_search_index(fts_enabled)
+        refresh_statistics()
+    return fts_enabled
+
+def refresh_statistics():
+    """Refresh the query planner statistics of portfolio_images
+
+    Without them SQLite prefers the feed index (is_published) over the far
+    more selective facet indexes. Takes about 0.1s per 100k images.
+    """
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(f'ANALYZE {PortfolioImage.__tablename__}')
+
+def rebuild_search_index(fts_enabled=True):
+    """Rebuild the FTS index and recount every facet from portfolio_images"""
+    with db.engine.begin() as connection:
+        if fts_enabled:
+            connection.exec_driver_sql(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('rebuild')")
+        connection.execute(SearchFacetCount.__table__.delete().where(SearchFacetCount.facet != CHANGES_FACET))
+        columns = ['facet', 'value', 'by_facet', 'by_value', 'count']
+        for facet, expression in _counted_expressions().items():
+            counts = select(
+                literal(facet), cast(expression, db.String), literal(''), literal(''), func.count(PortfolioImage.id)
+            ).where(PortfolioImage.is_published == True, expression.isnot(None)).group_by(expression)
+            connection.execute(SearchFacetCount.__table__.insert().from_select(columns, counts))
+            if facet == TOTAL_FACET:
+                continue
+            for by_facet, by_expression in FACETS.items():
+                if by_facet == facet:
+                    continue
+                counts = select(
+                    literal(facet), cast(expression, db.String), literal(by_facet), cast(by_expression, db.String),
+                    func.count(PortfolioImage.id)
+                ).where(
+                    PortfolioImage.is_published == True, expression.isnot(None), by_expression.isnot(None)
+                ).group_by(expression, by_expression)
+                connection.execute(SearchFacetCount.__table__.insert().from_select(columns, counts))
+        connection.exec_driver_sql(BUMP_CHANGES)
+
+@contextmanager
+def deferred_facet_counts():
+    """Suspend the facet count triggers for the writes of the session's transaction
+
+    Bulk writers use this to replace a few dozen upserts per written row
+    with one adjust_facet_counts() call per batch. The triggers are dropped
+    and recreated inside the current transaction, so other connections
+    never see them missing and a rollback restores them. The caller must
+    adjust the counts of every row it writes inside the block and commit
+    only after it.
+    """
+    facet_triggers = {name: ddl for name, ddl in _trigger_ddl().items() if name.startswith('facet_counts')}
+    # pysqlite only opens a transaction before DML; DDL run first would commit on its own
+    db.session.execute(text(BUMP_CHANGES))
+    for name in facet_triggers:
+        db.session.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+    yield
+    for ddl in facet_triggers.values():
+        db.session.execute(text(ddl))
+
+def adjust_facet_counts(image_ids, delta):
+    """Add delta to the stored facet counts of the published images in image_ids
+
+    Counts what the triggers would for each row, in one query per
+    ADJUST_CHUNK ids and one bulk upsert. Call with -1 before the rows
+    change and with 1 afterwards.
+    """
+    expressions = _counted_expressions()
+    counted = [cast(expression, db.String) for expression in expressions.values()]
+    counts = Counter()
+    image_ids = list(image_ids)
+    for start in range(0, len(image_ids), ADJUST_CHUNK):
+        rows = db.session.execute(select(*counted).where(
+            PortfolioImage.id.in_(image_ids[start:start + ADJUST_CHUNK]), PortfolioImage.is_published == True
+        ))
+        for row in rows:
+            values = dict(zip(expressions, row))
+            for facet, value in values.items():
+                if value is None:
+                    continue
+                counts[facet, value, '', ''] += 1
+                if facet == TOTAL_FACET:
+                    continue
+                for by_facet, by_value in values.items():
+                    if by_facet not in (facet, TOTAL_FACET) and by_value is not None:
+                        counts[facet, value, by_facet, by_value] += 1
+    if not counts:
+        return
+
+    statement = sqlite_insert(SearchFacetCount.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=['facet', 'value', 'by_facet', 'by_value'],
+        set_={'count': SearchFacetCount.__table__.c.count + statement.excluded.count}
+    )
+    db.session.execute(statement, [
+        {'facet': facet, 'value': value, 'by_facet': by_facet, 'by_value': by_value, 'count': count * delta}
+        for (facet, value, by_facet, by_value), count in counts.items()
+    ])
+    db.session.execute(text(BUMP_CHANGES))
@@ -0,0 +1,95 @@
+import os
+import shutil
+import sys
+import tempfile
+import pytest
+from PIL import Image
+
+# The app reads its configuration from the environment when main is imported
+TEST_DIR = tempfile.mkdtemp(prefix='fifth-element-tests-')
+DATA_DIR = os.path.join(TEST_DIR, 'data')
+os.makedirs(DATA_DIR)
+os.environ.update({
+    'DATA_DIR': DATA_DIR,
+    'DATABASE_PATH': os.path.join(TEST_DIR, 'app.db'),
+    'CACHE_BACKEND_URL': 'memory://',
+    # Every request reaches the view, so the statements it runs can be counted
+    'API_CACHE_ENABLED': '0',
+    'PREGENERATE_DERIVATIVES': '0',
+    'WATCH_DATA_DIR': '0',
+    'INSTRUMENTATION_ENABLED': '0'
+})
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from main import app as flask_app  # noqa: E402
+from db_setup import READ_ONLY_BIND  # noqa: E402
+from models.portfolio import db, Category, FeaturedImage, FileManifestEntry, PortfolioImage  # noqa: E402
+
+@pytest.fixture(scope='session')
+def app():
+    yield flask_app
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def writer(app):
+    with app.app_context():
+        return db.engine
+
+@pytest.fixture
+def reader(app):
+    """Engine of the views wrapped in @read_only"""
+    with app.app_context():
+        return db.engines[READ_ONLY_BIND]
+
+@pytest.fixture
+def library(app):
+    """Callable adding count published images, spread over the categories, with the first one featured"""
+    def add_images(count):
+        with app.app_context():
+            category_ids = [category.id for category in Category.query.order_by(Category.id)]
+            offset = PortfolioImage.query.count()
+            images = [
+                PortfolioImage(
+                    filename=f'library/image-{index}.jpg',
+                    original_filename=f'image-{index}.jpg',
+                    title=f'Image {index}',
+                    width=1200,
+                    height=800,
+                    category_id=category_ids[index % len(category_ids)],
+                    is_published=True
+                )
+                for index in range(offset, offset + count)
+            ]
+            db.session.add_all(images)
+            db.session.flush()
+            if not FeaturedImage.query.filter_by(is_active=True).count():
+                db.session.add(FeaturedImage(portfolio_image_id=images[0].id, is_active=True))
+            db.session.commit()
+
+    yield add_images
+    with app.app_context():
+        FeaturedImage.query.delete()
+        PortfolioImage.query.delete()
+        FileManifestEntry.query.delete()
+        db.session.commit()
+
+@pytest.fixture
+def photo():
+    """Callable writing a JPEG under DATA_DIR and returning its relative path; removed afterwards"""
+    written = []
+
+    def write_photo(relative_path, size=(600, 400), color=(180, 90, 40), exif=None, **options):
+        path = os.path.join(DATA_DIR, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.new('RGB', size, color).save(path, 'JPEG', exif=exif if exif is not None else Image.Exif(), **options)
+        written.append(path)
+        return relative_path
+
+    yield write_photo
+    for path in written:
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,39 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+
+class QueryCounter:
+    """Collects the SQL statements executed on an engine"""
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+@contextmanager
+def count_queries(engine):
+    """Count SQL statements executed on engine inside the with block
+
+        with count_queries(db.engine) as counter:
+            client.get('/api/portfolio')
+        print(counter.count)
+    """
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter._before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter._before_cursor_execute)
+
+@contextmanager
+def assert_max_queries(engine, limit):
+    """Fail if the with block executes more than limit SQL statements"""
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        statements = '\n'.join(counter.statements)
+        raise AssertionError(f'{counter.count} queries executed, expected at most {limit}:\n{statements}')
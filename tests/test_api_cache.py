@@ -0,0 +1,86 @@
+import pytest
+from admin_tools import delete_image, set_featured_image, update_image_category, update_image_details
+from api_cache import CachedResponse, ResponseCache, invalidate_api_cache
+from cache_backends import MemoryBackend
+from models.portfolio import db, Category, PortfolioImage
+
+@pytest.fixture
+def api_cache(app, library):
+    library(3)
+    app.config['API_CACHE_ENABLED'] = True
+    with app.app_context():
+        invalidate_api_cache()
+        yield [image.id for image in PortfolioImage.query.order_by(PortfolioImage.id)]
+        invalidate_api_cache()
+    app.config['API_CACHE_ENABLED'] = False
+
+def titles(client, **args):
+    return {image['id']: image['title'] for image in client.get('/api/portfolio', query_string=args).get_json()['images']}
+
+def test_responses_are_served_from_the_cache(client, api_cache):
+    first = client.get('/api/portfolio')
+    # Written behind the admin functions' back, so nothing invalidates
+    PortfolioImage.query.filter_by(id=api_cache[0]).update({'title': 'Renamed'})
+    db.session.commit()
+
+    second = client.get('/api/portfolio')
+    assert second.data == first.data
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert second.cache_control.no_cache
+    assert client.get('/api/portfolio', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    invalidate_api_cache()
+    assert titles(client)[api_cache[0]] == 'Renamed'
+
+def test_image_edits_invalidate(client, api_cache):
+    titles(client)
+    assert update_image_details(api_cache[0], 'New title', None, None, True)['success']
+    assert titles(client)[api_cache[0]] == 'New title'
+
+    assert update_image_details(api_cache[1], 'Hidden', None, None, False)['success']
+    assert api_cache[1] not in titles(client)
+
+def test_category_changes_invalidate(client, api_cache):
+    image = db.session.get(PortfolioImage, api_cache[0])
+    category_id = image.category_id
+    other_id = Category.query.filter(Category.id != category_id).first().id
+    assert api_cache[0] in titles(client, category_id=category_id)
+
+    assert update_image_category(api_cache[0], other_id)['success']
+    assert api_cache[0] not in titles(client, category_id=category_id)
+    assert api_cache[0] in titles(client, category_id=other_id)
+
+def test_deleting_an_image_invalidates(client, api_cache):
+    assert client.get('/api/portfolio').get_json()['total'] == 3
+    assert delete_image(api_cache[2])['success']
+    assert client.get('/api/portfolio').get_json()['total'] == 2
+
+def test_featuring_an_image_invalidates(client, api_cache):
+    assert client.get('/api/featured-image').get_json()['id'] == api_cache[0]
+    assert set_featured_image(api_cache[1])['success']
+    assert client.get('/api/featured-image').get_json()['id'] == api_cache[1]
+
+def test_adding_a_category_invalidates(client, api_cache):
+    names = [category['name'] for category in client.get('/api/categories').get_json()]
+    try:
+        assert client.post('/admin/categories/add', data={'name': 'Cached'}).get_json()['success']
+        assert [category['name'] for category in client.get('/api/categories').get_json()] == names + ['Cached']
+    finally:
+        Category.query.filter_by(name='Cached').delete()
+        db.session.commit()
+
+def test_other_workers_drop_their_entries_after_an_invalidation():
+    backend = MemoryBackend()
+    worker, other = ResponseCache(backend, 1024, sync_interval=0), ResponseCache(backend, 1024, sync_interval=0)
+    other.put('key', CachedResponse(b'{}', 200), other.generation)
+    assert other.get('key') is not None
+
+    worker.invalidate()
+    assert other.get('key') is None
+
+def test_a_response_rendered_before_an_invalidation_is_not_stored():
+    cache = ResponseCache(MemoryBackend(), 1024)
+    generation = cache.generation
+    cache.invalidate()
+    cache.put('key', CachedResponse(b'{}', 200), generation)
+    assert cache.get('key') is None
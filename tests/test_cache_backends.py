@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+import pytest
+import cache_backends
+from cache_backends import MemoryBackend, SQLiteBackend, create_backend
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Mutable time seen by the backends"""
+    now = [1000.0]
+    monkeypatch.setattr(cache_backends, 'time', SimpleNamespace(time=lambda: now[0]))
+    return now
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryBackend()
+    return SQLiteBackend(str(tmp_path / 'cache.db'))
+
+def test_set_get_and_delete(backend):
+    assert backend.get('key') is None
+    backend.set('key', b'first')
+    backend.set('key', b'second')
+    assert backend.get('key') == b'second'
+    backend.delete('key')
+    assert backend.get('key') is None
+    backend.delete('key')
+
+def test_add_only_stores_missing_keys(backend):
+    assert backend.add('lock', b'1')
+    assert not backend.add('lock', b'2')
+    assert backend.get('lock') == b'1'
+    backend.delete('lock')
+    assert backend.add('lock', b'3')
+
+def test_entries_expire(backend, clock):
+    backend.set('key', b'value', ttl=10)
+    assert backend.add('lock', b'1', ttl=10)
+    clock[0] += 10
+    assert backend.get('key') == b'value'
+    assert not backend.add('lock', b'2', ttl=10)
+
+    clock[0] += 1
+    assert backend.get('key') is None
+    assert backend.add('lock', b'2', ttl=10)
+
+def test_generations_count_bumps(backend):
+    assert backend.get_generation('api') == 0
+    assert backend.bump_generation('api') == 1
+    assert backend.bump_generation('api') == 2
+    assert backend.get_generation('api') == 2
+    assert backend.get_generation('other') == 0
+
+def test_memory_backend_evicts_the_least_recently_used(clock):
+    backend = MemoryBackend(max_bytes=10)
+    backend.set('a', b'1234')
+    backend.set('b', b'1234')
+    backend.get('a')
+    backend.set('c', b'1234')
+    assert backend.get('b') is None
+    assert backend.get('a') == backend.get('c') == b'1234'
+
+def test_sqlite_backends_share_one_file(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    worker, other = SQLiteBackend(path), SQLiteBackend(path)
+    worker.set('key', b'value')
+    assert other.get('key') == b'value'
+    assert worker.add('lock', b'1')
+    assert not other.add('lock', b'1')
+    worker.bump_generation('api')
+    assert other.get_generation('api') == 1
+
+def test_sqlite_prune_drops_the_oldest_entries(tmp_path, clock):
+    backend = SQLiteBackend(str(tmp_path / 'cache.db'), max_bytes=30)
+    backend.set('expired', b'x', ttl=1)
+    for index in range(5):
+        clock[0] += 1
+        backend.set(f'key-{index}', b'0123456789')
+    backend.prune()
+    assert backend.get('expired') is None
+    assert [backend.get(f'key-{index}') is not None for index in range(5)] == [False, False, False, True, True]
+
+def test_backends_are_created_from_urls(tmp_path):
+    assert isinstance(create_backend('memory://'), MemoryBackend)
+    backend = create_backend(f'sqlite:///{tmp_path}/cache.db')
+    assert isinstance(backend, SQLiteBackend)
+    assert backend.path == f'{tmp_path}/cache.db'
+    with pytest.raises(ValueError):
+        create_backend('memcached://localhost')
@@ -0,0 +1,32 @@
+import os
+from admin_tools import compute_portfolio_stats
+from derivatives import get_cache
+
+def test_derivative_bytes_are_measured_on_disk(app, library):
+    library(3)
+    with app.app_context():
+        cache = get_cache()
+        before = compute_portfolio_stats()['derivative_bytes']
+        path = cache.path_for('ab' * 32, 'jpg')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fp:
+            fp.write(b'\0' * 4096)
+        try:
+            # Written behind this worker's back, as another worker would
+            assert compute_portfolio_stats()['derivative_bytes'] == before + 4096
+        finally:
+            os.remove(path)
+
+def test_missing_derivatives_only_counted_with_pregeneration(app, library, monkeypatch):
+    library(3)
+    with app.app_context():
+        monkeypatch.setitem(app.config, 'PREGENERATE_DERIVATIVES', False)
+        assert compute_portfolio_stats()['missing_derivatives'] is None
+        monkeypatch.setitem(app.config, 'PREGENERATE_DERIVATIVES', True)
+        assert compute_portfolio_stats()['missing_derivatives'] == 3
+
+def test_dashboard_renders(client, library):
+    library(3)
+    response = client.get('/admin')
+    assert response.status_code == 200
+    assert 'Derivative Cache' in response.get_data(as_text=True)
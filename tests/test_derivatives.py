@@ -0,0 +1,110 @@
+import io
+import os
+import pytest
+from PIL import Image
+from admin_tools import DATA_DIR
+from derivatives import (
+    PREGENERATED_WIDTHS, DerivativeBatch, DerivativeCache, _pregenerate_image, encodable_formats, negotiate_format,
+    snap_width
+)
+from models.portfolio import db, PortfolioImage
+
+def add_image(filename, width=600, height=400, derivative_widths=None):
+    image = PortfolioImage(filename=filename, width=width, height=height, category_id=1,
+                           derivative_widths=derivative_widths)
+    db.session.add(image)
+    db.session.commit()
+    return image
+
+def test_unrendered_image_advertises_no_derivatives(app, library):
+    with app.app_context():
+        data = add_image('unrendered.jpg').to_dict()
+    assert data['derivatives'] == {}
+    assert data['srcset'] is None
+    assert data['web_path'] == '/data/unrendered.jpg'
+
+def test_srcset_lists_rendered_widths_at_their_real_size(app, library):
+    with app.app_context():
+        data = add_image('rendered.jpg', derivative_widths='320,960').to_dict()
+    assert set(data['derivatives']) == {320, 960}
+    # 960 is never upscaled past the 600px original
+    assert data['srcset'] == '/img/320/rendered.jpg 320w, /img/960/rendered.jpg 600w'
+
+def test_pregeneration_records_the_rendered_widths(app, library, photo):
+    filename = photo('pregenerated/a.jpg', size=(2000, 1000))
+    with app.app_context():
+        image_id = add_image(filename, 2000, 1000).id
+        _pregenerate_image(app, image_id, DerivativeBatch(app, 1))
+        image = db.session.get(PortfolioImage, image_id)
+        db.session.refresh(image)
+        assert image.rendered_widths == sorted(set(PREGENERATED_WIDTHS.values()))
+
+@pytest.mark.parametrize('width, snapped', [(1, 320), (320, 320), (321, 640), (1000, 1280), (9000, 2560)])
+def test_widths_snap_to_the_next_preset(width, snapped):
+    assert snap_width(width) == snapped
+
+def test_format_follows_the_accept_header():
+    assert negotiate_format('')[0] == 'image/jpeg'
+    assert negotiate_format('image/png,*/*')[0] == 'image/jpeg'
+    assert negotiate_format('image/webp,*/*')[0] == 'image/webp'
+    # AVIF only when the installed PIL can encode it
+    assert negotiate_format('image/avif,image/webp,*/*') == encodable_formats()[0]
+
+def test_cache_renders_each_key_once(tmp_path):
+    cache = DerivativeCache(str(tmp_path), 1024 ** 2)
+    renders = []
+
+    def render(path):
+        renders.append(path)
+        with open(path, 'wb') as f:
+            f.write(b'derivative')
+
+    first = cache.get_or_render('ab' * 32, 'jpg', render)
+    second = cache.get_or_render('ab' * 32, 'jpg', render)
+    assert first == second == renders[0]
+    assert len(renders) == 1
+    assert cache.disk_usage() == len(b'derivative')
+
+def test_cache_key_changes_with_the_source_file(photo):
+    filename = photo('keyed/a.jpg')
+    path = os.path.join(DATA_DIR, filename)
+    cache = DerivativeCache('unused', 0)
+    key = cache.key_for(filename, os.stat(path), 640, 'JPEG', 82)
+    assert cache.key_for(filename, os.stat(path), 960, 'JPEG', 82) != key
+    photo('keyed/a.jpg', size=(640, 480))
+    assert cache.key_for(filename, os.stat(path), 640, 'JPEG', 82) != key
+
+def test_cache_evicts_the_least_recently_used_files(tmp_path):
+    cache = DerivativeCache(str(tmp_path), 2500)
+    paths = []
+    for index in range(3):
+        key = f'{index:02d}' * 32
+
+        def render(path):
+            with open(path, 'wb') as f:
+                f.write(b'x' * 1000)
+            os.utime(path, (index, index))
+
+        paths.append(cache.get_or_render(key, 'jpg', render))
+    assert [os.path.exists(path) for path in paths] == [False, True, True]
+    assert cache.disk_usage() == 2000
+
+def test_img_serves_a_resized_copy_in_the_accepted_format(client, photo):
+    filename = photo('served/wide.jpg', size=(2000, 1000))
+    response = client.get(f'/img/500/{filename}', headers={'Accept': 'image/webp,*/*'})
+    assert response.status_code == 200
+    assert response.mimetype == 'image/webp'
+    assert 'Accept' in response.vary
+    assert Image.open(io.BytesIO(response.data)).size == (640, 320)
+
+    response = client.get(f'/img/500/{filename}')
+    assert response.mimetype == 'image/jpeg'
+    assert Image.open(io.BytesIO(response.data)).format == 'JPEG'
+
+def test_img_never_upscales(client, photo):
+    filename = photo('served/small.jpg', size=(600, 400))
+    response = client.get(f'/img/1920/{filename}')
+    assert Image.open(io.BytesIO(response.data)).size == (600, 400)
+
+def test_img_of_a_missing_file_is_not_found(client):
+    assert client.get('/img/640/missing/nothing.jpg').status_code == 404
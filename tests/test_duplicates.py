@@ -0,0 +1,121 @@
+import io
+import os
+import random
+import pytest
+from PIL import Image, ImageDraw
+import duplicates
+from admin_tools import DATA_DIR, import_images_from_data
+from duplicates import (
+    DEFAULT_MAX_DISTANCE, HASH_MASK, BKTree, duplicate_groups, find_duplicate, hamming_distance, is_distinctive_hash,
+    perceptual_hash
+)
+from models.portfolio import db, PortfolioImage
+
+def scene(seed, size=(640, 480)):
+    """Photo-like frame of random shapes; the same seed always draws the same scene"""
+    rng = random.Random(seed)
+    img = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        radius = rng.randint(size[0] // 20, size[0] // 4)
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=tuple(rng.randrange(256) for _ in range(3)))
+    return img
+
+@pytest.mark.parametrize('seed', range(5))
+def test_numpy_and_pure_python_hashes_agree(monkeypatch, seed):
+    pytest.importorskip('numpy')
+    vectorized = perceptual_hash(scene(seed))
+    monkeypatch.setattr(duplicates, 'numpy', None)
+    assert perceptual_hash(scene(seed)) == vectorized
+
+def reencoded(img, size, quality):
+    buffer = io.BytesIO()
+    img.resize(size).save(buffer, 'JPEG', quality=quality)
+    buffer.seek(0)
+    return Image.open(buffer)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_resized_copies_hash_close_and_other_scenes_far(seed):
+    value = perceptual_hash(scene(seed))
+    assert -(1 << 63) <= value < 1 << 63
+    assert is_distinctive_hash(value)
+    assert hamming_distance(value, perceptual_hash(reencoded(scene(seed), (320, 240), 60))) <= DEFAULT_MAX_DISTANCE
+    assert hamming_distance(value, perceptual_hash(scene(seed + 100))) > DEFAULT_MAX_DISTANCE * 2
+
+def test_flat_images_never_match():
+    flat = perceptual_hash(Image.new('RGB', (640, 480), (30, 60, 90)))
+    assert not is_distinctive_hash(flat)
+    tree = BKTree()
+    tree.add(flat, 1)
+    assert find_duplicate(tree, flat) is None
+
+@pytest.mark.parametrize('max_distance', [0, 3, 6, 12])
+def test_tree_search_matches_a_linear_scan(max_distance):
+    rng = random.Random(max_distance)
+    base = [rng.getrandbits(64) for _ in range(20)]
+    # Near copies of the base hashes, so small distances have matches to find
+    values = base + [value ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for value in base * 10]
+    tree = BKTree()
+    for key, value in enumerate(values):
+        tree.add(value - (1 << 64) if value >= 1 << 63 else value, key)
+    for query in base + [rng.getrandbits(64) for _ in range(20)]:
+        expected = sorted((hamming_distance(query, value), key) for key, value in enumerate(values)
+                          if hamming_distance(query, value) <= max_distance)
+        assert sorted(tree.search(query, max_distance)) == expected
+
+def test_the_closest_then_oldest_match_wins():
+    value = perceptual_hash(scene(0))
+    tree = BKTree()
+    tree.add(value ^ 0b111, 1)
+    tree.add(value ^ 0b1, 3)
+    tree.add(value ^ 0b10, 2)
+    assert find_duplicate(tree, value) == 2
+    assert find_duplicate(tree, value ^ HASH_MASK) is None
+
+@pytest.fixture
+def scene_files():
+    """Callable saving scene(seed) as a JPEG under DATA_DIR; removed afterwards"""
+    written = []
+
+    def write_scene(relative_path, seed, size=(640, 480), quality=90):
+        path = os.path.join(DATA_DIR, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        scene(seed).resize(size).save(path, 'JPEG', quality=quality)
+        written.append(path)
+
+    yield write_scene
+    for path in written:
+        os.remove(path)
+
+@pytest.mark.parametrize('action', ['flag', 'unpublish'])
+def test_import_marks_copies_of_earlier_images(app, library, scene_files, action):
+    scene_files('dupes/original.jpg', 1)
+    scene_files('dupes/other.jpg', 2)
+    app.config['IMPORT_DUPLICATE_ACTION'], previous = action, app.config['IMPORT_DUPLICATE_ACTION']
+    try:
+        with app.app_context():
+            import_images_from_data()
+            # A smaller re-encode in a later import, and one inside a single batch with its original
+            scene_files('dupes/small-copy.jpg', 1, size=(320, 240), quality=60)
+            scene_files('dupes/new.jpg', 3)
+            scene_files('dupes/resized.jpg', 3, size=(480, 360), quality=70)
+            result = import_images_from_data()
+            assert result['duplicates'] == 2
+
+            images = {image.filename: image for image in PortfolioImage.query.filter(PortfolioImage.filename.like('dupes/%'))}
+            assert images['dupes/small-copy.jpg'].duplicate_of_id == images['dupes/original.jpg'].id
+            # Inside one batch the copy inserted first counts as the original
+            new, resized = images['dupes/new.jpg'], images['dupes/resized.jpg']
+            assert {new.duplicate_of_id, resized.duplicate_of_id} in ({None, new.id}, {None, resized.id})
+            assert images['dupes/other.jpg'].duplicate_of_id is None
+            assert images['dupes/small-copy.jpg'].is_published == (action == 'flag')
+            assert images['dupes/original.jpg'].is_published
+
+            groups = duplicate_groups()
+            assert [[image.filename for image in group] for group in groups] == [
+                ['dupes/original.jpg', 'dupes/small-copy.jpg'],
+                ['dupes/new.jpg', 'dupes/resized.jpg'],
+            ]
+    finally:
+        app.config['IMPORT_DUPLICATE_ACTION'] = previous
@@ -0,0 +1,148 @@
+import json
+from datetime import datetime
+import pytest
+from PIL import Image
+from PIL.TiffImagePlugin import IFDRational
+from admin_tools import backfill_exif_columns, compact_exif_data, import_images_from_data
+from exif_fields import EXIF_COLUMNS, compact_exif, dump_exif, parse_exif_fields, to_number
+from models.portfolio import db, PortfolioImage
+
+# Raw PIL values as read from a camera file
+RAW_EXIF = {
+    'Make': 'FUJIFILM\x00\x00',
+    'Model': 'X-T4 ',
+    'LensModel': 'XF23mmF1.4 R',
+    'DateTime': '2024:05:02 08:00:00',
+    'DateTimeOriginal': '2024:05:01 10:30:00\x00',
+    'FocalLength': IFDRational(230, 10),
+    'FNumber': IFDRational(28, 10),
+    'ExposureTime': IFDRational(1, 250),
+    'PhotographicSensitivity': 400,
+}
+
+@pytest.mark.parametrize('value, number', [
+    (IFDRational(28, 10), 2.8),
+    ((1, 250), 0.004),
+    ('2.8', 2.8),
+    ('28/10', 2.8),
+    ('(28, 10)', 2.8),
+    ((200, 400), 0.5),
+    ([IFDRational(35, 1)], 35.0),
+    (IFDRational(0, 0), None),
+    ((1, 0), None),
+    ('n/a', None),
+    (None, None),
+])
+def test_numbers_parse_from_every_stored_form(value, number):
+    if number is None:
+        assert to_number(value) is None
+    else:
+        assert to_number(value) == pytest.approx(number)
+
+def test_raw_exif_becomes_typed_columns():
+    fields = parse_exif_fields(RAW_EXIF)
+    assert fields == {
+        'camera_make': 'FUJIFILM',
+        'camera_model': 'X-T4',
+        'lens': 'XF23mmF1.4 R',
+        'date_taken': datetime(2024, 5, 1, 10, 30),
+        'focal_length': '23 mm',
+        'aperture': 'f/2.8',
+        'shutter_speed': '1/250 s',
+        'iso': '400',
+        'focal_length_mm': 23.0,
+        'f_number': 2.8,
+        'exposure_time': pytest.approx(0.004),
+        'iso_speed': 400,
+    }
+
+def test_stringified_exif_parses_like_the_raw_values():
+    # Imports before the typed columns stored str(value) of every tag
+    stringified = {tag: str(value) for tag, value in RAW_EXIF.items()}
+    assert parse_exif_fields(stringified) == parse_exif_fields(RAW_EXIF)
+
+def test_missing_and_invalid_values_leave_columns_empty():
+    assert parse_exif_fields(None) == dict.fromkeys(EXIF_COLUMNS)
+    fields = parse_exif_fields({'FNumber': IFDRational(0, 0), 'ExposureTime': '0', 'DateTimeOriginal': '0000:00:00'})
+    assert fields == dict.fromkeys(EXIF_COLUMNS)
+
+def test_dates_fall_back_to_the_digitized_and_file_times():
+    assert parse_exif_fields({'DateTime': '2024:05:02 08:00:00'})['date_taken'] == datetime(2024, 5, 2, 8)
+    assert parse_exif_fields({'DateTimeDigitized': '2024:05:03', 'DateTime': 'garbage'})['date_taken'] == datetime(2024, 5, 3)
+
+def test_import_fills_the_columns(app, library, photo):
+    exif = Image.Exif()
+    exif[0x010F] = 'FUJIFILM'
+    exif[0x0110] = 'X-T4'
+    exif[0x8769] = {0x9003: '2024:05:01 10:30:00', 0x920A: 23.0, 0x829D: 2.8, 0x829A: 0.004, 0x8827: 400}
+    photo('exif/camera.jpg', exif=exif)
+    with app.app_context():
+        assert import_images_from_data()['imported'] == 1
+        image = PortfolioImage.query.filter_by(filename='exif/camera.jpg').one()
+        assert (image.camera_model, image.focal_length_mm, image.f_number, image.iso_speed) == ('X-T4', 23.0, 2.8, 400)
+        assert image.shutter_speed == '1/250 s'
+        assert image.date_taken == datetime(2024, 5, 1, 10, 30)
+
+def test_backfill_parses_stored_exif(app, library):
+    with app.app_context():
+        db.session.add_all([
+            PortfolioImage(filename='exif/old.jpg', category_id=1,
+                           exif_data=json.dumps({tag: str(value) for tag, value in RAW_EXIF.items()})),
+            PortfolioImage(filename='exif/none.jpg', category_id=1, exif_data=None),
+        ])
+        db.session.commit()
+
+        result = backfill_exif_columns(batch_size=1)
+        assert result['success'] and result['updated'] == 1
+        image = PortfolioImage.query.filter_by(filename='exif/old.jpg').one()
+        assert (image.camera_make, image.lens, image.f_number) == ('FUJIFILM', 'XF23mmF1.4 R', 2.8)
+        assert PortfolioImage.query.filter_by(filename='exif/none.jpg').one().camera_model is None
+
+def test_compact_exif_keeps_only_the_whitelist():
+    exif = {**RAW_EXIF, 'MakerNote': b'\x00' * 30000, 'UserComment': b'ASCII\x00\x00\x00hello', 'GPSInfo': {1: 'N'}}
+    compact = compact_exif(exif)
+    assert set(compact) == set(RAW_EXIF)
+    assert compact['Make'] == 'FUJIFILM'
+    assert compact['FNumber'] == 2.8
+    assert compact['PhotographicSensitivity'] == 400 and isinstance(compact['PhotographicSensitivity'], int)
+
+def test_compacting_is_idempotent_and_keeps_the_parsed_columns():
+    stored = dump_exif(RAW_EXIF)
+    assert dump_exif(json.loads(stored)) == stored
+    stringified = {tag: str(value) for tag, value in RAW_EXIF.items()}
+    assert dump_exif(stringified) == stored
+    assert parse_exif_fields(json.loads(stored)) == parse_exif_fields(RAW_EXIF)
+
+def maker_note_exif():
+    exif = Image.Exif()
+    exif[0x0110] = 'X-T4'
+    exif[0x8769] = {0x829D: 2.8, 0x927C: b'M' * 4096}
+    return exif
+
+def test_import_stores_the_compact_form_and_the_file_keeps_the_rest(app, client, library, photo):
+    photo('exif/maker-note.jpg', exif=maker_note_exif())
+    with app.app_context():
+        import_images_from_data()
+        image = PortfolioImage.query.filter_by(filename='exif/maker-note.jpg').one()
+        assert json.loads(image.exif_data) == {'Model': 'X-T4', 'FNumber': 2.8}
+
+    full = client.get(f'/admin/portfolio/{image.id}/exif').get_json()['exif']
+    assert full['MakerNote'] == '<4096 bytes>'
+    raw = client.get(f'/admin/portfolio/{image.id}/exif?raw=1')
+    assert raw.mimetype == 'application/octet-stream'
+    assert raw.data.startswith((b'Exif\x00\x00', b'II', b'MM'))
+
+def test_compact_exif_data_rewrites_old_rows(app, library):
+    old = json.dumps({**{tag: str(value) for tag, value in RAW_EXIF.items()}, 'MakerNote': str(b'M' * 4096)})
+    with app.app_context():
+        db.session.add_all([
+            PortfolioImage(filename='exif/verbose.jpg', category_id=1, exif_data=old),
+            PortfolioImage(filename='exif/compact.jpg', category_id=1, exif_data=dump_exif(RAW_EXIF)),
+        ])
+        db.session.commit()
+
+        result = compact_exif_data(batch_size=1)
+        assert result['success'] and result['updated'] == 1
+        assert result['bytes_after'] < result['bytes_before']
+        for image in PortfolioImage.query.filter(PortfolioImage.filename.like('exif/%')):
+            assert image.exif_data == dump_exif(RAW_EXIF)
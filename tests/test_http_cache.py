@@ -0,0 +1,129 @@
+import os
+import pytest
+from admin_tools import DATA_DIR
+from http_cache import ONE_YEAR
+
+@pytest.fixture
+def original(photo):
+    return photo('http/original.jpg', size=(800, 600))
+
+def test_data_files_carry_validators_and_a_max_age(app, client, original):
+    response = client.get(f'/data/{original}')
+    assert response.status_code == 200
+    assert response.headers['ETag'] and response.last_modified
+    assert response.cache_control.public
+    assert response.cache_control.max_age == app.config['DATA_MAX_AGE']
+
+def test_matching_validators_get_a_304(client, original):
+    response = client.get(f'/data/{original}')
+    etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+
+    not_modified = client.get(f'/data/{original}', headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    assert not_modified.data == b''
+    assert client.get(f'/data/{original}', headers={'If-Modified-Since': last_modified}).status_code == 304
+    assert client.get(f'/data/{original}', headers={'If-None-Match': '"stale"'}).status_code == 200
+
+def test_a_changed_original_gets_a_new_etag(client, photo, original):
+    etag = client.get(f'/data/{original}').headers['ETag']
+    path = os.path.join(DATA_DIR, original)
+    photo(original, size=(400, 300))
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10 ** 9))
+
+    response = client.get(f'/data/{original}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+def test_derivatives_revalidate_by_their_cache_key(client, original):
+    response = client.get(f'/img/640/{original}')
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert len(etag.strip('"')) == 64
+
+    not_modified = client.get(f'/img/640/{original}', headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    assert 'Accept' in not_modified.vary
+
+def test_index_html_is_always_revalidated(client):
+    response = client.get('/')
+    assert response.status_code == 200
+    assert response.cache_control.no_cache
+    assert response.cache_control.max_age is None
+    assert client.get('/', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+def test_client_side_routes_serve_index_html(client):
+    response = client.get('/gallery/landscapes')
+    assert response.status_code == 200
+    assert response.cache_control.no_cache
+    assert response.headers['ETag'] == client.get('/').headers['ETag']
+
+def test_fingerprinted_assets_are_immutable(app, client):
+    asset = sorted(name for name in os.listdir(os.path.join(app.static_folder, 'assets')) if name.endswith('.js'))[0]
+    response = client.get(f'/assets/{asset}')
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == ONE_YEAR
+
+    other = client.get('/favicon.ico')
+    assert not other.cache_control.immutable
+    assert other.cache_control.max_age == app.config['STATIC_MAX_AGE']
+
+def original_bytes(original):
+    with open(os.path.join(DATA_DIR, original), 'rb') as f:
+        return f.read()
+
+def test_a_single_range_gets_a_206(client, original):
+    content = original_bytes(original)
+    response = client.get(f'/data/{original}', headers={'Range': 'bytes=10-109'})
+    assert response.status_code == 206
+    assert response.data == content[10:110]
+    assert response.headers['Content-Range'] == f'bytes 10-109/{len(content)}'
+
+    suffix = client.get(f'/data/{original}', headers={'Range': 'bytes=-20'})
+    assert suffix.data == content[-20:]
+
+def test_several_ranges_get_a_multipart_response(client, original):
+    content = original_bytes(original)
+    response = client.get(f'/data/{original}', headers={'Range': 'bytes=0-9,100-149,-5'})
+    assert response.status_code == 206
+    assert response.mimetype == 'multipart/byteranges'
+    boundary = response.mimetype_params['boundary']
+    assert response.content_length == len(response.data)
+
+    parts = response.data.split(f'--{boundary}'.encode())
+    assert parts[0] == b'' and parts[-1] == b'--\r\n'
+    size = len(content)
+    expected = [(0, 10), (100, 150), (size - 5, size)]
+    for part, (start, stop) in zip(parts[1:-1], expected):
+        headers, body = part.split(b'\r\n\r\n', 1)
+        assert b'Content-Type: image/jpeg' in headers
+        assert f'Content-Range: bytes {start}-{stop - 1}/{size}'.encode() in headers
+        assert body == content[start:stop] + b'\r\n'
+
+def test_unsatisfiable_ranges_get_a_416(client, original):
+    size = len(original_bytes(original))
+    response = client.get(f'/data/{original}', headers={'Range': f'bytes={size}-{size + 10},{size + 20}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{size}'
+
+def test_ranges_yield_to_validators(client, original):
+    etag = client.get(f'/data/{original}').headers['ETag']
+    ranges = 'bytes=0-9,20-29'
+    assert client.get(f'/data/{original}', headers={'Range': ranges, 'If-None-Match': etag}).status_code == 304
+    # A stale If-Range sends the whole file
+    response = client.get(f'/data/{original}', headers={'Range': ranges, 'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert response.data == original_bytes(original)
+    assert client.get(f'/data/{original}', headers={'Range': ranges, 'If-Range': etag}).status_code == 206
+
+@pytest.mark.parametrize('mode, header', [('x-accel', 'X-Accel-Redirect'), ('x-sendfile', 'X-Sendfile')])
+def test_proxy_offload_sends_only_headers(app, client, original, mode, header):
+    app.config['DATA_SENDFILE_MODE'] = mode
+    try:
+        response = client.get(f'/data/{original}')
+        assert response.status_code == 200
+        assert response.data == b''
+        expected = f'/internal-data/{original}' if mode == 'x-accel' else os.path.join(DATA_DIR, original)
+        assert response.headers[header] == expected
+        assert client.get(f'/data/{original}', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    finally:
+        app.config['DATA_SENDFILE_MODE'] = ''
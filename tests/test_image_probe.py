@@ -0,0 +1,56 @@
+import pytest
+from PIL import Image
+from admin_tools import backfill_dimensions, import_images_from_data
+from image_probe import ORIENTATION_TAG, displayed_size, probe_image
+from models.portfolio import db, PortfolioImage
+
+def rotated_exif(orientation):
+    exif = Image.Exif()
+    exif[ORIENTATION_TAG] = orientation
+    exif[0x010F] = 'Canon'
+    return exif
+
+@pytest.mark.parametrize('image_format, extension', [('JPEG', 'jpg'), ('PNG', 'png'), ('WEBP', 'webp'), ('TIFF', 'tif')])
+def test_probe_reads_dimensions_from_headers(tmp_path, image_format, extension):
+    path = tmp_path / f'probe.{extension}'
+    Image.new('RGB', (640, 360), (10, 120, 200)).save(path, image_format)
+    probe = probe_image(str(path))
+    assert (probe['width'], probe['height']) == (640, 360)
+    assert probe['orientation'] == 1
+
+def test_probe_falls_back_to_pil_for_other_formats(tmp_path):
+    path = tmp_path / 'probe.gif'
+    Image.new('P', (33, 21)).save(path, 'GIF')
+    probe = probe_image(str(path))
+    assert (probe['width'], probe['height']) == (33, 21)
+
+@pytest.mark.parametrize('orientation, expected', [(1, (600, 400)), (3, (600, 400)), (5, (400, 600)), (6, (400, 600)), (8, (400, 600))])
+def test_displayed_size_applies_the_exif_orientation(tmp_path, orientation, expected):
+    path = tmp_path / 'rotated.jpg'
+    Image.new('RGB', (600, 400)).save(path, 'JPEG', exif=rotated_exif(orientation))
+    probe = probe_image(str(path))
+    assert probe['orientation'] == orientation
+    assert (probe['width'], probe['height']) == (600, 400)
+    assert displayed_size(probe) == expected
+
+def test_rotated_jpeg_is_imported_as_portrait(app, library, photo):
+    filename = photo('rotated/portrait.jpg', size=(600, 400), exif=rotated_exif(6))
+    with app.app_context():
+        assert import_images_from_data()['imported'] == 1
+        image = PortfolioImage.query.filter_by(filename=filename).one()
+        assert (image.width, image.height) == (400, 600)
+
+def test_backfill_swaps_the_dimensions_of_rotated_rows(app, library, photo):
+    rotated = photo('backfill/rotated.jpg', size=(600, 400), exif=rotated_exif(6))
+    upright = photo('backfill/upright.jpg', size=(600, 400))
+    with app.app_context():
+        # Rows as imported before the orientation was applied
+        for filename in (rotated, upright, 'backfill/missing.jpg'):
+            db.session.add(PortfolioImage(filename=filename, width=600, height=400, category_id=1))
+        db.session.commit()
+
+        result = backfill_dimensions()
+
+        assert result == {'success': True, 'processed': 3, 'updated': 1, 'failed': 1}
+        sizes = {image.filename: (image.width, image.height) for image in PortfolioImage.query}
+        assert sizes == {rotated: (400, 600), upright: (600, 400), 'backfill/missing.jpg': (600, 400)}
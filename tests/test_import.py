@@ -0,0 +1,14 @@
+from admin_tools import delete_image, import_images_from_data
+from models.portfolio import db, FileManifestEntry, PortfolioImage
+
+def test_deleted_image_is_imported_again_by_the_next_incremental_scan(app, library, photo):
+    filename = photo('rescan/kept-on-disk.jpg')
+    with app.app_context():
+        assert import_images_from_data()['imported'] == 1
+        image = PortfolioImage.query.filter_by(filename=filename).one()
+
+        assert delete_image(image.id)['success']
+        assert FileManifestEntry.query.filter_by(path=filename).count() == 0
+
+        assert import_images_from_data()['imported'] == 1
+        assert PortfolioImage.query.filter_by(filename=filename).count() == 1
@@ -0,0 +1,50 @@
+import threading
+from datetime import datetime
+import pytest
+from import_jobs import STALE_JOB_AFTER, claim_import_job
+from models.portfolio import db, ImportJob
+
+@pytest.fixture
+def jobs(app):
+    with app.app_context():
+        yield
+        ImportJob.query.delete()
+        db.session.commit()
+
+def test_only_one_concurrent_claim_gets_a_job(app, jobs):
+    barrier = threading.Barrier(8)
+    claimed = []
+
+    def claim():
+        with app.app_context():
+            barrier.wait()
+            job = claim_import_job()
+            if job is not None:
+                claimed.append(job.id)
+
+    threads = [threading.Thread(target=claim) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(claimed) == 1
+    assert [job.id for job in ImportJob.query.filter_by(status='running')] == claimed
+
+def test_claim_takes_over_a_stale_job(app, jobs):
+    stale = claim_import_job()
+    stale_id = stale.id
+    ImportJob.query.filter_by(id=stale_id).update(
+        {ImportJob.updated_at: datetime.utcnow() - STALE_JOB_AFTER * 2}, synchronize_session=False
+    )
+    db.session.commit()
+
+    job = claim_import_job()
+
+    assert job is not None
+    assert db.session.get(ImportJob, stale_id).status == 'failed'
+    assert ImportJob.query.filter_by(status='running').count() == 1
+
+def test_claim_refuses_while_a_job_is_running(app, jobs):
+    assert claim_import_job() is not None
+    assert claim_import_job() is None
@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+import pytest
+from models.portfolio import db, PortfolioImage
+from pagination import FEED_ORDER, decode_cursor, encode_cursor, keyset_page
+
+@pytest.fixture
+def mixed_feed(app, library):
+    """Images with and without display_order and created_at, sharing both values in places"""
+    library(24)
+    with app.app_context():
+        for position, image in enumerate(PortfolioImage.query.order_by(PortfolioImage.id)):
+            image.display_order = (None, 0, 0, 3)[position % 4]
+            image.created_at = None if position % 3 == 0 else datetime(2026, 1, 1) + timedelta(days=position % 5)
+        db.session.commit()
+        yield
+
+def walk_feed(page_size):
+    ids, cursor = [], None
+    while True:
+        images, cursor = keyset_page([PortfolioImage.is_published == True], cursor, page_size)
+        ids.extend(image.id for image in images)
+        if cursor is None:
+            return ids
+
+@pytest.mark.parametrize('page_size', [1, 2, 5, 7])
+def test_cursor_pages_match_the_feed_order(mixed_feed, page_size):
+    expected = [image.id for image in PortfolioImage.query.order_by(*FEED_ORDER)]
+    assert walk_feed(page_size) == expected
+
+def test_cursor_keeps_a_missing_display_order(mixed_feed):
+    image = PortfolioImage.query.filter(PortfolioImage.display_order.is_(None)).first()
+    assert decode_cursor(encode_cursor(image)) == (None, image.created_at, image.id)
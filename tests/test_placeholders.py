@@ -0,0 +1,32 @@
+import random
+import pytest
+from PIL import Image, ImageDraw
+import placeholders
+from placeholders import blurhash, blurhash_factors, image_placeholders, preview_image
+
+def preview(seed, size=(640, 480)):
+    rng = random.Random(seed)
+    img = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(8):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.rectangle((x, y, x + size[0] // 4, y + size[1] // 4), fill=tuple(rng.randrange(256) for _ in range(3)))
+    return preview_image(img)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_numpy_and_pure_python_blurhash_agree(monkeypatch, seed):
+    pytest.importorskip('numpy')
+    vectorized = [channel for factor in blurhash_factors(preview(seed), 4, 3) for channel in factor]
+    expected = blurhash(preview(seed))
+    monkeypatch.setattr(placeholders, 'numpy', None)
+    pure = [channel for factor in blurhash_factors(preview(seed), 4, 3) for channel in factor]
+    assert pure == pytest.approx(vectorized, abs=1e-9)
+    assert blurhash(preview(seed)) == expected
+
+def test_placeholders_follow_the_image_orientation():
+    landscape = image_placeholders(Image.new('RGB', (300, 200), (200, 40, 40)))
+    portrait = image_placeholders(Image.new('RGB', (200, 300), (200, 40, 40)))
+    # The first character encodes the component grid: 4x3 for landscape, 3x4 for portrait
+    assert landscape['blurhash'][0] != portrait['blurhash'][0]
+    assert len(landscape['blurhash']) == len(portrait['blurhash']) == 28
+    assert landscape['dominant_color'] == '#c82828'
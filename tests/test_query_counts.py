@@ -0,0 +1,38 @@
+import pytest
+from sql_counter import assert_max_queries, count_queries
+
+# SQL statements each public endpoint may run, however large the library is
+QUERY_BUDGETS = {
+    '/api/categories': 2,            # categories, image counts grouped by category
+    '/api/portfolio': 2,             # total count, page of images joined with their category
+    '/api/portfolio?cursor=': 1,     # keyset page joined with categories, no count
+    '/api/featured-image': 1,        # featured image joined with its image and category
+}
+
+def get_ok(client, url):
+    response = client.get(url)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response
+
+@pytest.mark.parametrize('url, budget', QUERY_BUDGETS.items())
+def test_endpoint_statement_budget(client, reader, library, url, budget):
+    library(30)
+    with assert_max_queries(reader, budget):
+        get_ok(client, url)
+
+@pytest.mark.parametrize('url', QUERY_BUDGETS)
+def test_statement_count_does_not_grow_with_library(client, reader, library, url):
+    library(5)
+    with count_queries(reader) as small:
+        get_ok(client, url)
+    library(60)
+    with count_queries(reader) as large:
+        get_ok(client, url)
+    assert large.count == small.count, large.statements
+
+@pytest.mark.parametrize('url', QUERY_BUDGETS)
+def test_read_endpoints_never_use_the_writer(client, writer, library, url):
+    library(10)
+    with count_queries(writer) as counter:
+        get_ok(client, url)
+    assert counter.count == 0, counter.statements
@@ -0,0 +1,24 @@
+from sqlalchemy import inspect, text
+from models.portfolio import db, FeaturedImage, PortfolioImage, upgrade_schema
+
+def test_upgrade_merges_duplicate_filenames_before_the_unique_index(app, library):
+    # library is only requested to delete the images afterwards
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(text('DROP INDEX ix_portfolio_images_filename'))
+        images = [PortfolioImage(filename=name, category_id=1) for name in ('a.jpg', 'a.jpg', 'a.jpg', 'b.jpg')]
+        db.session.add_all(images)
+        db.session.flush()
+        first, second, third, other = (image.id for image in images)
+        images[3].duplicate_of_id = second
+        db.session.add(FeaturedImage(portfolio_image_id=third, is_active=True))
+        db.session.commit()
+
+        upgrade_schema()
+        db.session.expire_all()
+
+        assert [image.id for image in PortfolioImage.query.order_by(PortfolioImage.id)] == [first, other]
+        assert db.session.get(PortfolioImage, other).duplicate_of_id == first
+        assert [featured.portfolio_image_id for featured in FeaturedImage.query] == [first]
+        index_names = {index['name'] for index in inspect(db.engine).get_indexes('portfolio_images')}
+        assert 'ix_portfolio_images_filename' in index_names
@@ -0,0 +1,120 @@
+from datetime import datetime
+import pytest
+from PIL import Image
+from sqlalchemy import text
+from admin_tools import import_images_from_data
+from models.portfolio import db, PortfolioImage, SearchFacetCount
+from search import CHANGES_FACET, deferred_facet_counts, rebuild_search_index
+
+FACET_TRIGGERS = {'facet_counts_insert', 'facet_counts_delete', 'facet_counts_update_old', 'facet_counts_update_new'}
+
+def facet_triggers(connection=None):
+    query = text("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+    return set((connection or db.session).execute(query).scalars()) & FACET_TRIGGERS
+
+def stored_counts():
+    """Every non-zero facet count, without the change counter"""
+    return {
+        (row.facet, row.value, row.by_facet, row.by_value): row.count
+        for row in SearchFacetCount.query.filter(SearchFacetCount.facet != CHANGES_FACET, SearchFacetCount.count != 0)
+    }
+
+def assert_counts_match_a_rebuild(app):
+    maintained = stored_counts()
+    rebuild_search_index(app.config.get('SEARCH_FTS_ENABLED', True))
+    assert maintained == stored_counts()
+
+def camera_exif(model, focal_length):
+    exif = Image.Exif()
+    exif[0x0110] = model
+    exif[0x0132] = '2024:05:01 10:00:00'
+    exif[0x8769] = {0x920A: focal_length, 0xA434: f'{model} lens'}
+    return exif
+
+@pytest.fixture
+def images(app, library):
+    with app.app_context():
+        rows = [
+            PortfolioImage(filename=f'search/{index}.jpg', title=title, description=description, category_id=1 + index % 2,
+                           camera_model=camera, lens='50mm', focal_length_mm=focal, width=width, height=height,
+                           date_taken=datetime(2020 + index % 3, 6, 1), is_published=True)
+            for index, (title, description, camera, focal, width, height) in enumerate([
+                ('Harbour at dawn', 'Fishing boats', 'X-T4', 23.0, 600, 400),
+                ('Harbour lights', 'Night scene', 'X-T4', 56.0, 400, 600),
+                ('Mountain lake', 'Still water at dawn', 'EOS R5', 85.0, 600, 600),
+                ('Forest path', None, 'EOS R5', 200.0, 600, 400),
+            ])
+        ]
+        db.session.add_all(rows)
+        db.session.commit()
+        yield [row.id for row in rows]
+
+def test_counts_follow_inserts(app, images):
+    with app.app_context():
+        counts = stored_counts()
+        assert counts['_total', 'published', '', ''] == 4
+        assert counts['camera', 'X-T4', '', ''] == 2
+        assert counts['orientation', 'portrait', 'camera', 'X-T4'] == 1
+        assert_counts_match_a_rebuild(app)
+
+def test_counts_follow_updates_and_unpublishing(app, images):
+    with app.app_context():
+        image = db.session.get(PortfolioImage, images[0])
+        image.camera_model = 'EOS R5'
+        image.width, image.height = 400, 600
+        db.session.get(PortfolioImage, images[1]).is_published = False
+        db.session.commit()
+        counts = stored_counts()
+        assert counts['camera', 'EOS R5', '', ''] == 3
+        assert ('camera', 'X-T4', '', '') not in counts
+        assert counts['_total', 'published', '', ''] == 3
+        assert_counts_match_a_rebuild(app)
+
+def test_counts_follow_deletes(app, images):
+    with app.app_context():
+        db.session.delete(db.session.get(PortfolioImage, images[2]))
+        db.session.commit()
+        assert stored_counts()['_total', 'published', '', ''] == 3
+        assert_counts_match_a_rebuild(app)
+
+def test_import_batches_keep_the_counts_exact(app, library, photo):
+    for index, (model, focal) in enumerate([('X-T4', 23.0), ('X-T4', 35.0), ('EOS R5', 85.0)]):
+        photo(f'facets/{index}.jpg', size=(600, 400), color=(index * 60, 80, 120), exif=camera_exif(model, focal))
+    with app.app_context():
+        app.config['IMPORT_BATCH_SIZE'], batch_size = 2, app.config.get('IMPORT_BATCH_SIZE')
+        try:
+            assert import_images_from_data()['imported'] == 3
+            assert stored_counts()['camera', 'X-T4', '', ''] == 2
+            assert_counts_match_a_rebuild(app)
+
+            # A changed file moves its image to another camera and orientation
+            photo('facets/0.jpg', size=(400, 600), color=(0, 80, 120), exif=camera_exif('EOS R5', 23.0))
+            assert import_images_from_data()['updated'] == 1
+            counts = stored_counts()
+            assert counts['camera', 'X-T4', '', ''] == 1
+            assert counts['orientation', 'portrait', 'camera', 'EOS R5'] == 1
+            assert_counts_match_a_rebuild(app)
+            assert facet_triggers() == FACET_TRIGGERS
+        finally:
+            app.config['IMPORT_BATCH_SIZE'] = batch_size
+
+def test_a_rollback_restores_the_deferred_triggers(app, images):
+    with app.app_context():
+        with deferred_facet_counts():
+            assert facet_triggers() == set()
+            with db.engine.connect() as other:
+                assert facet_triggers(other) == FACET_TRIGGERS
+        db.session.rollback()
+        assert facet_triggers() == FACET_TRIGGERS
+
+def test_search_filters_and_counts_facets(client, images):
+    data = client.get('/api/search?q=harb&camera=X-T4').get_json()
+    assert data['total'] == 2
+    assert {image['title'] for image in data['images']} == {'Harbour at dawn', 'Harbour lights'}
+    orientations = {entry['value']: entry['count'] for entry in data['facets']['orientation']}
+    assert orientations == {'landscape': 1, 'portrait': 1}
+
+    data = client.get('/api/search?orientation=landscape&year=2020').get_json()
+    assert {image['title'] for image in data['images']} == {'Harbour at dawn', 'Forest path'}
+    cameras = {entry['value']: entry['count'] for entry in data['facets']['camera']}
+    assert cameras == {'X-T4': 1, 'EOS R5': 1}